@@ -0,0 +1,141 @@
+import hashlib
+import pickle
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import MinMaxScaler
+
+# =========================
+# Registro de modelos de anomalia (IsolationForest)
+# =========================
+# Um modelo por (tabela, energy_var, climate_var, granularidade[, subsistema]), treinado
+# uma vez e salvo em disco junto com o scaler e os scores já calculados. Em cada leitura:
+#   - janela de treino intacta: só as linhas novas (depois do último instante pontuado)
+#     passam pelo modelo;
+#   - janela de treino alterada (dados reprocessados, início diferente): retreina.
+# Mapa e abas do dashboard leem os mesmos scores.
+
+CONTAMINATION = 0.01
+RANDOM_STATE = 42
+# Percentil do score de treino acima do qual a anomalia é "forte" (usado no mapa)
+STRONG_PERCENTILE = 95
+MIN_ROWS = 10
+
+FEATURES = ["energy", "climate", "derived"]
+SCORE_COLUMNS = ["energy", "climate", "derived", "energy_norm", "climate_norm", "derived_norm",
+                 "score", "decision", "anomaly", "strong"]
+
+def store_path_for(db_path) -> Path:
+    """Pasta dos modelos ao lado do banco da ONS (ex.: ons.anomaly_models/)."""
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.stem}.anomaly_models")
+
+def window_fingerprint(frame: pd.DataFrame) -> str:
+    """Hash do índice + valores das linhas: muda se qualquer linha do treino mudar."""
+    return hashlib.sha256(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes()).hexdigest()
+
+def pair_frame(energy: pd.Series, climate: pd.Series) -> pd.DataFrame:
+    """Energia, clima e a feature derivada (energia - clima) alinhados, sem faltantes."""
+    frame = pd.DataFrame({"energy": energy, "climate": climate})
+    frame["derived"] = frame["energy"] - frame["climate"]
+    return frame.dropna().sort_index()
+
+class AnomalyModel:
+    """Scaler + IsolationForest de um par, com a janela de treino e os scores já calculados."""
+
+    def __init__(self, frame: pd.DataFrame):
+        self.train_start = frame.index[0]
+        self.train_end = frame.index[-1]
+        self.fingerprint = window_fingerprint(frame)
+        self.scaler = MinMaxScaler().fit(frame[FEATURES].to_numpy())
+        X = self._model_input(self._normalize(frame))
+        self.model = IsolationForest(contamination=CONTAMINATION, random_state=RANDOM_STATE).fit(X)
+        train_scores = -self.model.score_samples(X)
+        self.threshold = np.percentile(train_scores, STRONG_PERCENTILE)
+        self.scores = self.score(frame)
+
+    def _normalize(self, frame):
+        return self.scaler.transform(frame[FEATURES].to_numpy())
+
+    @staticmethod
+    def _model_input(norm):
+        # Mesmas features do dashboard: energia e derivada normalizadas
+        return norm[:, [0, 2]]
+
+    def score(self, frame: pd.DataFrame) -> pd.DataFrame:
+        norm = self._normalize(frame)
+        X = self._model_input(norm)
+        out = frame[FEATURES].copy()
+        out[["energy_norm", "climate_norm", "derived_norm"]] = norm
+        out["score"] = -self.model.score_samples(X)
+        out["decision"] = self.model.decision_function(X)
+        out["anomaly"] = self.model.predict(X) == -1
+        out["strong"] = out["score"] >= self.threshold
+        return out[SCORE_COLUMNS]
+
+    def is_valid_for(self, frame: pd.DataFrame) -> bool:
+        """A janela de treino ainda é a mesma (mesmo início e mesmas linhas até train_end)?"""
+        if frame.empty or frame.index[0] != self.train_start:
+            return False
+        return window_fingerprint(frame[frame.index <= self.train_end]) == self.fingerprint
+
+    def update(self, frame: pd.DataFrame) -> int:
+        """Pontua só as linhas depois do último instante já pontuado. Retorna quantas."""
+        new = frame[frame.index > self.scores.index[-1]]
+        if not new.empty:
+            self.scores = pd.concat([self.scores, self.score(new)])
+        return len(new)
+
+class AnomalyStore:
+    """Modelos por par persistidos em pickle, um arquivo por chave."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def _path(self, key) -> Path:
+        name = hashlib.sha256(repr(key).encode()).hexdigest()[:16]
+        return self.root / f"{name}.pkl"
+
+    def _load(self, key):
+        if key in self._models:
+            return self._models[key]
+        path = self._path(key)
+        if path.exists():
+            try:
+                with open(path, "rb") as f:
+                    stored_key, model = pickle.load(f)
+                if stored_key == key:
+                    return model
+            except Exception as e:
+                print(f"Modelo de anomalia inválido em {path}: {e}")
+        return None
+
+    def _save(self, key, model):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self._path(key).with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump((key, model), f)
+        tmp.replace(self._path(key))
+        self._models[key] = model
+
+    def scores(self, key, energy: pd.Series, climate: pd.Series):
+        """Scores do par `key` para as séries dadas (DataFrame SCORE_COLUMNS), ou None se
+        houver menos de MIN_ROWS linhas. Treina só na primeira vez ou se o treino mudou."""
+        frame = pair_frame(energy, climate)
+        if len(frame) < MIN_ROWS:
+            return None
+        with self._lock:
+            model = self._load(key)
+            if model is None or not model.is_valid_for(frame):
+                model = AnomalyModel(frame)
+                self._save(key, model)
+            elif model.update(frame):
+                self._save(key, model)
+            else:
+                self._models[key] = model
+        return model.scores.loc[model.scores.index.isin(frame.index)]
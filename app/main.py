@@ -1,38 +1,234 @@
-from fastapi import FastAPI
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 import requests
 import pandas as pd
 from io import BytesIO
+from pathlib import Path
+from docling.datamodel.base_models import DocumentStream, InputFormat
 from docling.document_converter import DocumentConverter
 import re
 
-app = FastAPI()
+# Módulos do projeto (data_dictionary, util) ficam na raiz do repositório
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
 
-class PDFRequest(BaseModel):
-    url: str
+from data_dictionary import DictionaryService
 
-class DatasetDictRequest(BaseModel):
-    dataset_name: str
+# =========================
+# Conversão de PDFs (dicionários de dados da ONS) em tabelas
+# =========================
+# - Um download por requisição, feito fora do event loop; os bytes vão direto para o
+#   docling (DocumentStream), sem o docling baixar a URL de novo.
+# - Pool de DocumentConverter já carregados na subida do app: cada conversão pega um
+#   conversor livre, então requisições simultâneas não recarregam modelos.
+# - Cache em disco das tabelas por sha256 do PDF: o mesmo dicionário volta do cache.
+#   Para URLs já vistas, o download é condicional (ETag/Last-Modified): com 304 nem o
+#   corpo do PDF é baixado.
 
-@app.post("/process-pdf/")
-async def process_pdf(request: PDFRequest):
-    response = requests.get(request.url)
-    pdf_bytes = response.content
+CONVERTER_WORKERS = int(os.environ.get("CONVERTER_WORKERS", 2))
+PDF_CACHE_DIR = Path(os.environ.get("PDF_CACHE_DIR", Path(__file__).parent / "pdf_cache"))
+DOWNLOAD_TIMEOUT = 60
+ONS_DB_PATH = Path(os.environ.get("ONS_DB_PATH", ROOT / "ons.duckdb"))
+
+TABLE_PATTERN = r"\|([^|]+)\|([^|]+)\|([^|]+)\|([^|]+)\|([^|]+)\|([^|]+)\|([^|]+)\|"
+
+class ConverterPool:
+    """Conversores docling pré-carregados; cada um atende uma conversão por vez."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._free = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="docling")
+
+    def warm(self):
+        # O docling só monta o pipeline (e carrega os modelos) no primeiro convert();
+        # initialize_pipeline antecipa isso para a subida do app, uma vez por conversor
+        for _ in range(self.size):
+            converter = DocumentConverter()
+            converter.initialize_pipeline(InputFormat.PDF)
+            self._free.put(converter)
+
+    def _convert(self, pdf_bytes: bytes, name: str) -> str:
+        converter = self._free.get()
+        try:
+            source = DocumentStream(name=name, stream=BytesIO(pdf_bytes))
+            return converter.convert(source).document.export_to_markdown()
+        finally:
+            self._free.put(converter)
+
+    async def to_markdown(self, pdf_bytes: bytes, name: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._convert, pdf_bytes, name)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class TableCache:
+    """Tabelas extraídas por sha256 do PDF (um JSON por hash) + validadores HTTP por URL."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._tables = {}
+        self._urls_path = self.root / "urls.json"
+        self.urls = json.loads(self._urls_path.read_text()) if self._urls_path.exists() else {}
+
+    def _path(self, digest: str) -> Path:
+        return self.root / f"{digest}.json"
+
+    @staticmethod
+    def _write(path: Path, payload):
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(payload, ensure_ascii=False))
+        tmp.replace(path)
 
-    converter = DocumentConverter()
-    doc = converter.convert(request.url).document
-    markdown = doc.export_to_markdown()
+    def get(self, digest: str):
+        if digest in self._tables:
+            return self._tables[digest]
+        path = self._path(digest)
+        if path.exists():
+            records = json.loads(path.read_text())
+            self._tables[digest] = records
+            return records
+        return None
 
-    pattern = r"\|([^|]+)\|([^|]+)\|([^|]+)\|([^|]+)\|([^|]+)\|([^|]+)\|([^|]+)\|"
-    matches = re.findall(pattern, markdown)
+    def put(self, digest: str, records):
+        with self._lock:
+            self._write(self._path(digest), records)
+            self._tables[digest] = records
+
+    def remember_url(self, url: str, digest: str, headers):
+        with self._lock:
+            self.urls[url] = {
+                "sha256": digest,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+            }
+            self._write(self._urls_path, self.urls)
+
+def download_pdf(session: requests.Session, url: str, known=None):
+    """Baixa o PDF. Com `known` (validadores da última vez), retorna (None, headers) se não mudou."""
+    headers = {}
+    if known:
+        if known.get("etag"):
+            headers["If-None-Match"] = known["etag"]
+        if known.get("last_modified"):
+            headers["If-Modified-Since"] = known["last_modified"]
+    response = session.get(url, headers=headers, timeout=DOWNLOAD_TIMEOUT)
+    if response.status_code == 304:
+        return None, response.headers
+    response.raise_for_status()
+    return response.content, response.headers
+
+def markdown_to_records(markdown: str):
+    """Tabela de 7 colunas do markdown do docling em registros (primeira linha = cabeçalho)."""
+    matches = re.findall(TABLE_PATTERN, markdown)
+    if not matches:
+        return []
 
     header = [col.strip() for col in matches[0]]
     data = [tuple(col.strip() for col in row) for row in matches[1:]]
+    # Linha separadora do markdown (|---|---|...) não é dado
+    data = [row for row in data if not all(re.fullmatch(r":?-+:?", col) for col in row)]
 
     df = pd.DataFrame(data, columns=header)
 
     return df.to_dict(orient="records")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.converters = ConverterPool(CONVERTER_WORKERS)
+    await asyncio.to_thread(app.state.converters.warm)
+    app.state.tables = TableCache(PDF_CACHE_DIR)
+    app.state.session = requests.Session()
+    # Conversões em andamento por hash: PDFs iguais simultâneos são convertidos uma vez
+    app.state.pending = {}
+    # Dicionário de variáveis (tabela metadata) em memória, remontado se o banco mudar
+    app.state.dictionary = DictionaryService(ONS_DB_PATH)
+    await asyncio.to_thread(app.state.dictionary.refresh)
+    yield
+    app.state.converters.shutdown()
+    app.state.session.close()
+
+app = FastAPI(lifespan=lifespan)
+
+class PDFRequest(BaseModel):
+    url: str
+
+class DatasetDictRequest(BaseModel):
+    dataset_name: str
+
+async def parse_tables(digest: str, pdf_bytes: bytes, name: str):
+    """Converte o PDF uma única vez por hash, mesmo com requisições simultâneas."""
+    pending = app.state.pending
+    task = pending.get(digest)
+    if task is None:
+        async def convert():
+            try:
+                markdown = await app.state.converters.to_markdown(pdf_bytes, name)
+                records = markdown_to_records(markdown)
+                await asyncio.to_thread(app.state.tables.put, digest, records)
+                return records
+            finally:
+                pending.pop(digest, None)
+        task = pending[digest] = asyncio.ensure_future(convert())
+    return await asyncio.shield(task)
+
+async def fetch_pdf(url: str, known=None):
+    """(sha256, bytes) do PDF em `url`; bytes é None quando o servidor responde 304."""
+    try:
+        pdf_bytes, headers = await asyncio.to_thread(download_pdf, app.state.session, url, known)
+    except requests.RequestException as e:
+        raise HTTPException(status_code=502, detail=f"Falha ao baixar {url}: {e}")
+    if pdf_bytes is None:
+        return known["sha256"], None
+    digest = hashlib.sha256(pdf_bytes).hexdigest()
+    app.state.tables.remember_url(url, digest, headers)
+    return digest, pdf_bytes
+
+@app.post("/process-pdf/")
+async def process_pdf(request: PDFRequest):
+    tables = app.state.tables
+    digest, pdf_bytes = await fetch_pdf(request.url, tables.urls.get(request.url))
+    records = tables.get(digest)
+    if records is None:
+        if pdf_bytes is None:
+            # Validadores conhecidos, mas a tabela saiu do cache: baixa sem condicional
+            digest, pdf_bytes = await fetch_pdf(request.url)
+            records = tables.get(digest)
+        if records is None:
+            name = Path(request.url.split("?")[0]).name or f"{digest}.pdf"
+            records = await parse_tables(digest, pdf_bytes, name)
+    if not records:
+        raise HTTPException(status_code=422, detail="Nenhuma tabela encontrada no PDF.")
+    return records
+
+async def dictionary_index():
+    """Índice atual; só vai ao banco (em thread) quando o arquivo mudou desde a última carga."""
+    service = app.state.dictionary
+    if service.is_current():
+        return service.index
+    return await asyncio.to_thread(service.refresh)
+
 @app.post("/fetch-dict/")
 async def fetch_dict(request: DatasetDictRequest):
-    ...
\ No newline at end of file
+    index = await dictionary_index()
+    dataset = index.resolve_dataset(request.dataset_name)
+    if dataset is None:
+        raise HTTPException(status_code=404, detail=f"Dicionário não encontrado para '{request.dataset_name}'.")
+    return {
+        "dataset": dataset,
+        "variaveis": [{"variavel": variable, "descricao": description}
+                      for variable, description in index.datasets[dataset].items()],
+    }
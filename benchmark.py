@@ -0,0 +1,375 @@
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+
+import feed_db3
+import synthetic_data
+from anomaly_store import AnomalyModel, pair_frame
+from compact_schema import frame_memory_mb
+from feed_ons import ingest_parquet, refresh_energy_rollups
+from insight_engine import lag_correlations
+from interpreter_util import prepare_aggregated_anomaly_summary_v3, build_prompts
+from manifest import ensure_manifest
+from online_anomaly import OnlineDetector
+from spatial_index import StationIndex
+from subsystems import UF_SUBSISTEMA
+from util import compute_scores, compute_scores_by_subsystem, compute_distance_matrix, load_table_duckdb
+
+# =========================
+# Benchmark dos caminhos críticos com dados sintéticos
+# =========================
+# Uso: python benchmark.py --scale small [--only ingest_ons compute_scores] [--compare antigo.json]
+# Os dados vêm de synthetic_data (determinísticos pela seed), num diretório temporário;
+# nada lê os caminhos reais da ONS/INMET. O resultado (tempos + commit + escala) vai
+# para um JSON, para comparar o mesmo cenário entre commits.
+
+# days: horas de série = days * 24; stations: estações INMET; usinas: pontos do mapa
+SCALES = {
+    "small": {"days": 60, "stations": 8, "usinas": 500},
+    "medium": {"days": 365, "stations": 40, "usinas": 5_000},
+    "large": {"days": 730, "stations": 150, "usinas": 20_000},
+}
+
+RESULTS_DIR = Path("benchmark_results")
+
+# Colunas de clima gravadas pelo feed_db3 (as mesmas que o dashboard correlaciona)
+CLIMATE_COLS = ["precipitacao", "pressao", "umidade", "vento", "temperatura_max", "temperatura_min"]
+ENERGY_COL = "val_cargaenergiahomwmed"
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    """Registra `fn(ws)` -> (função medida, infos). O preparo fica fora da medição."""
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+class Workspace:
+    """Diretório temporário + dados sintéticos de uma escala, gerados uma vez e reaproveitados."""
+
+    def __init__(self, root, days, stations, usinas, seed=0, workers=None):
+        self.root = Path(root)
+        self.hours = days * 24
+        self.n_stations = stations
+        self.n_usinas = usinas
+        self.seed = seed
+        self.workers = workers
+        self._cache = {}
+        self._runs = 0
+
+    def cached(self, name, build):
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
+    def run_dir(self) -> Path:
+        """Pasta nova a cada repetição (ingestões sempre partem de um banco vazio)."""
+        self._runs += 1
+        path = self.root / "runs" / str(self._runs)
+        path.mkdir(parents=True)
+        return path
+
+    @property
+    def index(self):
+        return self.cached("index", lambda: synthetic_data.hourly_index(self.hours))
+
+    @property
+    def stations(self):
+        return self.cached("stations", lambda: synthetic_data.stations(self.n_stations, self.seed))
+
+    @property
+    def energy(self):
+        """Curva de carga horária por subsistema, com din_instante já convertido."""
+        def build():
+            df = synthetic_data.ons_curva_carga(self.hours, seed=self.seed)
+            df["din_instante"] = pd.to_datetime(df["din_instante"])
+            return df
+        return self.cached("energy", build)
+
+    @property
+    def climate(self):
+        """Leituras horárias de todas as estações (formato da tabela clima + subsistema)."""
+        def build():
+            frames = []
+            for i, row in enumerate(self.stations.to_dict("records")):
+                df = synthetic_data.climate_frame(self.index, row["latitude"], [self.seed, 3, i])[CLIMATE_COLS]
+                df = df.rename_axis("data_hora").reset_index()
+                df["data_hora"] = df["data_hora"].dt.tz_localize("UTC")
+                df["arquivo"] = row["codigo_wmo"]
+                df["id_subsistema"] = UF_SUBSISTEMA[row["uf"]]
+                frames.append(df)
+            return pd.concat(frames, ignore_index=True)
+        return self.cached("climate", build)
+
+    @property
+    def hourly_pairs(self):
+        """Energia por subsistema (colunas) x clima médio das estações, por hora."""
+        def build():
+            energy = self.energy.pivot_table(index="din_instante", columns="id_subsistema", values=ENERGY_COL)
+            climate = self.climate.groupby(self.climate["data_hora"].dt.tz_localize(None))[CLIMATE_COLS].mean()
+            return energy.join(climate, how="inner")
+        return self.cached("hourly_pairs", build)
+
+# =========================
+# Ingestão
+# =========================
+@benchmark("ingest_ons")
+def bench_ingest_ons(ws):
+    source = ws.root / "ONS-Base"
+    paths = ws.cached("ons_parquet", lambda: synthetic_data.write_ons_parquet(source, ws.hours, seed=ws.seed))
+
+    def run():
+        con = duckdb.connect(str(ws.run_dir() / "ons.duckdb"))
+        try:
+            ensure_manifest(con)
+            tables = [p.stem.lower() for p in paths if ingest_parquet(p, con)]
+            refresh_energy_rollups(con, tables, tables)
+        finally:
+            con.close()
+
+    rows = sum(len(pd.read_parquet(p, columns=["din_instante"])) for p in paths)
+    return run, {"files": len(paths), "rows": rows}
+
+@contextlib.contextmanager
+def climate_paths(root: Path, db_path: Path):
+    """Aponta o feed_db3 para a pasta/banco do benchmark enquanto o bloco roda."""
+    old = feed_db3.CLIMATE_ROOT, feed_db3.DB_PATH
+    feed_db3.CLIMATE_ROOT, feed_db3.DB_PATH = root, db_path
+    try:
+        yield
+    finally:
+        feed_db3.CLIMATE_ROOT, feed_db3.DB_PATH = old
+
+@benchmark("ingest_inmet")
+def bench_ingest_inmet(ws):
+    source = ws.root / "Climate"
+    _, years = ws.cached("inmet_csv", lambda: synthetic_data.write_inmet_csvs(
+        source, ws.n_stations, ws.hours, seed=ws.seed))
+
+    def run():
+        with climate_paths(source, ws.run_dir() / "climate.duckdb"):
+            feed_db3.process_years(years, workers=ws.workers)
+
+    return run, {"files": ws.n_stations * len(years), "rows": ws.n_stations * ws.hours}
+
+@benchmark("load_climate")
+def bench_load_climate(ws):
+    source = ws.root / "Climate"
+    _, years = ws.cached("inmet_csv", lambda: synthetic_data.write_inmet_csvs(
+        source, ws.n_stations, ws.hours, seed=ws.seed))
+
+    def ingest():
+        db_path = ws.root / "climate_load.duckdb"
+        with climate_paths(source, db_path), contextlib.redirect_stdout(io.StringIO()):
+            feed_db3.process_years(years, workers=ws.workers)
+        return db_path
+
+    db_path = ws.cached("climate_db", ingest)
+    raw = load_table_duckdb(db_path, "clima", compact=False)
+    compact = load_table_duckdb(db_path, "clima")
+    return (lambda: load_table_duckdb(db_path, "clima")), {
+        "rows": len(compact),
+        "mb_raw": round(frame_memory_mb(raw), 2),
+        "mb_compact": round(frame_memory_mb(compact), 2),
+    }
+
+# =========================
+# Análise
+# =========================
+@benchmark("compute_scores")
+def bench_compute_scores(ws):
+    energy, climate = ws.energy, ws.climate
+    return (lambda: compute_scores(energy, climate, freq="day")), {"rows": len(energy) + len(climate)}
+
+@benchmark("compute_scores_by_subsystem")
+def bench_compute_scores_by_subsystem(ws):
+    energy, climate = ws.energy, ws.climate
+    return (lambda: compute_scores_by_subsystem(energy, climate, freq="day", workers=ws.workers)), \
+        {"rows": len(energy) + len(climate)}
+
+@benchmark("distance_matrix")
+def bench_distance_matrix(ws):
+    usinas = synthetic_data.usinas(ws.n_usinas, ws.seed)
+    estacoes = ws.stations.rename(columns={"codigo_wmo": "id_estacao"})
+    return (lambda: compute_distance_matrix(usinas, estacoes)), {"usinas": len(usinas), "estacoes": len(estacoes)}
+
+@benchmark("station_index")
+def bench_station_index(ws):
+    usinas = synthetic_data.usinas(ws.n_usinas, ws.seed)
+    estacoes = ws.stations.rename(columns={"codigo_wmo": "id_estacao"})
+    return (lambda: StationIndex(estacoes).nearest(usinas, k=3)), {"usinas": len(usinas), "estacoes": len(estacoes)}
+
+@benchmark("lag_correlation")
+def bench_lag_correlation(ws):
+    df = ws.hourly_pairs
+    energy_cols = [c for c in df.columns if c not in CLIMATE_COLS]
+    return (lambda: lag_correlations(df, energy_cols, CLIMATE_COLS, max_lag=24)), \
+        {"rows": len(df), "pairs": len(energy_cols) * len(CLIMATE_COLS)}
+
+def pair_series(ws):
+    df = ws.hourly_pairs
+    return df["SE"], df["temperatura_max"]
+
+@benchmark("anomaly_fit")
+def bench_anomaly_fit(ws):
+    frame = pair_frame(*pair_series(ws))
+    return (lambda: AnomalyModel(frame)), {"rows": len(frame)}
+
+@benchmark("online_detector")
+def bench_online_detector(ws):
+    energy = ws.energy
+
+    def run():
+        OnlineDetector().consume(energy, "din_instante", [ENERGY_COL], key_cols=["id_subsistema"])
+
+    return run, {"rows": len(energy)}
+
+@benchmark("anomaly_summary")
+def bench_anomaly_summary(ws):
+    energy, climate = pair_series(ws)
+    scores = AnomalyModel(pair_frame(energy, climate)).scores
+    anomalies = pd.DataFrame({
+        "x": energy.name,
+        "y": climate.name,
+        "anomaly": scores["derived"],
+        "score": scores["decision"],
+        "is_anomaly": scores["anomaly"],
+        "timestamp_col": scores.index,
+    }, index=scores.index)
+    df_energy, df_climate = energy.to_frame(), climate.to_frame()
+
+    def run():
+        summary = prepare_aggregated_anomaly_summary_v3(df_energy, df_climate, anomalies, time_col="timestamp_col")
+        return build_prompts(summary)
+
+    return run, {"rows": len(scores), "anomalies": int(scores["anomaly"].sum())}
+
+# =========================
+# Execução
+# =========================
+def measure(fn, repeat):
+    """Tempo (s) de cada uma das `repeat` execuções, sem a saída impressa pelo código medido."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+    return times
+
+def git_revision():
+    """(commit, árvore com alterações?) do repositório, ou (None, None) fora do git."""
+    cwd = Path(__file__).parent
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=cwd, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status)
+
+def run_benchmarks(names, params, repeat=3, seed=0, workers=None, root=None):
+    """Roda os benchmarks `names` numa escala `params`. Retorna {nome: resultado}."""
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="datathons-bench-", dir=root) as tmp:
+        ws = Workspace(tmp, seed=seed, workers=workers, **params)
+        for name in names:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                fn, info = BENCHMARKS[name](ws)
+            setup = time.perf_counter() - start
+            times = measure(fn, repeat)
+            results[name] = {
+                "min": min(times),
+                "median": statistics.median(times),
+                "times": times,
+                "setup": setup,
+                **info,
+            }
+            print(f"{name:<28} mediana {results[name]['median']:8.3f}s  mín {results[name]['min']:8.3f}s  {info}")
+    return results
+
+def compare(report, baseline_path):
+    """Imprime a razão mediana atual / mediana do JSON de referência (> 1 = mais lento)."""
+    baseline = json.loads(Path(baseline_path).read_text())
+    print(f"\nComparação com {baseline_path} (commit {baseline.get('commit')}, escala {baseline.get('scale')}):")
+    if baseline.get("params") != report["params"]:
+        print(f"Atenção: parâmetros diferentes ({baseline.get('params')} x {report['params']}).")
+    for name, result in report["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old or not old.get("median"):
+            print(f"{name:<28} sem referência")
+            continue
+        ratio = result["median"] / old["median"]
+        flag = "  <-- mais lento" if ratio > 1.1 else ""
+        print(f"{name:<28} {old['median']:8.3f}s -> {result['median']:8.3f}s  ({ratio:.2f}x){flag}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dos caminhos críticos com dados sintéticos ONS/INMET.")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--days", type=int, help="Sobrescreve os dias de série da escala")
+    parser.add_argument("--stations", type=int, help="Sobrescreve o número de estações INMET")
+    parser.add_argument("--usinas", type=int, help="Sobrescreve o número de usinas")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS),
+                        help="Roda só estes benchmarks")
+    parser.add_argument("--repeat", type=int, default=3, help="Execuções medidas por benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processos/threads repassados ao código medido (padrão: o do próprio código)")
+    parser.add_argument("--tmp-dir", default=None, help="Onde criar o diretório temporário dos dados")
+    parser.add_argument("--output", type=Path, default=None,
+                        help=f"JSON de saída (padrão: {RESULTS_DIR}/<commit>-<escala>.json)")
+    parser.add_argument("--compare", type=Path, default=None, help="JSON de uma execução anterior")
+    args = parser.parse_args(argv)
+
+    params = dict(SCALES[args.scale])
+    for key in params:
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+
+    commit, dirty = git_revision()
+    print(f"Escala {args.scale} {params}, commit {commit[:12] if commit else '?'}{' (alterado)' if dirty else ''}")
+    results = run_benchmarks(args.only, params, repeat=args.repeat, seed=args.seed,
+                             workers=args.workers, root=args.tmp_dir)
+
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "scale": args.scale,
+        "params": params,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "workers": args.workers,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    output = args.output or RESULTS_DIR / f"{(commit or 'sem-commit')[:12]}-{args.scale}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"Resultados em {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+if __name__ == "__main__":
+    main()
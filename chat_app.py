@@ -1,17 +1,19 @@
 import streamlit as st
-import duckdb
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import IsolationForest
 import plotly.graph_objects as go
 
-from interpreter_util import prepare_aggregated_anomaly_summary_v3, interpret_aggregated_anomaly_with_ollama_v3
+from interpreter_util import prepare_aggregated_anomaly_summary_v3, build_prompts, stream_interpretations
 from util import *
+from data_layer import (load_table, load_distinct, load_usinas_meta, load_nearest_stations, load_scores,
+                        load_subsystem_scores, load_anomaly_scores, load_dictionary)
+from subsystems import SUBSISTEMAS
 
 # ---------------- Configurações ----------------
-ONS_DB_PATH = "ons_simple1.db"
-CLIMATE_DB_PATH = "climate_simple1.db"
+ONS_DB_PATH = "ons.duckdb"
+CLIMATE_DB_PATH = "climate.duckdb"
 TOP_K = 5
+N_ESTACOES = 3
 
 st.title("Dashboard Energia x Clima — Correlação e Anomalias")
 
@@ -25,36 +27,30 @@ energy_table_options = [
 
 selected_energy_table = st.selectbox("Selecione a tabela de energia ONS:", energy_table_options)
 
-df_energy = load_table_duckdb(ONS_DB_PATH, selected_energy_table)
-df_climate = load_table_duckdb(CLIMATE_DB_PATH, "clima")
-usinas_meta_raw = load_table_duckdb(ONS_DB_PATH, "usinameta")
-estacoes_meta_raw = load_table_duckdb(CLIMATE_DB_PATH, "metadados_estacoes")
+# Granularidade das séries: lidas dos rollups pré-calculados na ingestão
+granularity_options = {"Horária": "hour", "Diária": "day", "Semanal": "week", "Mensal": "month"}
+selected_freq = granularity_options[st.selectbox("Granularidade:", list(granularity_options), index=1)]
 
-usinas_meta = normalize_usina_meta(usinas_meta_raw)
-estacoes_meta = normalize_estacoes_meta(estacoes_meta_raw)
+# Leituras, metadados, distâncias e correlações vêm cacheados por tabela + versão do banco
+usinas_meta = load_usinas_meta(ONS_DB_PATH)
 
-# Calcular latitude e longitude central do Brasil
-valid_usinas = usinas_meta.dropna(subset=['latitude', 'longitude'])
-central_lat = valid_usinas['latitude'].mean() if not valid_usinas.empty else -14.235
-central_lon = valid_usinas['longitude'].mean() if not valid_usinas.empty else -51.9253
+# Estações INMET mais próximas de cada usina (BallTree haversine, distâncias em km)
+usina_estacoes = load_nearest_stations(ONS_DB_PATH, CLIMATE_DB_PATH, k=N_ESTACOES)
 
-# Ajustar coordenadas faltantes
-usinas_meta['latitude'] = usinas_meta['latitude'].fillna(central_lat)
-usinas_meta['longitude'] = usinas_meta['longitude'].fillna(central_lon)
-
-# ---------------- Corrigir coordenadas invertidas ----------------
-def is_out_of_brazil(lat, lon):
-    return pd.isna(lat) or pd.isna(lon) or lat < -35 or lat > 5 or lon < -75 or lon > -34
-
-for idx, usina in usinas_meta.iterrows():
-    lat, lon = usina['latitude'], usina['longitude']
-    if is_out_of_brazil(lat, lon):
-        usinas_meta.at[idx, 'latitude'], usinas_meta.at[idx, 'longitude'] = lon, lat
-
-dist_matrix = compute_distance_matrix(usinas_meta, estacoes_meta)
+# Subsistema: energia do subsistema x clima só das estações dele (mapeadas por UF na ingestão)
+subsystem_options = {"Nacional (todas as estações)": None, **{nome: sid for sid, nome in SUBSISTEMAS.items()}}
+selected_subsystem = subsystem_options[st.selectbox("Subsistema:", list(subsystem_options))]
 
 # ---------------- Calcular correlações ----------------
-pearson_matrix, energy_cols, climate_cols, df_merged = compute_scores(df_energy, df_climate)
+try:
+    pearson_matrix, energy_cols, climate_cols, df_merged = load_scores(
+        ONS_DB_PATH, selected_energy_table, CLIMATE_DB_PATH, freq=selected_freq, subsystem=selected_subsystem)
+except ValueError as e:
+    # Tabela sem coluna de subsistema (ou clima ainda sem mapeamento): cai para a visão nacional
+    st.warning(f"Correlação por subsistema indisponível ({e}); usando todas as estações.")
+    selected_subsystem = None
+    pearson_matrix, energy_cols, climate_cols, df_merged = load_scores(
+        ONS_DB_PATH, selected_energy_table, CLIMATE_DB_PATH, freq=selected_freq)
 
 pairs = []
 for i, e_col in enumerate(energy_cols):
@@ -63,17 +59,51 @@ for i, e_col in enumerate(energy_cols):
 df_pairs = pd.DataFrame(pairs)
 df_pairs_top = df_pairs.sort_values('pearson_r', ascending=False).head(TOP_K)
 
+# Descrição das variáveis de energia pelo dicionário da ONS (índice em memória)
+dictionary = load_dictionary(ONS_DB_PATH)
+df_pairs_top = df_pairs_top.assign(
+    descricao=[dictionary.describe(v, selected_energy_table) for v in df_pairs_top['energy_var']])
+
 st.subheader("Top correlações Energia x Clima")
 st.dataframe(df_pairs_top)
 
+with st.expander("Melhor correlação em cada subsistema"):
+    try:
+        subsystem_scores = load_subsystem_scores(ONS_DB_PATH, selected_energy_table, CLIMATE_DB_PATH,
+                                                 freq=selected_freq)
+    except ValueError:
+        subsystem_scores = {}
+    best_rows = []
+    for sid, (matrix, e_cols, c_cols, _) in subsystem_scores.items():
+        if matrix.size == 0 or np.isnan(matrix).all():
+            continue
+        i, j = np.unravel_index(np.nanargmax(matrix), matrix.shape)
+        best_rows.append({'subsistema': SUBSISTEMAS.get(sid, sid), 'energy_var': e_cols[i],
+                          'climate_var': c_cols[j], 'pearson_r': matrix[i, j]})
+    if best_rows:
+        st.dataframe(pd.DataFrame(best_rows))
+    else:
+        st.write("Tabela sem coluna id_subsistema ou clima sem mapeamento de subsistemas.")
+
+# ---------------- Alertas online ----------------
+# Gerados na ingestão (feed_ons.run_online_detector) pelo detector online das séries horárias
+try:
+    df_alerts = load_table(ONS_DB_PATH, "anomalias_online")
+except ValueError:
+    df_alerts = pd.DataFrame()
+if not df_alerts.empty:
+    with st.expander(f"Alertas online das séries horárias ({len(df_alerts)})"):
+        st.dataframe(df_alerts.sort_values('data_hora', ascending=False).head(100))
+
 # ---------------- Detectar anomalias com limiar adaptativo ----------------
-usinas_meta['id_da_usina'] = usinas_meta['id_da_usina'].str.strip()
 usinas_anomaly = {usina_id: False for usina_id in usinas_meta['id_da_usina']}
 
-# Criar mapeamento de subsistema para usinas baseado em df_energy
-if 'id_subsistema' in df_energy.columns and 'nome_usina' in df_energy.columns:
-    subsistema_to_usinas = df_energy.groupby('id_subsistema')['nome_usina'].unique().to_dict()
-else:
+# Criar mapeamento de subsistema para usinas (DISTINCT calculado no banco)
+try:
+    df_usinas_subsistema = load_distinct(ONS_DB_PATH, selected_energy_table, ['id_subsistema', 'nome_usina'])
+    subsistema_to_usinas = df_usinas_subsistema.groupby('id_subsistema')['nome_usina'].unique().to_dict()
+except ValueError:
+    # Tabela sem as colunas id_subsistema/nome_usina
     subsistema_to_usinas = {}
 
 # Mapear usina para subsistema para fácil acesso inverso
@@ -82,24 +112,19 @@ for subsis, usinas_list in subsistema_to_usinas.items():
     for u in usinas_list:
         usina_to_subsistema[u] = subsis
 
-for idx, row in df_pairs_top.iterrows():
-    energy_series = df_merged[row['energy_var']]
-    climate_series = df_merged[row['climate_var']]
-    derived_feature = energy_series - climate_series
+# Scores do IsolationForest de cada par: treinado uma vez e salvo (anomaly_store);
+# o mapa e as abas abaixo usam exatamente os mesmos scores
+def pair_anomaly_scores(energy_var, climate_var):
+    return load_anomaly_scores(ONS_DB_PATH, selected_energy_table, CLIMATE_DB_PATH, energy_var, climate_var,
+                               freq=selected_freq, subsystem=selected_subsystem)
 
-    combined_df = pd.concat([energy_series, derived_feature], axis=1).dropna()
-    if combined_df.shape[0] < 10:
+for idx, row in df_pairs_top.iterrows():
+    pair_scores = pair_anomaly_scores(row['energy_var'], row['climate_var'])
+    if pair_scores is None:
         continue
 
-    energy_norm = normalize_series(energy_series)
-    derived_norm = normalize_series(derived_feature)
-    combined_norm_df = pd.concat([energy_norm, derived_norm], axis=1).dropna()
-
-    clf = IsolationForest(contamination=0.01, random_state=42)
-    clf.fit(combined_norm_df)
-    anomaly_scores = -clf.score_samples(combined_norm_df)  
-    threshold = np.percentile(anomaly_scores, 95) 
-    strong_anomalies = anomaly_scores >= threshold
+    # Anomalia forte: score acima do p95 dos scores de treino
+    strong_anomalies = pair_scores['strong'].to_numpy()
 
     if strong_anomalies.sum() >= 3:
         subsistema_key = row['energy_var']
@@ -165,33 +190,24 @@ st.plotly_chart(fig_map, use_container_width=True, key="map_usinas_anomalias")
 # ---------------- Séries temporais ----------------
 st.subheader("Séries temporais roláveis")
 
-time_col_mapping = {
-    'balanco_energia_subsistema_2024': 'din_instante',
-    'dados_hidrologicos_res_2024': 'din_instante',
-    'curva_carga_2024': 'din_instante',
-    'ear_diario_reservatorios_2024': 'ear_data'
-}
-energy_time_col = time_col_mapping.get(selected_energy_table, 'din_instante')
-
 tabs = st.tabs([f"{row['energy_var']} x {row['climate_var']}" for _, row in df_pairs_top.iterrows()])
 
 for idx, (tab, row) in enumerate(zip(tabs, df_pairs_top.itertuples())):
     with tab:
-        energy_series = df_merged[row.energy_var]
-        climate_series = df_merged[row.climate_var]
-        derived_feature = energy_series - climate_series
-
-        combined_df = pd.concat([energy_series, derived_feature], axis=1).dropna()
-        if combined_df.shape[0] < 10:
+        if row.descricao:
+            st.caption(f"{row.energy_var}: {row.descricao}")
+        pair_scores = pair_anomaly_scores(row.energy_var, row.climate_var)
+        if pair_scores is None:
             st.write("Dados insuficientes para análise.")
             continue
 
-        energy_norm = normalize_series(energy_series)
-        climate_norm = normalize_series(climate_series)
-        derived_norm = normalize_series(derived_feature)
-
-        clf = IsolationForest(contamination=0.01, random_state=42)
-        anomalies = clf.fit_predict(pd.concat([energy_norm, derived_norm], axis=1)) == -1
+        energy_series = pair_scores['energy']
+        climate_series = pair_scores['climate']
+        derived_feature = pair_scores['derived']
+        energy_norm = pair_scores['energy_norm']
+        climate_norm = pair_scores['climate_norm']
+        derived_norm = pair_scores['derived_norm']
+        anomalies = pair_scores['anomaly']
 
         fig = go.Figure()
         fig.add_trace(go.Scatter(y=energy_norm, mode='lines', name=row.energy_var))
@@ -207,10 +223,6 @@ for idx, (tab, row) in enumerate(zip(tabs, df_pairs_top.itertuples())):
         if st.button("Interpretar Anomalias", key=interpret_button_key):
             df_energy_pair = energy_series.to_frame(name=row.energy_var)
             df_climate_pair = climate_series.to_frame(name=row.climate_var)
-            if energy_time_col in df_energy.columns:
-                time_series_full = pd.to_datetime(df_energy[energy_time_col])
-            else:
-                time_series_full = pd.to_datetime(df_energy.index)
             # Alinhar timestamps ao índice das séries de energia e clima
             # Tentar usar o índice de energy_series convertido para datetime
             try:
@@ -219,14 +231,17 @@ for idx, (tab, row) in enumerate(zip(tabs, df_pairs_top.itertuples())):
                 timestamps = energy_series.index
             # Garantir que timestamps tenha o mesmo tamanho que energy_series
             if len(timestamps) != len(energy_series):
-                timestamps = pd.date_range(start=timestamps[0], periods=len(energy_series), freq='D')
+                pandas_freq = {'hour': 'h', 'day': 'D', 'week': 'W-MON', 'month': 'MS'}[selected_freq]
+                timestamps = pd.date_range(start=timestamps[0], periods=len(energy_series), freq=pandas_freq)
 
             # Construir DataFrame de anomalias compatível com a função
             anomalies_df_for_pair = pd.DataFrame({
                 'x': [row.energy_var] * len(energy_series),
                 'y': [row.climate_var] * len(climate_series),
                 'anomaly': derived_feature.values,
-                'score': clf.decision_function(pd.concat([energy_norm, derived_norm], axis=1))
+                'score': pair_scores['decision'].values,
+                # Só as linhas que o modelo marcou como anomalia entram no resumo da LLM
+                'is_anomaly': anomalies.values
             }, index=energy_series.index)
 
             anomalies_df_for_pair['timestamp_col'] = timestamps
@@ -238,17 +253,13 @@ for idx, (tab, row) in enumerate(zip(tabs, df_pairs_top.itertuples())):
                 anomalies_df_for_pair,
                 time_col='timestamp_col'
             )
-            # Obter interpretação da LLM
-            interpretation_df = interpret_aggregated_anomaly_with_ollama_v3(summary)
-            # Extrair apenas o texto da coluna 'interpretation'
-            interpretation_text = ""
-            if isinstance(interpretation_df, pd.DataFrame) and 'interpretation' in interpretation_df.columns:
-                interpretation_text = interpretation_df['interpretation'].iloc[0]
+            # Interpretação transmitida conforme a LLM gera (st.write_stream anexa os trechos);
+            # um par já interpretado sai inteiro do cache em disco
+            st.markdown("**Interpretação da LLM:**")
+            if summary.empty:
+                st.write("Nenhuma anomalia marcada pelo modelo para interpretar.")
             else:
-                interpretation_text = str(interpretation_df)
-
-            output_area = st.empty()
-            displayed_text = ""
-            for char in interpretation_text:
-                displayed_text += char
-                output_area.markdown(f"**Interpretação da LLM:**  \n{displayed_text}")
+                # Prompt compacto: episódios mais severos dentro do orçamento de tokens
+                df_prompt, prompts = build_prompts(summary)
+                st.caption(f"Prompt: ~{int(df_prompt['prompt_tokens'].sum())} tokens")
+                st.write_stream(stream_interpretations(prompts))
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+# =========================
+# Schema compacto dos DataFrames de energia e clima
+# =========================
+# Aplicado na ingestão (tipos das colunas no DuckDB) e na leitura (load_table_duckdb):
+#   - medições em float32 (FLOAT no banco): ~7 dígitos significativos, sobra para MWmed,
+#     °C, mm, %;
+#   - chaves repetidas (subsistema, usina, arquivo da estação...) como category: cada linha
+#     guarda só um código inteiro e o texto fica uma vez nas categorias. O arquivo da
+#     estação vira assim um id inteiro por linha, sem uma coluna numérica extra (que os
+#     rollups e o compute_scores tratariam como medição);
+#   - instantes em datetime64.
+# Coordenadas continuam float64: as distâncias usina-estação usam a precisão toda.
+
+MEASUREMENT_DTYPE = np.float32
+MEASUREMENT_SQL_TYPE = "FLOAT"
+
+FLOAT64_COLUMNS = ("latitude", "longitude", "altitude")
+
+KEY_COLUMNS = (
+    "id_subsistema", "nom_subsistema", "nome_usina", "nom_usina", "id_da_usina", "nome",
+    "arquivo", "uf", "regiao", "estacao", "codigo_wmo",
+    "nom_bacia", "nom_reservatorio", "nom_tipocombustivel", "nom_tipousina", "nom_estado", "id_estado",
+    "tabela", "variavel", "subsistema", "dataset",
+)
+
+TIME_PREFIXES = ("din_", "dat_")
+TIME_COLUMNS = ("data_hora",)
+
+# Texto fora de KEY_COLUMNS vira category quando os valores se repetem bastante
+CATEGORY_MAX_RATIO = 0.5
+
+def is_time_column(name: str) -> bool:
+    return name in TIME_COLUMNS or name.startswith(TIME_PREFIXES) or name.endswith("_data")
+
+def compact_dtype(series: pd.Series):
+    """dtype compacto da coluna, ou None se ela já está no tipo certo."""
+    name = str(series.name)
+    dtype = series.dtype
+    if name in FLOAT64_COLUMNS or isinstance(dtype, pd.CategoricalDtype):
+        return None
+    if pd.api.types.is_float_dtype(dtype):
+        return MEASUREMENT_DTYPE if dtype != MEASUREMENT_DTYPE else None
+    if pd.api.types.is_datetime64_any_dtype(dtype) or pd.api.types.is_numeric_dtype(dtype):
+        return None
+    if is_time_column(name):
+        return "datetime64"
+    if pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+        if name in KEY_COLUMNS:
+            return "category"
+        n = len(series)
+        if n and series.nunique(dropna=True) <= CATEGORY_MAX_RATIO * n:
+            return "category"
+    return None
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte as colunas para o schema compacto, uma coluna por vez (pico de memória baixo).
+
+    Altera e devolve o próprio DataFrame.
+    """
+    for col in df.columns:
+        dtype = compact_dtype(df[col])
+        if dtype is None:
+            continue
+        if dtype == "datetime64":
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+def frame_memory_mb(df: pd.DataFrame) -> float:
+    """Memória do DataFrame (MB), contando o conteúdo das strings."""
+    return float(df.memory_usage(deep=True).sum()) / 1e6
@@ -0,0 +1,160 @@
+import csv
+import io
+import os
+import re
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from util import connect_duckdb
+
+# =========================
+# Dicionário de variáveis dos datasets da ONS
+# =========================
+# feed_ons.load_dicts grava a tabela `metadata` (dataset, variavel, descricao) a partir
+# dos CSVs DicionarioDados_<Dataset>.csv. Aqui ela vira um índice em memória
+# (dataset -> código -> descrição), montado uma vez e consultado sem tocar no banco.
+
+METADATA_TABLE = "metadata"
+METADATA_COLUMNS = ["dataset", "variavel", "descricao"]
+
+DICT_PREFIX = "dicionariodados_"
+YEAR_SUFFIX = re.compile(r"_\d{4}(?:_\d{2})?$")
+SEPARATORS = ";,\t|"
+
+def normalize_dataset_name(name: str) -> str:
+    """"DicionarioDados_Carga_Energia", "CARGA_ENERGIA_2024" e "carga-energia" -> "carga_energia"."""
+    name = re.sub(r"[\s\-]+", "_", str(name).strip().lower())
+    if name.startswith(DICT_PREFIX):
+        name = name[len(DICT_PREFIX):]
+    return YEAR_SUFFIX.sub("", name)
+
+def dataset_from_dict_file(path) -> str:
+    return normalize_dataset_name(Path(path).stem)
+
+def read_dict_csv(path) -> pd.DataFrame:
+    """Lê um dicionário da ONS: UTF-8 (ou latin1 em exports antigos), separador detectado
+    uma vez no cabeçalho e leitura pelo parser C do pandas."""
+    raw = Path(path).read_bytes()
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = raw.decode("latin1")
+    header = text.split("\n", 1)[0]
+    try:
+        sep = csv.Sniffer().sniff(header, delimiters=SEPARATORS).delimiter
+    except csv.Error:
+        sep = ";"
+    return pd.read_csv(io.StringIO(text), sep=sep, dtype=str)
+
+def dict_records(df_dict: pd.DataFrame, dataset: str) -> pd.DataFrame:
+    """(dataset, variavel, descricao) das linhas com código; vazio se faltar Código/Descrição."""
+    if "Código" not in df_dict.columns or "Descrição" not in df_dict.columns:
+        return pd.DataFrame(columns=METADATA_COLUMNS)
+    df = pd.DataFrame({
+        "dataset": dataset,
+        "variavel": df_dict["Código"].str.strip(),
+        "descricao": df_dict["Descrição"].str.strip(),
+    })
+    # Tabelas extraídas de PDF repetem o cabeçalho no meio dos dados
+    df = df[df["variavel"].notna() & (df["variavel"] != "") & (df["variavel"] != "Código")]
+    return df.drop_duplicates(["dataset", "variavel"]).reset_index(drop=True)
+
+class DictionaryIndex:
+    """Código de variável -> descrição, por dataset e geral (primeiro dataset que define)."""
+
+    def __init__(self, metadata: pd.DataFrame):
+        metadata = metadata.dropna(subset=["variavel"])
+        if "dataset" not in metadata.columns:
+            metadata = metadata.assign(dataset=None)
+        self.datasets = {}
+        for dataset, group in metadata.groupby(metadata["dataset"].fillna(""), sort=True):
+            self.datasets[dataset] = dict(zip(group["variavel"], group["descricao"]))
+        self._resolved = {}
+        self.variables = {}
+        for variables in self.datasets.values():
+            for variable, description in variables.items():
+                self.variables.setdefault(variable, description)
+
+    def __len__(self):
+        return len(self.variables)
+
+    def resolve_dataset(self, name):
+        """Chave do dataset para `name` (nome do dataset, tabela anual ou arquivo), ou None.
+
+        Sem correspondência exata, aceita o dataset mais curto que começa com o nome
+        (ex.: "carga_energia" -> "carga_energia_diaria").
+        """
+        if not name:
+            return None
+        if name not in self._resolved:
+            key = normalize_dataset_name(name)
+            if key not in self.datasets:
+                candidates = [d for d in self.datasets if d and (d.startswith(key) or key.startswith(d))]
+                key = min(candidates, key=len) if candidates else None
+            self._resolved[name] = key
+        return self._resolved[name]
+
+    def dataset(self, name) -> dict:
+        """{código: descrição} do dataset, ou {} se não houver dicionário para ele."""
+        key = self.resolve_dataset(name)
+        return self.datasets[key] if key is not None else {}
+
+    def describe(self, variable, dataset=None):
+        """Descrição de `variable`, preferindo o dicionário de `dataset`; None se desconhecida."""
+        if dataset is not None:
+            description = self.dataset(dataset).get(variable)
+            if description is not None:
+                return description
+        return self.variables.get(variable)
+
+def load_dictionary_index(con) -> DictionaryIndex:
+    """Índice a partir da tabela `metadata` (vazio se a tabela ainda não existir)."""
+    exists = con.execute(
+        "SELECT 1 FROM information_schema.tables WHERE table_name = ?", [METADATA_TABLE]).fetchone()
+    if not exists:
+        return DictionaryIndex(pd.DataFrame(columns=METADATA_COLUMNS))
+    return DictionaryIndex(con.execute(f'SELECT * FROM "{METADATA_TABLE}"').fetchdf())
+
+class DictionaryService:
+    """Índice do banco da ONS em memória, remontado quando o arquivo do banco muda (mtime).
+
+    Se o banco estiver bloqueado por um feeder, continua servindo o índice anterior.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._version = None
+        self.index = DictionaryIndex(pd.DataFrame(columns=METADATA_COLUMNS))
+
+    def _db_version(self):
+        try:
+            return os.stat(self.db_path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def is_current(self) -> bool:
+        """O índice corresponde ao arquivo atual do banco? (só um stat, sem abrir o banco)"""
+        return self._db_version() == self._version
+
+    def refresh(self) -> DictionaryIndex:
+        version = self._db_version()
+        if version == self._version:
+            return self.index
+        with self._lock:
+            if version == self._version:
+                return self.index
+            if version:
+                try:
+                    con = connect_duckdb(self.db_path)
+                    try:
+                        self.index = load_dictionary_index(con)
+                    finally:
+                        con.close()
+                except Exception as e:
+                    print(f"Falha ao carregar o dicionário de {self.db_path}: {e}")
+                    return self.index
+            self._version = version
+        return self.index
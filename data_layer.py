@@ -0,0 +1,155 @@
+import os
+
+import streamlit as st
+
+from util import (
+    connect_duckdb,
+    load_table_duckdb,
+    load_distinct_duckdb,
+    normalize_usina_meta,
+    normalize_estacoes_meta,
+    compute_scores,
+    compute_scores_by_subsystem,
+)
+from subsystems import CLIMATE_SUBSYSTEM_VIEW
+from data_dictionary import load_dictionary_index
+from anomaly_store import AnomalyStore, store_path_for
+from spatial_index import index_path_for, load_or_build_index
+
+# =========================
+# Camada de acesso a dados do dashboard
+# =========================
+# O Streamlit reexecuta o script inteiro a cada interação. Tudo aqui é cacheado
+# por (banco, tabela, versão do arquivo), onde a versão é o mtime do banco:
+# quando um feeder regrava o banco, a chave muda e o cache é refeito.
+# Cada falta de cache abre uma conexão somente leitura só durante a consulta: nenhuma
+# conexão fica segurando o lock do arquivo, então feed_ons/feed_db3 podem gravar com o
+# dashboard aberto, e nenhuma thread fecha a conexão que outra está usando.
+
+def db_version(db_path) -> int:
+    """mtime (ns) do arquivo do banco; 0 se ainda não existir."""
+    try:
+        return os.stat(db_path).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+# ---------------- Tabelas ----------------
+@st.cache_data(max_entries=16, show_spinner=False)
+def _load_table(db_path, table_name, version, **query):
+    return load_table_duckdb(db_path, table_name, **query)
+
+def load_table(db_path, table_name, **query):
+    """Tabela cacheada; `query` são os filtros/agregação de load_table_duckdb."""
+    return _load_table(db_path, table_name, db_version(db_path), **query)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _load_distinct(db_path, table_name, columns, version):
+    return load_distinct_duckdb(db_path, table_name, list(columns))
+
+def load_distinct(db_path, table_name, columns):
+    return _load_distinct(db_path, table_name, tuple(columns), db_version(db_path))
+
+# ---------------- Metadados ----------------
+@st.cache_data(show_spinner=False)
+def _load_usinas_meta(db_path, version):
+    # Coordenadas já validadas/corrigidas na ingestão (meta_normalize)
+    return normalize_usina_meta(_load_table(db_path, "usinameta", version))
+
+def load_usinas_meta(db_path):
+    return _load_usinas_meta(db_path, db_version(db_path))
+
+@st.cache_data(show_spinner=False)
+def _load_estacoes_meta(db_path, version):
+    return normalize_estacoes_meta(_load_table(db_path, "metadados_estacoes", version))
+
+def load_estacoes_meta(db_path):
+    return _load_estacoes_meta(db_path, db_version(db_path))
+
+@st.cache_resource(max_entries=2)
+def _load_station_index(db_path, version):
+    # Índice persistido pelo feed_db3 ao lado do banco; só é refeito se as estações mudaram
+    return load_or_build_index(_load_estacoes_meta(db_path, version), index_path_for(db_path))
+
+@st.cache_data(show_spinner=False)
+def _load_nearest_stations(ons_db_path, climate_db_path, k, ons_version, climate_version):
+    index = _load_station_index(climate_db_path, climate_version)
+    return index.nearest(_load_usinas_meta(ons_db_path, ons_version), k=k)
+
+def load_nearest_stations(ons_db_path, climate_db_path, k=3):
+    """k estações mais próximas de cada usina: (id_da_usina, id_estacao, distancia_km, rank)."""
+    return _load_nearest_stations(ons_db_path, climate_db_path, k,
+                                  db_version(ons_db_path), db_version(climate_db_path))
+
+# ---------------- Dicionário de variáveis ----------------
+@st.cache_resource(max_entries=2)
+def _load_dictionary(db_path, version):
+    con = connect_duckdb(db_path)
+    try:
+        return load_dictionary_index(con)
+    finally:
+        con.close()
+
+def load_dictionary(db_path):
+    """Índice código -> descrição (tabela metadata), remontado só quando o banco muda."""
+    return _load_dictionary(db_path, db_version(db_path))
+
+# ---------------- Correlações ----------------
+@st.cache_data(max_entries=8, show_spinner=False)
+def _load_scores(ons_db_path, energy_table, climate_db_path, freq, subsystem, ons_version, climate_version):
+    # Médias por bucket lidas dos rollups da ingestão: chegam milhares de linhas, não milhões
+    if subsystem is None:
+        df_energy = _load_table(ons_db_path, energy_table, ons_version, freq=freq)
+        df_climate = _load_table(climate_db_path, "clima", climate_version, freq=freq)
+    else:
+        # Energia do subsistema só com o clima das estações do próprio subsistema
+        df_energy = _load_table(ons_db_path, energy_table, ons_version, freq=freq, subsystem=subsystem)
+        df_climate = _load_table(climate_db_path, CLIMATE_SUBSYSTEM_VIEW, climate_version,
+                                 freq=freq, subsystem=subsystem)
+    return compute_scores(df_energy, df_climate,
+                          time_col_energy=df_energy.columns[0], time_col_climate=df_climate.columns[0],
+                          freq=freq)
+
+def load_scores(ons_db_path, energy_table, climate_db_path, freq="day", subsystem=None):
+    """(pearson_matrix, energy_cols, climate_cols, df_merged) da tabela escolhida na granularidade `freq`.
+
+    subsystem: id_subsistema (ex.: "SE"); None correlaciona com a média de todas as estações.
+    """
+    return _load_scores(ons_db_path, energy_table, climate_db_path, freq, subsystem,
+                        db_version(ons_db_path), db_version(climate_db_path))
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _load_subsystem_scores(ons_db_path, energy_table, climate_db_path, freq, ons_version, climate_version):
+    df_energy = _load_table(ons_db_path, energy_table, ons_version, freq=freq, by=("id_subsistema",))
+    df_climate = _load_table(climate_db_path, CLIMATE_SUBSYSTEM_VIEW, climate_version,
+                             freq=freq, by=("id_subsistema",))
+    return compute_scores_by_subsystem(df_energy, df_climate,
+                                       time_col_energy=df_energy.columns[0],
+                                       time_col_climate=df_climate.columns[0], freq=freq)
+
+def load_subsystem_scores(ons_db_path, energy_table, climate_db_path, freq="day"):
+    """{id_subsistema: resultado de compute_scores} com energia e clima de cada subsistema."""
+    return _load_subsystem_scores(ons_db_path, energy_table, climate_db_path, freq,
+                                  db_version(ons_db_path), db_version(climate_db_path))
+
+# ---------------- Anomalias ----------------
+@st.cache_resource
+def get_anomaly_store(ons_db_path):
+    return AnomalyStore(store_path_for(ons_db_path))
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _load_anomaly_scores(ons_db_path, energy_table, climate_db_path, freq, subsystem, energy_var, climate_var,
+                         ons_version, climate_version):
+    *_, df_merged = _load_scores(ons_db_path, energy_table, climate_db_path, freq, subsystem,
+                                 ons_version, climate_version)
+    key = (energy_table, energy_var, climate_var, freq, subsystem)
+    return get_anomaly_store(ons_db_path).scores(key, df_merged[energy_var], df_merged[climate_var])
+
+def load_anomaly_scores(ons_db_path, energy_table, climate_db_path, energy_var, climate_var,
+                        freq="day", subsystem=None):
+    """Scores do IsolationForest do par (treinado uma vez, salvo em disco); None se faltar dado.
+
+    Colunas: energy, climate, derived, *_norm, score (maior = mais anômalo), decision,
+    anomaly (predição do modelo) e strong (score acima do p95 do treino).
+    """
+    return _load_anomaly_scores(ons_db_path, energy_table, climate_db_path, freq, subsystem,
+                                energy_var, climate_var, db_version(ons_db_path), db_version(climate_db_path))
@@ -1,9 +1,33 @@
+import argparse
+import itertools
+import os
+import re
+import sys
+import time
+import duckdb
+import numpy as np
 import pandas as pd
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
-import sqlite3
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from compact_schema import MEASUREMENT_DTYPE, MEASUREMENT_SQL_TYPE
+from manifest import ensure_manifest, check_file, record_file, NEW, UNCHANGED
+from rollups import update_rollups, regroup_rollups
+from spatial_index import index_path_for, load_or_build_index
+from subsystems import map_stations_to_subsystems, STATION_SUBSYSTEM_TABLE, CLIMATE_SUBSYSTEM_VIEW
+from util import normalize_estacoes_meta
 
 CLIMATE_ROOT = Path(__file__).parent / "DatathONS-11" / "Climate"
-DB_PATH = Path("climate_simple1.db")
+DB_PATH = Path("climate.duckdb")
+
+# Linhas acumuladas antes de cada gravação no DuckDB (limita a memória do writer)
+BATCH_ROWS = 200_000
 
 # Colunas que vamos manter e seus nomes simples
 KEEP_COLS = {
@@ -17,35 +41,136 @@ KEEP_COLS = {
     "temperatura mínima na hora ant. (aut) (°c)": "temperatura_min"
 }
 
+# Nomes de colunas de data/hora usados pelo INMET em anos anteriores
+COLUMN_ALIASES = {
+    "data_(yyyy-mm-dd)": "data",
+    "hora_(utc)": "hora_utc",
+}
+
+# Layouts de data já vistos nos CSVs do INMET, detectados uma vez por arquivo
+DATE_FORMATS = ("%Y/%m/%d", "%Y-%m-%d", "%d/%m/%Y")
+# Hora numérica gravada como texto de float ("100.0")
+HOUR_FLOAT = re.compile(r"\d+\.0*")
+
+# Cabeçalho de 8 linhas dos CSVs do INMET (chave;valor)
+META_COLS = ["regiao", "uf", "estacao", "codigo_wmo", "latitude", "longitude", "altitude", "data_fundacao"]
+
+# Schema das tabelas no DuckDB
+# Medições em FLOAT (float32, ver compact_schema); o arquivo se repete em toda linha
+# horária, mas o DuckDB guarda colunas texto repetidas com compressão por dicionário
+CLIMA_SCHEMA = {
+    "data_hora": "TIMESTAMPTZ",
+    "precipitacao": MEASUREMENT_SQL_TYPE,
+    "pressao": MEASUREMENT_SQL_TYPE,
+    "umidade": MEASUREMENT_SQL_TYPE,
+    "vento": MEASUREMENT_SQL_TYPE,
+    "temperatura_max": MEASUREMENT_SQL_TYPE,
+    "temperatura_min": MEASUREMENT_SQL_TYPE,
+    "arquivo": "VARCHAR",
+}
+META_SCHEMA = {
+    "regiao": "VARCHAR",
+    "uf": "VARCHAR",
+    "estacao": "VARCHAR",
+    "codigo_wmo": "VARCHAR",
+    "latitude": "DOUBLE",
+    "longitude": "DOUBLE",
+    "altitude": "DOUBLE",
+    "data_fundacao": "VARCHAR",
+    "arquivo": "VARCHAR",
+}
+
 def simplify_column_name(s):
     s = s.lower().strip()
     s = s.replace(" ", "_").replace("ç", "c").replace("ã","a").replace("í","i").replace("ó","o")
     return s
 
-def process_csv(file_path: Path):
-    # ----------------------------
-    # Captura dos metadados (8 primeiras linhas)
-    # ----------------------------
-    try:
-        meta_df = pd.read_csv(file_path, sep=";", encoding="latin1", nrows=8, header=None)
-        # Normaliza strings e elimina duplicados
-        meta_df = meta_df.applymap(lambda x: str(x).strip() if pd.notna(x) else x).drop_duplicates()
-        meta_df["arquivo"] = file_path.name
-    except Exception:
-        print(f"Falha ao ler metadados de {file_path.name}")
-        meta_df = pd.DataFrame()
+def detect_date_format(sample: str):
+    """Descobre o formato de data a partir de um valor de exemplo do arquivo."""
+    for fmt in DATE_FORMATS:
+        try:
+            datetime.strptime(sample.strip(), fmt)
+            return fmt
+        except ValueError:
+            continue
+    return None
+
+def parse_hour_minutes(value) -> float:
+    """Converte "HHMM UTC", "HH:MM" ou HHMM numérico em minutos desde 00:00."""
+    if pd.isna(value):
+        return np.nan
+    digits = str(value).replace("UTC", "").replace(":", "").strip()
+    # Coluna de hora lida como float (100.0 ou "100.0"): vira HHMM com zeros à esquerda
+    if isinstance(value, (int, float, np.number)) or HOUR_FLOAT.fullmatch(digits):
+        number = float(digits)
+        if not number.is_integer():
+            return np.nan
+        digits = f"{int(number):04d}"
+    if not digits.isdigit():
+        return np.nan
+    hhmm = int(digits)
+    hours, minutes = divmod(hhmm, 100) if len(digits) > 2 else (hhmm, 0)
+    if hours > 23 or minutes > 59:
+        return np.nan
+    return hours * 60 + minutes
+
+def parse_inmet_timestamp(data: pd.Series, hora: pd.Series = None):
+    """Monta data_hora (UTC, tz-aware) a partir das colunas de data e hora do INMET.
+
+    Datas e horas se repetem muito (365 dias x 24 horas por arquivo), então cada
+    valor distinto é convertido uma única vez com formato explícito e o resultado
+    é espalhado por índice inteiro, sem regex ou concatenação de strings por linha.
+    Retorna (serie, n_descartadas), onde n_descartadas conta as linhas não convertidas.
+    """
+    codes, uniques = pd.factorize(data)
+    sample = next((str(u) for u in uniques if str(u).strip()), "")
+    fmt = detect_date_format(sample)
+    unique_dates = pd.to_datetime(pd.Series(uniques, dtype=str).str.strip(), format=fmt, errors="coerce")
+    dates = unique_dates.to_numpy()[codes]
+    dates[codes < 0] = np.datetime64("NaT")
 
+    if hora is not None:
+        h_codes, h_uniques = pd.factorize(hora)
+        minutes = np.array([parse_hour_minutes(h) for h in h_uniques], dtype=float)[h_codes]
+        minutes[h_codes < 0] = np.nan
+        timestamps = pd.Series(dates, index=data.index) + pd.to_timedelta(minutes, unit="min")
+    else:
+        timestamps = pd.Series(dates, index=data.index)
+
+    timestamps = timestamps.dt.tz_localize("UTC")
+    return timestamps, int(timestamps.isna().sum())
+
+def parse_station_header(lines, file_name: str) -> pd.DataFrame:
+    """Converte as 8 linhas "CHAVE:;valor" do cabeçalho INMET numa linha de metadados."""
+    values = []
+    for line in lines:
+        parts = line.rstrip("\r\n").split(";")
+        value = parts[1].strip() if len(parts) > 1 else ""
+        values.append(value or None)
+    meta_df = pd.DataFrame([dict(zip(META_COLS, values))])
+    meta_df["arquivo"] = file_name
+    return meta_df
+
+def process_csv(file_path: Path):
     # ----------------------------
-    # Captura dos dados métricos (a partir da linha 9)
+    # Leitura única do arquivo: 8 linhas de metadados + dados métricos (linha 9 em diante)
     # ----------------------------
+    meta_df = pd.DataFrame()
     try:
-        df = pd.read_csv(file_path, sep=";", encoding="latin1", decimal=",", skiprows=8)
+        with open(file_path, encoding="latin1") as f:
+            header_lines = [f.readline() for _ in range(len(META_COLS))]
+            try:
+                meta_df = parse_station_header(header_lines, file_path.name)
+            except Exception:
+                print(f"Falha ao ler metadados de {file_path.name}")
+            df = pd.read_csv(f, sep=";", decimal=",")
     except Exception:
         print(f"Falha ao ler dados de {file_path.name}")
         return pd.DataFrame(), meta_df
 
     # Normalizar colunas
     df.columns = [simplify_column_name(c) for c in df.columns]
+    df = df.rename(columns=COLUMN_ALIASES)
 
     # Manter apenas colunas desejadas
     df_simple = pd.DataFrame()
@@ -56,50 +181,254 @@ def process_csv(file_path: Path):
         else:
             df_simple[v] = pd.NA
 
-    # Criar data_hora
-    if "hora_utc" in df_simple.columns:
-        df_simple["hora_utc"] = df_simple["hora_utc"].astype(str).str.replace(" UTC","", regex=False).str.zfill(4)
-        df_simple["hora_utc"] = df_simple["hora_utc"].str.replace(r"^(\d{2})(\d{2})$", r"\1:\2", regex=True)
-        df_simple["data_hora"] = pd.to_datetime(df_simple["data_hora"].astype(str) + " " + df_simple["hora_utc"], errors="coerce")
-    else:
-        df_simple["data_hora"] = pd.to_datetime(df_simple["data_hora"], errors="coerce")
+    # Criar data_hora (UTC) com formato detectado por arquivo
+    hora = df_simple["hora_utc"] if df_simple["hora_utc"].notna().any() else None
+    data_hora, n_coerced = parse_inmet_timestamp(df_simple["data_hora"], hora)
+    if n_coerced:
+        print(f"{file_path.name}: {n_coerced} linhas com data/hora inválida descartadas.")
+    df_simple["data_hora"] = data_hora
 
     df_simple = df_simple.drop(columns=["hora_utc"], errors="ignore")
     df_simple = df_simple.dropna(subset=["data_hora"])
-    df_simple["arquivo"] = file_path.name
+    # Schema compacto já no worker (menos bytes voltando para o processo principal):
+    # medições float32 e o nome do arquivo como category (um código por linha)
+    for col, col_type in CLIMA_SCHEMA.items():
+        if col_type == MEASUREMENT_SQL_TYPE and pd.api.types.is_float_dtype(df_simple[col]):
+            df_simple[col] = df_simple[col].astype(MEASUREMENT_DTYPE)
+    df_simple["arquivo"] = pd.Categorical.from_codes(np.zeros(len(df_simple), dtype=np.int8), [file_path.name])
+    df_simple.attrs["linhas_descartadas"] = n_coerced
 
     return df_simple, meta_df
 
-def process_year(year: int):
-    year_folder = CLIMATE_ROOT / str(year)
-    if not year_folder.exists():
-        print(f"Pasta {year_folder} não existe.")
+def ensure_tables(con):
+    """Cria as tabelas de clima e metadados de estações, se ainda não existirem."""
+    for table, schema in (("clima", CLIMA_SCHEMA), ("metadados_estacoes", META_SCHEMA)):
+        cols = ", ".join(f"{c} {t}" for c, t in schema.items())
+        con.execute(f"CREATE TABLE IF NOT EXISTS {table} ({cols})")
+
+def insert_typed(con, table: str, schema: dict, df: pd.DataFrame):
+    """Insere o DataFrame na tabela convertendo cada coluna para o tipo do schema."""
+    df = df.reindex(columns=list(schema))
+    con.register("_batch", df)
+    try:
+        source_types = {name: col_type for name, col_type, *_ in con.execute("DESCRIBE _batch").fetchall()}
+
+        def cast_expr(c, t):
+            if t not in ("DOUBLE", MEASUREMENT_SQL_TYPE):
+                return f"TRY_CAST({c} AS {t})"
+            # Decimais com vírgula (ex.: latitude do cabeçalho) viram ponto antes do cast;
+            # medições que já chegam numéricas vão direto, sem passar por texto
+            if source_types.get(c) == "VARCHAR":
+                return f"TRY_CAST(REPLACE({c}, ',', '.') AS {t})"
+            return f"CAST({c} AS {t})"
+
+        exprs = ", ".join(cast_expr(c, t) for c, t in schema.items())
+        con.execute(f"INSERT INTO {table} SELECT {exprs} FROM _batch")
+    finally:
+        con.unregister("_batch")
+
+def upsert_station_files(con, entries):
+    """Substitui as linhas de um lote de CSVs de estação (chave: arquivo) e atualiza o
+    manifesto numa única transação. entries: lista de (fingerprint, df, meta_df, replace)."""
+    replaced = [Path(fp["path"]).name for fp, _, _, replace in entries if replace]
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if replaced:
+            con.execute("DELETE FROM clima WHERE list_contains(?, arquivo)", [replaced])
+            con.execute("DELETE FROM metadados_estacoes WHERE list_contains(?, arquivo)", [replaced])
+        insert_typed(con, "clima", CLIMA_SCHEMA, pd.concat([df for _, df, _, _ in entries], ignore_index=True))
+        metas = [meta_df for _, _, meta_df, _ in entries if not meta_df.empty]
+        if metas:
+            insert_typed(con, "metadados_estacoes", META_SCHEMA, pd.concat(metas, ignore_index=True))
+        for fingerprint, *_ in entries:
+            record_file(con, fingerprint)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+class ClimateWriter:
+    """Grava os arquivos parseados em lotes de até batch_rows linhas.
+
+    A memória do processo principal fica limitada a um lote, independente de
+    quantos anos ou estações estão sendo carregados.
+    """
+
+    def __init__(self, con, batch_rows: int = BATCH_ROWS):
+        self.con = con
+        self.batch_rows = batch_rows
+        self.entries = []
+        self.buffered_rows = 0
+        self.rows_written = 0
+        self.files_written = 0
+        self.files = []
+
+    def add(self, fingerprint: dict, df: pd.DataFrame, meta_df: pd.DataFrame, replace: bool):
+        self.entries.append((fingerprint, df, meta_df, replace))
+        self.buffered_rows += len(df)
+        if self.buffered_rows >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.entries:
+            return
+        try:
+            upsert_station_files(self.con, self.entries)
+            written = self.entries
+        except Exception as e:
+            # Isola o arquivo problemático: regrava o lote arquivo a arquivo
+            print(f"Falha ao gravar lote ({e}); gravando arquivo a arquivo.")
+            written = []
+            for entry in self.entries:
+                try:
+                    upsert_station_files(self.con, [entry])
+                    written.append(entry)
+                except Exception as e:
+                    print(f"Falha ao gravar {Path(entry[0]['path']).name}: {e}")
+        self.rows_written += sum(len(df) for _, df, _, _ in written)
+        self.files_written += len(written)
+        self.files += [Path(fp["path"]).name for fp, *_ in written]
+        self.entries = []
+        self.buffered_rows = 0
+
+def peak_rss_mb():
+    """Pico de memória residente (MB) do processo principal e dos workers já encerrados."""
+    if resource is None:
+        return None, None
+    # ru_maxrss vem em bytes no macOS e em KB no Linux
+    scale = 1 if sys.platform == "darwin" else 1024
+    main = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 2**20
+    return main, children
+
+def refresh_station_index(con):
+    """Atualiza o índice espacial das estações salvo ao lado do banco, usado pelo dashboard."""
+    estacoes = normalize_estacoes_meta(con.execute("SELECT * FROM metadados_estacoes").fetchdf())
+    if not estacoes.empty:
+        load_or_build_index(estacoes, index_path_for(DB_PATH))
+
+def refresh_station_subsystems(con):
+    """Mapeia cada estação ao subsistema da ONS (pela UF) e cria a view clima_subsistema."""
+    mapping = map_stations_to_subsystems(con.execute("SELECT arquivo, uf FROM metadados_estacoes").fetchdf())
+    con.register("_mapping", mapping)
+    try:
+        con.execute(f"CREATE OR REPLACE TABLE {STATION_SUBSYSTEM_TABLE} AS SELECT * FROM _mapping")
+    finally:
+        con.unregister("_mapping")
+    con.execute(
+        f"CREATE OR REPLACE VIEW {CLIMATE_SUBSYSTEM_VIEW} AS "
+        f"SELECT c.*, m.id_subsistema, m.nom_subsistema "
+        f"FROM clima c JOIN {STATION_SUBSYSTEM_TABLE} m USING (arquivo)"
+    )
+    n_stations = con.execute("SELECT count(DISTINCT arquivo) FROM metadados_estacoes").fetchone()[0]
+    if len(mapping) < n_stations:
+        print(f"{n_stations - len(mapping)} estações sem UF reconhecida ficaram fora dos subsistemas.")
+
+def parse_files(files, workers: int):
+    """Faz o parse dos CSVs em paralelo e devolve (arquivo, df, meta_df) conforme ficam prontos.
+
+    No máximo 2 * workers arquivos ficam em voo (parseados e ainda não consumidos),
+    para que um writer mais lento não acumule o ano inteiro em memória.
+    Com workers=1 o parse roda no próprio processo, sem pool.
+    """
+    if workers <= 1:
+        for f in files:
+            yield (f, *process_csv(f))
         return
 
-    conn = sqlite3.connect(DB_PATH)
+    files = iter(files)
+    max_in_flight = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for f in itertools.islice(files, max_in_flight):
+            futures[executor.submit(process_csv, f)] = f
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                f = futures.pop(future)
+                for nxt in itertools.islice(files, 1):
+                    futures[executor.submit(process_csv, nxt)] = nxt
+                try:
+                    df, meta_df = future.result()
+                except Exception as e:
+                    print(f"Falha ao processar {f.name}: {e}")
+                    continue
+                yield f, df, meta_df
+
+def process_years(years, workers: int = None, batch_rows: int = BATCH_ROWS):
+    """Carrega os CSVs de clima dos anos informados, parseando arquivos em paralelo.
 
-    csv_files = sorted([p for p in year_folder.iterdir() if p.suffix.lower() == ".csv"])
-    all_data = []
-    all_meta = []
-    for f in csv_files:
-        df, meta_df = process_csv(f)
-        if not df.empty:
-            all_data.append(df)
-        if not meta_df.empty:
-            all_meta.append(meta_df)
+    O parse (pandas, datas, strings) roda nos processos do pool; a gravação no DuckDB
+    fica no processo principal, que recebe os resultados em streaming e grava em lotes.
+    """
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
 
-    if all_data:
-        df_year = pd.concat(all_data, ignore_index=True)
-        df_year.to_sql("clima", conn, if_exists="replace", index=False)
-        print(f"{len(df_year)} linhas de dados métricos inseridas no banco para {year}.")
+    conn = duckdb.connect(str(DB_PATH))
+    ensure_tables(conn)
+    ensure_manifest(conn)
 
-    if all_meta:
-        meta_year = pd.concat(all_meta, ignore_index=True).drop_duplicates()
-        meta_year.to_sql("metadados_estacoes", conn, if_exists="replace", index=False)
-        print(f"{len(meta_year)} linhas de metadados de estações inseridas no banco para {year}.")
+    # Só arquivos novos ou alterados vão para o pool
+    pending = {}
+    skipped = 0
+    for year in years:
+        year_folder = CLIMATE_ROOT / str(year)
+        if not year_folder.exists():
+            print(f"Pasta {year_folder} não existe.")
+            continue
+        for f in sorted(p for p in year_folder.iterdir() if p.suffix.lower() == ".csv"):
+            status, fingerprint = check_file(conn, f)
+            if status == UNCHANGED:
+                skipped += 1
+            else:
+                pending[f] = (status, fingerprint)
 
+    writer = ClimateWriter(conn, batch_rows=batch_rows)
+    n_coerced = 0
+    for f, df, meta_df in parse_files(list(pending), workers):
+        n_coerced += df.attrs.get("linhas_descartadas", 0)
+        if df.empty:
+            # Não registra no manifesto: o arquivo será tentado de novo na próxima execução
+            continue
+        status, fingerprint = pending.pop(f)
+        # Arquivos novos não têm linhas antigas a remover: evita o DELETE
+        writer.add(fingerprint, df, meta_df, replace=status != NEW)
+    writer.flush()
+    if writer.files_written:
+        refresh_station_index(conn)
+    # Rollups hora/dia/semana/mês por estação (arquivo): só as estações regravadas são reagregadas
+    update_rollups(conn, "clima", "arquivo", writer.files)
+    # Clima por subsistema da ONS, derivado dos rollups por estação
+    if writer.files or not conn.execute(
+            "SELECT 1 FROM information_schema.tables WHERE table_name = ?", [STATION_SUBSYSTEM_TABLE]).fetchone():
+        refresh_station_subsystems(conn)
+        regroup_rollups(conn, "clima", CLIMATE_SUBSYSTEM_VIEW, STATION_SUBSYSTEM_TABLE,
+                        on="arquivo", keys=["id_subsistema", "nom_subsistema"])
     conn.close()
 
+    elapsed = time.perf_counter() - start
+    print(f"{writer.rows_written} linhas de dados métricos de {writer.files_written} arquivos "
+          f"inseridas no banco para {list(years)}.")
+    print(f"Tempo: {elapsed:.1f}s ({writer.rows_written / elapsed if elapsed else 0:,.0f} linhas/s).")
+    rss_main, rss_workers = peak_rss_mb()
+    if rss_main is not None:
+        print(f"Pico de memória (RSS): principal {rss_main:.0f} MB, workers {rss_workers:.0f} MB.")
+    if n_coerced:
+        print(f"{n_coerced} linhas descartadas por data/hora inválida.")
+    if skipped:
+        print(f"{skipped} arquivos sem alterações foram ignorados.")
+
+def process_year(year: int, workers: int = None):
+    process_years([year], workers=workers)
+
 if __name__ == "__main__":
-    process_year(2024)
-    print(DB_PATH)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Carrega CSVs de clima do INMET no DuckDB.")
+    parser.add_argument("years", nargs="*", type=int, default=[2024])
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processos para o parse dos CSVs (padrão: núcleos da máquina; 1 = serial)")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS,
+                        help="Linhas acumuladas por gravação no banco")
+    args = parser.parse_args()
+
+    process_years(args.years, workers=args.workers, batch_rows=args.batch_rows)
+    print(DB_PATH)
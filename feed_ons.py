@@ -1,16 +1,31 @@
-import os
-import sqlite3
+import re
+import duckdb
 import pandas as pd
 from pathlib import Path
 from glob import glob
 
+from compact_schema import MEASUREMENT_SQL_TYPE
+from data_dictionary import METADATA_TABLE, read_dict_csv, dict_records, dataset_from_dict_file
+from meta_normalize import read_meta_csv, normalize_usinameta, normalize_subestacaometa
+from manifest import ensure_manifest, check_file, record_file, UNCHANGED
+from rollups import refresh_rollups
+from online_anomaly import load_or_create_detector, state_path_for
+from util import build_table_query, quote_ident, table_columns, time_column, NUMERIC_TYPES
+
 # =========================
 # Configurações de paths
 # =========================
 BASE_ROOT = Path("/Users/eduardo/Git/ProjectONS/DatathONS-11/ONS-Base")
 DICT_ROOT = Path("/Users/eduardo/Git/ProjectONS/DatathONS-11/Dicts")
 ONS_ROOT = Path("/Users/eduardo/Git/ProjectONS/DatathONS-11")
-DB_PATH = Path("ons_simple1.db")
+DB_PATH = Path("ons.duckdb")
+
+# Arquivos da ONS seguem o padrão <dataset>_<ano>[_<mes>].parquet
+DATASET_PATTERN = re.compile(r"^(?P<dataset>.+?)_(?P<ano>\d{4})(?:_\d{2})?$")
+
+# Séries horárias acompanhadas pelo detector online (views por dataset)
+ONLINE_TABLES = ("curva_carga", "balanco_energia_subsistema")
+ONLINE_ALERTS_TABLE = "anomalias_online"
 
 # =========================
 # Funções auxiliares
@@ -20,85 +35,159 @@ def simplify_column_name(s):
     s = s.replace(" ", "_").replace("ç", "c").replace("ã","a").replace("í","i").replace("ó","o")
     return s
 
+def split_dataset_name(table_name: str):
+    """Separa o nome da tabela em (dataset, ano). Retorna ano=None se não houver."""
+    match = DATASET_PATTERN.match(table_name)
+    if not match:
+        return table_name, None
+    return match.group("dataset"), int(match.group("ano"))
+
+def typed_column_expr(col: str, col_type: str) -> str:
+    """Expressão SQL que converte a coluna para o tipo esperado pelo prefixo da ONS."""
+    ident = quote_ident(col)
+    if col.startswith("din_") and col_type != "TIMESTAMP":
+        return f"TRY_CAST({ident} AS TIMESTAMP) AS {ident}"
+    if (col.startswith("dat_") or col.endswith("_data")) and col_type != "DATE":
+        return f"TRY_CAST({ident} AS DATE) AS {ident}"
+    # Medições em FLOAT (float32, ver compact_schema)
+    if col.startswith("val_") and col_type == "VARCHAR":
+        return f"TRY_CAST(REPLACE({ident}, ',', '.') AS {MEASUREMENT_SQL_TYPE}) AS {ident}"
+    if col.startswith("val_") and col_type == "DOUBLE":
+        return f"CAST({ident} AS {MEASUREMENT_SQL_TYPE}) AS {ident}"
+    return ident
+
+def write_df(con, table_name: str, df: pd.DataFrame):
+    """Grava um DataFrame pequeno (metadados/dicionários) como tabela no DuckDB."""
+    con.register("_df_tmp", df)
+    try:
+        con.execute(f"CREATE OR REPLACE TABLE {quote_ident(table_name)} AS SELECT * FROM _df_tmp")
+    finally:
+        con.unregister("_df_tmp")
+
 # =========================
 # Funções de carregamento
 # =========================
-def load_parquet_to_sqlite(parquet_path: Path, conn):
-    """Carrega um parquet para uma tabela SQLite, mantendo nomes originais."""
-    df = pd.read_parquet(parquet_path)
+def load_parquet_to_duckdb(parquet_path: Path, con):
+    """Carrega um parquet para uma tabela DuckDB via read_parquet, sem passar pelo pandas."""
     table_name = parquet_path.stem.lower()
+    source = str(parquet_path)
+
+    # Tipagem das colunas a partir do schema do próprio parquet
+    schema = con.execute("DESCRIBE SELECT * FROM read_parquet(?)", [source]).fetchall()
+    select_cols = ", ".join(typed_column_expr(name, col_type) for name, col_type, *_ in schema)
+
+    con.execute(
+        f"CREATE OR REPLACE TABLE {quote_ident(table_name)} AS "
+        f"SELECT {select_cols} FROM read_parquet(?)",
+        [source],
+    )
+    n_rows = con.execute(f"SELECT count(*) FROM {quote_ident(table_name)}").fetchone()[0]
+    print(f"Tabela '{table_name}' criada com {n_rows} registros.")
+
+    return table_name, [name for name, *_ in schema]
 
-    # Converte datas para datetime
-    if "din_instante" in df.columns:
-        df["din_instante"] = pd.to_datetime(df["din_instante"], errors="coerce")
+def create_dataset_views(con, changed=None):
+    """Cria uma view por dataset unindo as tabelas anuais (partições dataset/ano).
 
-    # Salva no SQLite
-    df.to_sql(table_name, conn, if_exists="replace", index=False)
-    print(f"Tabela '{table_name}' criada com {len(df)} registros.")
+    Com ``changed``, só são (re)criadas as views que incluem alguma dessas tabelas
+    ou que ainda não existem; as demais ficam intocadas (o mtime do banco não muda).
+    Retorna {dataset: [tabelas das partições]}.
+    """
+    tables = [row[0] for row in con.execute(
+        "SELECT table_name FROM information_schema.tables WHERE table_type = 'BASE TABLE'"
+    ).fetchall()]
+    existing = {row[0] for row in con.execute(
+        "SELECT table_name FROM information_schema.tables WHERE table_type = 'VIEW'"
+    ).fetchall()}
 
-    return table_name, df.columns.tolist()
+    partitions = {}
+    for table_name in tables:
+        dataset, ano = split_dataset_name(table_name)
+        if ano is not None and dataset not in tables:
+            partitions.setdefault(dataset, []).append((ano, table_name))
+
+    for dataset, parts in partitions.items():
+        if changed is not None and dataset in existing \
+                and not {table_name for _, table_name in parts} & set(changed):
+            continue
+        union = " UNION ALL BY NAME ".join(
+            f"SELECT *, {ano} AS ano FROM {quote_ident(table_name)}"
+            for ano, table_name in sorted(parts)
+        )
+        con.execute(f"CREATE OR REPLACE VIEW {quote_ident(dataset)} AS {union}")
+        print(f"View '{dataset}' criada com {len(parts)} partições anuais.")
+
+    return {dataset: [table_name for _, table_name in parts] for dataset, parts in partitions.items()}
+
+def refresh_energy_rollups(con, parquet_tables, changed):
+    """Rollups hora/dia/semana/mês das tabelas de energia e das views por dataset.
+
+    Só são refeitos os das tabelas carregadas nesta execução e das views que as incluem;
+    sem alterações nada é escrito, para não invalidar o cache keyed no mtime do banco.
+    """
+    if not changed:
+        return
+    views = create_dataset_views(con, changed)
+    changed_views = [dataset for dataset, parts in views.items() if set(parts) & set(changed)]
+    refresh_rollups(con, [*changed, *changed_views], changed=[*changed, *changed_views])
 
 def load_dicts(conn):
-    """Carrega dicionários de variáveis e cria tabela de metadados."""
-    meta_all = []
-    for dict_file in DICT_ROOT.glob("*.csv"):
+    """Carrega dicionários de variáveis e cria tabela de metadados (dataset, variavel, descricao)."""
+    # A tabela metadata junta todos os dicionários: só é refeita se algum mudou
+    # (ou se ainda está no formato antigo, sem a coluna dataset)
+    dict_files = sorted(DICT_ROOT.glob("*.csv"))
+    checks = [check_file(conn, dict_file) for dict_file in dict_files]
+    exists = conn.execute(
+        "SELECT 1 FROM information_schema.tables WHERE table_name = ?", [METADATA_TABLE]).fetchone()
+    if all(status == UNCHANGED for status, _ in checks) and exists \
+            and "dataset" in table_columns(conn, METADATA_TABLE):
+        return
+
+    meta_all, parsed = [], []
+    for dict_file, (_, fingerprint) in zip(dict_files, checks):
         try:
-            df_dict = pd.read_csv(dict_file, sep=None, engine="python", encoding="latin1")
-            if "Código" in df_dict.columns and "Descrição" in df_dict.columns:
-                for _, row in df_dict.iterrows():
-                    if pd.notna(row["Código"]):
-                        meta_all.append({
-                            "variavel": row["Código"],
-                            "descricao": row["Descrição"]
-                        })
+            meta_all.append(dict_records(read_dict_csv(dict_file), dataset_from_dict_file(dict_file)))
+            parsed.append(fingerprint)
         except Exception as e:
+            # Fora do manifesto: o arquivo é tentado de novo na próxima execução
             print(f"Erro ao ler dicionário {dict_file.name}: {e}")
 
-    if meta_all:
-        pd.DataFrame(meta_all).to_sql("metadata", conn, if_exists="replace", index=False)
-        print(f"{len(meta_all)} registros de metadados inseridos.")
+    metadata = pd.concat(meta_all, ignore_index=True) if meta_all else pd.DataFrame()
+    if not metadata.empty:
+        write_df(conn, METADATA_TABLE, metadata)
+        for fingerprint in parsed:
+            record_file(conn, fingerprint)
+        print(f"{len(metadata)} registros de metadados inseridos "
+              f"({metadata['dataset'].nunique()} datasets).")
 
 def process_usinameta(file_path: Path):
-    """Processa metadados de usinas, separando tipo, latitude e longitude."""
+    """Processa metadados de usinas: tipo, latitude/longitude validadas, nome e UF."""
     try:
-        df = pd.read_csv(file_path, sep=";", encoding="latin1", decimal=",")
+        df = read_meta_csv(file_path)
     except Exception:
         print(f"Falha ao ler {file_path.name}")
         return pd.DataFrame()
 
-    df.columns = [simplify_column_name(c) for c in df.columns]
-
-    if "tipo_de_usina,x,y" in df.columns:
-        tipo_xy = df["tipo_de_usina,x,y"].str.split(",", n=2, expand=True)
-        df["tipo_usina_descr"] = tipo_xy[0].str.strip()
-        df["latitude"] = pd.to_numeric(tipo_xy[1], errors="coerce")
-        df["longitude"] = pd.to_numeric(tipo_xy[2], errors="coerce")
-        df = df.drop(columns=["tipo_de_usina,x,y"])
-
-    return df
+    return normalize_usinameta(df)
 
 def process_subestacaometa(file_path: Path):
-    """Processa metadados de subestações, separando latitude e longitude."""
+    """Processa metadados de subestações: latitude/longitude validadas, nome e UF."""
     try:
-        df = pd.read_csv(file_path, sep=";", encoding="latin1")
+        df = read_meta_csv(file_path)
     except Exception:
         print(f"Falha ao ler {file_path.name}")
         return pd.DataFrame()
 
-    df.columns = [simplify_column_name(c) for c in df.columns]
-
-    if "data_entrada,x,y" in df.columns:
-        xy = df["data_entrada,x,y"].str.split(",", n=1, expand=True)
-        df["longitude"] = pd.to_numeric(xy[0], errors="coerce")
-        df["latitude"] = pd.to_numeric(xy[1], errors="coerce")
-        df = df.drop(columns=["data_entrada,x,y"])
-
-    return df
+    return normalize_subestacaometa(df)
 
 def load_metadata(conn):
     """Carrega metadados de usinas e subestações diretamente para o banco."""
     meta_files = glob(str(ONS_ROOT / "*Meta.csv"))
     for file_path in meta_files:
+        status, fingerprint = check_file(conn, Path(file_path))
+        if status == UNCHANGED:
+            continue
+
         table_name = Path(file_path).stem.lower()
         if "usina" in table_name:
             df = process_usinameta(Path(file_path))
@@ -108,21 +197,122 @@ def load_metadata(conn):
             df = pd.read_csv(file_path, delimiter=";", encoding="latin1")
 
         if not df.empty:
-            df.to_sql(table_name, conn, if_exists="replace", index=False)
+            write_df(conn, table_name, df)
+            record_file(conn, fingerprint)
             print(f"Tabela '{table_name}' criada com {len(df)} registros.")
 
+def ingest_parquet(parquet_path: Path, conn) -> bool:
+    """Carrega o parquet apenas se for novo ou tiver mudado desde a última execução.
+
+    A tabela do arquivo é substituída e o manifesto atualizado na mesma transação,
+    então uma falha no meio não deixa o manifesto apontando para dados parciais.
+    """
+    status, fingerprint = check_file(conn, parquet_path)
+    if status == UNCHANGED:
+        return False
+
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        load_parquet_to_duckdb(parquet_path, conn)
+        record_file(conn, fingerprint)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return True
+
+def run_online_detector(con, tables=ONLINE_TABLES):
+    """Passa as linhas novas das séries horárias pelo detector online e grava os alertas.
+
+    O estado do detector (O(1) por série) fica salvo ao lado do banco; cada execução
+    lê só as linhas depois do último instante já visto de cada tabela.
+    """
+    detector = load_or_create_detector(state_path_for(DB_PATH))
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {ONLINE_ALERTS_TABLE} ("
+        "tabela VARCHAR, variavel VARCHAR, subsistema VARCHAR, data_hora TIMESTAMP, "
+        "valor DOUBLE, baseline DOUBLE, score DOUBLE)"
+    )
+    n_alerts = 0
+    for table_name in tables:
+        try:
+            schema = table_columns(con, table_name)
+        except ValueError:
+            continue
+        values = [c for c, t in schema.items() if c.startswith("val_") and t.startswith(NUMERIC_TYPES)]
+        keys = [c for c in ("id_subsistema", "nom_subsistema") if c in schema][:1]
+        time_col = time_column(schema)
+        if not values or time_col is None:
+            continue
+
+        seen = [ts for key, state in detector.series.items() if key[0] == table_name
+                for ts in [state.last_ts] if ts is not None]
+        sql, params = build_table_query(con, table_name, columns=[*keys, *values], time_col=time_col,
+                                        start=min(seen) if seen else None)
+        df = con.execute(sql, params).fetchdf()
+        records = detector.consume(df, time_col, values, key_cols=keys, prefix=(table_name,))
+        alerts = records[records["alert"]]
+        if not alerts.empty:
+            out = pd.DataFrame({
+                "tabela": table_name,
+                "variavel": alerts["x"],
+                "subsistema": alerts[keys[0]].astype(str) if keys else None,
+                "data_hora": alerts["timestamp"],
+                "valor": alerts["anomaly"],
+                "baseline": alerts["baseline"],
+                "score": alerts["score"],
+            })
+            con.register("_alerts", out)
+            try:
+                con.execute(f"INSERT INTO {ONLINE_ALERTS_TABLE} SELECT * FROM _alerts")
+            finally:
+                con.unregister("_alerts")
+            n_alerts += len(out)
+        if len(records):
+            print(f"Detector online: {len(records)} linhas novas de '{table_name}', {len(alerts)} alertas.")
+
+    detector.save(state_path_for(DB_PATH))
+    return n_alerts
+
 # =========================
 # Função principal
 # =========================
-def main():
-    conn = sqlite3.connect(DB_PATH)
+def ingest_parquet_files(conn, parquet_files):
+    """Ingestão completa de uma lista de parquets: tabelas, views/rollups e alertas online.
 
-    # Processa arquivos parquet da ONS
-    for parquet_file in BASE_ROOT.glob("*.parquet"):
+    Arquivos sem alteração (manifesto) são pulados. Retorna (tabelas, tabelas alteradas).
+    """
+    skipped = 0
+    parquet_tables, changed = [], []
+    for parquet_file in parquet_files:
+        parquet_file = Path(parquet_file)
         try:
-            load_parquet_to_sqlite(parquet_file, conn)
+            if ingest_parquet(parquet_file, conn):
+                changed.append(parquet_file.stem.lower())
+            else:
+                skipped += 1
+            parquet_tables.append(parquet_file.stem.lower())
         except Exception as e:
             print(f"Erro ao processar {parquet_file.name}: {e}")
+    if skipped:
+        print(f"{skipped} arquivos parquet sem alterações foram ignorados.")
+
+    if not changed:
+        return parquet_tables, changed
+
+    # Views por dataset (só as que incluem tabelas alteradas) e rollups hora/dia/semana/mês
+    refresh_energy_rollups(conn, parquet_tables, changed)
+
+    # Alertas online das séries horárias (só linhas ainda não vistas pelo detector)
+    run_online_detector(conn)
+    return parquet_tables, changed
+
+def main():
+    conn = duckdb.connect(str(DB_PATH))
+    ensure_manifest(conn)
+
+    # Processa apenas arquivos parquet da ONS novos ou alterados
+    ingest_parquet_files(conn, BASE_ROOT.glob("*.parquet"))
 
     # Carrega dicionários
     load_dicts(conn)
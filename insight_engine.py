@@ -0,0 +1,425 @@
+import os
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+from scipy.special import betainc
+from scipy.stats import spearmanr
+from sklearn.feature_selection import mutual_info_regression
+from statsmodels.tsa.stattools import adfuller, grangercausalitytests
+
+# =========================
+# Correlação com defasagem (lag) em lote
+# =========================
+# Versão importável do compute_pair_metrics do engine.ipynb. Em vez de, para cada
+# par e cada lag, fazer shift + concat + dropna + pearsonr, todas as somas de
+# Pearson (n, Σx, Σy, Σx², Σy², Σxy) de todos os pares são obtidas por produtos
+# de matrizes sobre a máscara de valores válidos: um passe por lag para todos os pares.
+
+def lagged_pearson(X, Y, max_lag=24):
+    """Pearson entre X[t - lag] e Y[t] para todo par de colunas e lag em 0..max_lag.
+
+    X: (n, p), Y: (n, q), com NaN onde falta dado. Cada (lag, par) usa só as linhas
+    em que os dois valores existem, como `pd.concat([x.shift(lag), y]).dropna()`.
+    Retorna (r, n_obs), ambos com forma (max_lag + 1, p, q).
+    """
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    n = X.shape[0]
+
+    mask_x = ~np.isnan(X)
+    mask_y = ~np.isnan(Y)
+    # r não muda com deslocamento: centralizar reduz o cancelamento nas somas
+    X0 = np.where(mask_x, X, 0.0)
+    Y0 = np.where(mask_y, Y, 0.0)
+    X0 = np.where(mask_x, X0 - X0.sum(axis=0) / np.maximum(mask_x.sum(axis=0), 1), 0.0)
+    Y0 = np.where(mask_y, Y0 - Y0.sum(axis=0) / np.maximum(mask_y.sum(axis=0), 1), 0.0)
+    Mx = mask_x.astype(np.float64)
+    My = mask_y.astype(np.float64)
+
+    n_lags = max_lag + 1
+    r = np.full((n_lags, X.shape[1], Y.shape[1]), np.nan)
+    n_obs = np.zeros((n_lags, X.shape[1], Y.shape[1]), dtype=np.int64)
+    for lag in range(min(n_lags, n)):
+        a, ma = X0[:n - lag], Mx[:n - lag]
+        b, mb = Y0[lag:], My[lag:]
+        cnt = ma.T @ mb
+        sx = a.T @ mb
+        sy = ma.T @ b
+        sxx = (a * a).T @ mb
+        syy = ma.T @ (b * b)
+        sxy = a.T @ b
+        cov = cnt * sxy - sx * sy
+        var = (cnt * sxx - sx ** 2) * (cnt * syy - sy ** 2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            r[lag] = np.clip(cov / np.sqrt(var), -1.0, 1.0)
+        r[lag][var <= 0] = np.nan
+        n_obs[lag] = np.rint(cnt).astype(np.int64)
+    return r, n_obs
+
+def pearson_pvalue(r, n):
+    """p-valor bicaudal de Pearson (mesma distribuição beta usada por scipy.stats.pearsonr)."""
+    r = np.asarray(r, dtype=np.float64)
+    n = np.asarray(n, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p = betainc((n - 2) / 2, 0.5, np.clip(1 - r ** 2, 0, 1))
+    return np.where(n > 2, p, np.nan)
+
+def lag_correlations(df, x_cols, y_cols, max_lag=24, min_periods=30):
+    """Tabela longa (x, y, lag, corr, pvalue, n) de todos os pares energia x clima.
+
+    Lags com menos de `min_periods` observações válidas são omitidos, como no notebook.
+    """
+    r, n_obs = lagged_pearson(df[list(x_cols)].to_numpy(dtype=np.float64),
+                              df[list(y_cols)].to_numpy(dtype=np.float64), max_lag=max_lag)
+    lag_idx, xi, yi = np.nonzero(n_obs >= min_periods)
+    corr = r[lag_idx, xi, yi]
+    n = n_obs[lag_idx, xi, yi]
+    out = pd.DataFrame({
+        'x': np.asarray(x_cols, dtype=object)[xi],
+        'y': np.asarray(y_cols, dtype=object)[yi],
+        'lag': lag_idx,
+        'corr': corr,
+        'pvalue': pearson_pvalue(corr, n),
+        'n': n,
+    })
+    return out.sort_values(['x', 'y', 'lag'], kind='stable').reset_index(drop=True)
+
+def add_mutual_info(df, results, mi_top_n=None):
+    """Preenche a coluna 'mi' (mutual_info_regression) de `results`.
+
+    Com mi_top_n, o MI (caro) só é calculado para os mi_top_n lags de maior |corr|
+    de cada par; os demais ficam NaN.
+    """
+    results = results.copy()
+    results['mi'] = np.nan
+    if results.empty:
+        return results
+    if mi_top_n is not None:
+        order = results['corr'].abs().sort_values(ascending=False, na_position='last').index
+        chosen = results.loc[order].groupby(['x', 'y'], sort=False).head(mi_top_n).index
+    else:
+        chosen = results.index
+    for i in chosen:
+        x_col, y_col, lag = results.at[i, 'x'], results.at[i, 'y'], results.at[i, 'lag']
+        pair = pd.concat([df[x_col].shift(lag), df[y_col]], axis=1).dropna()
+        try:
+            results.at[i, 'mi'] = mutual_info_regression(
+                pair.iloc[:, 0].values.reshape(-1, 1), pair.iloc[:, 1].values, random_state=0)[0]
+        except Exception:
+            results.at[i, 'mi'] = np.nan
+    return results
+
+def compute_pair_metrics(df, x_col, y_col, max_lag=24, corr_method='pearson', mi_top_n=None):
+    """Métricas por lag de um par (mesma saída do compute_pair_metrics do notebook).
+
+    Pearson usa o kernel em lote; Spearman precisa ranquear cada recorte e segue no laço.
+    """
+    if corr_method == 'pearson':
+        results = lag_correlations(df, [x_col], [y_col], max_lag=max_lag)
+    else:
+        records = []
+        xs, ys = df[x_col], df[y_col]
+        for lag in range(0, max_lag + 1):
+            pair = pd.concat([xs.shift(lag), ys], axis=1).dropna()
+            if len(pair) < 30:
+                continue
+            try:
+                r, p = spearmanr(pair.iloc[:, 0], pair.iloc[:, 1])
+            except Exception:
+                r, p = np.nan, np.nan
+            records.append({'x': x_col, 'y': y_col, 'lag': lag, 'corr': r, 'pvalue': p, 'n': len(pair)})
+        results = pd.DataFrame(records, columns=['x', 'y', 'lag', 'corr', 'pvalue', 'n'])
+    results = add_mutual_info(df, results, mi_top_n=mi_top_n)
+    return results[['x', 'y', 'lag', 'corr', 'pvalue', 'mi', 'n']]
+
+# =========================
+# Correlação por janelas (estabilidade)
+# =========================
+# Substitui os laços `for start in range(0, len(df) - w, w): seg = x[...].corr(y[...])`
+# do notebook: as mesmas somas de Pearson são tiradas de somas acumuladas (prefix
+# sums) ou, para janelas sem sobreposição, de somas por bloco; tudo vetorizado e para
+# vários pares de uma vez.
+
+def window_correlations(X, Y, window, step=None):
+    """Pearson de cada janela [start, start + window) para cada par (coluna de X, coluna de Y).
+
+    X: (n, p), Y: (n, q). Como Series.corr, cada janela usa só as linhas em que os dois
+    valores existem. Janelas começam em range(0, n - window, step), igual ao notebook
+    (step padrão = window, janelas sem sobreposição). Retorna (r, starts), r com forma
+    (n_janelas, p, q); NaN onde há menos de 2 pontos ou variância nula.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    if X.ndim == 1:
+        X = X[:, None]
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    n = X.shape[0]
+    step = step or window
+    starts = np.arange(0, n - window, step)
+    if len(starts) == 0:
+        return np.empty((0, X.shape[1], Y.shape[1])), starts
+
+    mask_x = ~np.isnan(X)
+    mask_y = ~np.isnan(Y)
+    X0 = np.where(mask_x, X, 0.0)
+    Y0 = np.where(mask_y, Y, 0.0)
+    X0 = np.where(mask_x, X0 - X0.sum(axis=0) / np.maximum(mask_x.sum(axis=0), 1), 0.0)
+    Y0 = np.where(mask_y, Y0 - Y0.sum(axis=0) / np.maximum(mask_y.sum(axis=0), 1), 0.0)
+    Mx = mask_x.astype(np.float64)
+    My = mask_y.astype(np.float64)
+
+    def window_sums(a, b):
+        # (n, p) x (n, q) -> somas por janela de a[:, i] * b[:, j]: (n_janelas, p, q)
+        prod = a[:, :, None] * b[:, None, :]
+        if step == window:
+            # Janelas sem sobreposição: reshape em blocos, sem o erro de arredondamento
+            # acumulado das somas prefixadas
+            blocks = prod[:len(starts) * window].reshape(len(starts), window, *prod.shape[1:])
+            return blocks.sum(axis=1)
+        csum = np.concatenate([np.zeros((1, *prod.shape[1:])), np.cumsum(prod, axis=0)])
+        return csum[starts + window] - csum[starts]
+
+    cnt = window_sums(Mx, My)
+    sx = window_sums(X0, My)
+    sy = window_sums(Mx, Y0)
+    sxx = window_sums(X0 * X0, My)
+    syy = window_sums(Mx, Y0 * Y0)
+    sxy = window_sums(X0, Y0)
+
+    cov = cnt * sxy - sx * sy
+    var = (cnt * sxx - sx ** 2) * (cnt * syy - sy ** 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = np.clip(cov / np.sqrt(var), -1.0, 1.0)
+    # Variância ~0 por arredondamento das somas acumuladas conta como constante
+    tol = 1e-12 * np.maximum(cnt * sxx, 1) * np.maximum(cnt * syy, 1)
+    r[(cnt < 2) | (var <= tol)] = np.nan
+    return r, starts
+
+def window_signs(X, Y, window, step=None):
+    """Sinal da correlação por janela (0 onde a correlação é NaN), como compute_stability."""
+    r, starts = window_correlations(X, Y, window, step)
+    return np.where(np.isnan(r), 0.0, np.sign(r)), starts
+
+def correlation_stability(X, Y, reference, window, step=None):
+    """Fração das janelas em que o sinal da correlação concorda com `reference`.
+
+    reference: (p, q) com a correlação de referência de cada par (ex.: a do melhor lag).
+    Retorna (p, q); 0 quando não há nenhuma janela, como no extract_insights original.
+    """
+    signs, starts = window_signs(X, Y, window, step)
+    if len(starts) == 0:
+        return np.zeros(np.shape(reference))
+    return (signs == np.sign(np.asarray(reference))[None]).mean(axis=0)
+
+# =========================
+# Agendador de pares para extract_insights
+# =========================
+# Score de um par (igual ao extract_insights do notebook):
+#   0.5 * |corr| + 0.2 * (1 - pvalue) + 0.2 * mi / max(mi) + 0.1 * stability
+# corr, pvalue e stability saem baratos dos kernels vetorizados acima para todos os
+# pares (score parcial). Como o termo de MI vale no máximo 0.2, um par cujo score
+# parcial + 0.2 fica abaixo do k-ésimo maior score parcial nunca chega ao top_k: com
+# poda, o MI (caro) só roda para os pares que passam por esse corte, limitados a
+# MI_CANDIDATE_FACTOR * top_k, e max(mi) é tomado entre eles. Granger (e o ADF,
+# opcional), que não entram no score, só rodam para os pares do top_k.
+
+INSIGHT_COLUMNS = ['x', 'y', 'lag', 'corr', 'pvalue', 'mi', 'n', 'stability',
+                   'granger_p', 'granger_lag', 'score']
+STATIONARITY_COLUMNS = ['x_estacionaria', 'y_estacionaria']
+TEST_COLUMNS = ['granger_p', 'granger_lag']
+
+# Pares (em múltiplos de top_k) que vão para o MI depois da triagem por correlação
+MI_CANDIDATE_FACTOR = 3
+
+def insight_columns(stationarity=False):
+    """Colunas do resultado de extract_insights (com o ADF, as de estacionariedade antes do score)."""
+    if not stationarity:
+        return list(INSIGHT_COLUMNS)
+    return INSIGHT_COLUMNS[:-1] + STATIONARITY_COLUMNS + INSIGHT_COLUMNS[-1:]
+
+def is_stationary(series, alpha=0.05):
+    # ADF test: True se estacionária
+    series = pd.Series(series).dropna()
+    if len(series) < 20:
+        return False
+    stat, p, *_ = adfuller(series, maxlag=12, autolag='AIC')
+    return p < alpha
+
+def granger_pairs(df, x_col, y_col, maxlag=6):
+    # Granger: does x -> y ?
+    data = df[[y_col, x_col]].dropna()
+    if len(data) < maxlag*5:
+        return None
+    try:
+        res = grangercausalitytests(data, maxlag=maxlag, verbose=False)
+        # pick best lag by p-value of F-test
+        pvals = {lag: res[lag][0]['ssr_ftest'][1] for lag in res}
+        best_lag = min(pvals, key=pvals.get)
+        return {'x': x_col, 'y': y_col, 'best_lag': best_lag, 'pvalue': pvals[best_lag]}
+    except Exception:
+        return None
+
+def _pair_mutual_info(x, y, lag):
+    """MI de x[t - lag] com y[t], executado nos processos do pool."""
+    pair = pd.concat([pd.Series(x).shift(lag), pd.Series(y)], axis=1).dropna()
+    try:
+        return mutual_info_regression(pair.iloc[:, 0].values.reshape(-1, 1), pair.iloc[:, 1].values,
+                                      random_state=0)[0]
+    except Exception:
+        return np.nan
+
+def _pair_tests(x, y, granger_maxlag, stationarity):
+    """Granger x -> y e, se pedido, ADF das duas séries, executados nos processos do pool."""
+    g = granger_pairs(pd.DataFrame({'x': x, 'y': y}), 'x', 'y', maxlag=granger_maxlag)
+    tests = {
+        'granger_p': g['pvalue'] if g else np.nan,
+        'granger_lag': g['best_lag'] if g else np.nan,
+    }
+    if stationarity:
+        tests['x_estacionaria'] = is_stationary(x)
+        tests['y_estacionaria'] = is_stationary(y)
+    return tests
+
+def _run_pairs(executor, fn, tasks, failed):
+    """Gera (chave, resultado) de fn(*args) para cada (chave, args) de `tasks`, na ordem em
+    que terminam. Sem executor roda em série; uma falha vira `failed`."""
+    if executor is None:
+        for key, args in tasks:
+            yield key, fn(*args)
+        return
+    futures = {executor.submit(fn, *args): key for key, args in tasks}
+    while futures:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            key = futures.pop(future)
+            try:
+                yield key, future.result()
+            except Exception as e:
+                print(f"Falha ao avaliar {key}: {e}")
+                yield key, failed
+
+def score_insights(records, columns=None, mi_max=None):
+    """Aplica o score do notebook. mi_max: normalizador do MI (padrão: maior MI em `records`)."""
+    columns = columns or INSIGHT_COLUMNS
+    dfr = pd.DataFrame(records, columns=[c for c in columns if c != 'score'])
+    df_nonan = dfr.fillna(0)
+    if mi_max is None:
+        mi_max = df_nonan['mi'].max()
+    df_nonan['score'] = (df_nonan['corr'].abs() * 0.5 +
+                         (1 - df_nonan['pvalue'].clip(0, 1)) * 0.2 +
+                         (df_nonan['mi'] / (mi_max + 1e-9)) * 0.2 +
+                         df_nonan['stability'] * 0.1)
+    return df_nonan.sort_values(['score', 'x', 'y'], ascending=[False, True, True], kind='stable')
+
+def screen_pairs(df, energy_cols, climate_cols, max_lag=24, window_size=24*7):
+    """Etapa barata para todos os pares: melhor lag por |corr|, p-valor, n, estabilidade e
+    score parcial (o score sem o termo de MI)."""
+    lags = lag_correlations(df, energy_cols, climate_cols, max_lag=max_lag)
+    if lags.empty:
+        return lags.assign(stability=[], partial_score=[])
+    best = (lags.assign(corr_abs=lags['corr'].abs())
+                .sort_values(['x', 'y', 'corr_abs'], ascending=[True, True, False], kind='stable')
+                .drop_duplicates(['x', 'y'])
+                .drop(columns='corr_abs')
+                .reset_index(drop=True))
+
+    # Estabilidade: a referência de cada par é a correlação do seu melhor lag
+    reference = (best.pivot(index='x', columns='y', values='corr')
+                     .reindex(index=list(energy_cols), columns=list(climate_cols)))
+    stability = correlation_stability(df[list(energy_cols)].values, df[list(climate_cols)].values,
+                                      reference.fillna(0).values, window_size)
+    stability = pd.DataFrame(stability, index=reference.index, columns=reference.columns)
+    best['stability'] = [stability.at[x, y] for x, y in zip(best['x'], best['y'])]
+
+    best['partial_score'] = (best['corr'].abs().fillna(0) * 0.5 +
+                             (1 - best['pvalue'].fillna(0).clip(0, 1)) * 0.2 +
+                             best['stability'] * 0.1)
+    return best
+
+def mi_candidates(screened, top_k, factor=MI_CANDIDATE_FACTOR):
+    """Pares da triagem que ainda podem entrar no top_k (score parcial + 0.2 alcança o
+    k-ésimo maior score parcial), no máximo factor * top_k, do maior score parcial ao menor."""
+    ranked = screened.sort_values('partial_score', ascending=False, kind='stable')
+    if len(ranked) > top_k:
+        threshold = ranked['partial_score'].iloc[top_k - 1]
+        ranked = ranked[ranked['partial_score'] + 0.2 >= threshold]
+    return ranked.head(max(top_k, factor * top_k))
+
+def iter_insights(df, energy_cols, climate_cols, max_lag=24, top_k=20, window_size=24*7,
+                  workers=None, prune=True, stationarity=False):
+    """Avalia os pares energia x clima e devolve o top_k parcial conforme as etapas avançam.
+
+    Gerador de DataFrames (colunas insight_columns(stationarity)) com o top_k:
+    primeiro o da triagem por correlação (mi e testes ainda NaN, score = score
+    parcial), depois um a cada MI concluído, o ranking final antes dos testes e um a
+    cada Granger/ADF concluído (testes pendentes ficam NaN). O último é o resultado final.
+    prune=True: MI só para mi_candidates e Granger/ADF só para o top_k; prune=False
+        avalia todos os pares, como o extract_insights do notebook.
+    stationarity: inclui o teste ADF de cada série (x_estacionaria, y_estacionaria),
+        que o extract_insights do notebook não rodava.
+    workers: processos do pool (padrão: núcleos da máquina; 1 = serial).
+    """
+    columns = insight_columns(stationarity)
+    test_columns = TEST_COLUMNS + (STATIONARITY_COLUMNS if stationarity else [])
+    screened = screen_pairs(df, energy_cols, climate_cols, max_lag=max_lag, window_size=window_size)
+    if screened.empty:
+        yield pd.DataFrame(columns=columns)
+        return
+
+    def with_tests(ranked, done):
+        # top_k do ranking com os testes já concluídos; pendentes ficam NaN
+        top = ranked.head(top_k).copy()
+        for c in test_columns:
+            top[c] = [(0 if pd.isna(done[k][c]) else done[k][c]) if k in done else np.nan for k in top.index]
+        return top
+
+    rows = screened.drop(columns='partial_score').to_dict('records')
+    yield with_tests(score_insights(rows, columns, mi_max=0), {})
+
+    # Fora dos candidatos nenhum par alcança o top_k: só eles seguem para MI e testes
+    candidates = [rows[i] for i in (mi_candidates(screened, top_k).index if prune else screened.index)]
+    series = {c: df[c].to_numpy(dtype=np.float64) for c in {*screened['x'], *screened['y']}}
+    granger_maxlag = min(6, max_lag)
+    failed_tests = {'granger_p': np.nan, 'granger_lag': np.nan,
+                    **({c: False for c in STATIONARITY_COLUMNS} if stationarity else {})}
+
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and len(candidates) > 1 else nullcontext()
+    with pool as executor:
+        mi_tasks = [(k, (series[row['x']], series[row['y']], int(row['lag']))) for k, row in enumerate(candidates)]
+        for n_done, (k, mi) in enumerate(_run_pairs(executor, _pair_mutual_info, mi_tasks, np.nan), 1):
+            candidates[k]['mi'] = mi
+            if n_done < len(mi_tasks):
+                yield with_tests(score_insights(candidates, columns), {})
+
+        # Ranking final, entregue antes dos testes; Granger/ADF só para o top_k (ou todos, sem poda)
+        mi_max = pd.Series([row['mi'] for row in candidates], dtype=np.float64).fillna(0).max()
+        ranked = score_insights(candidates, columns, mi_max)
+        yield with_tests(ranked, {})
+        tested = ranked.index[:top_k] if prune else ranked.index
+        test_tasks = [(k, (series[candidates[k]['x']], series[candidates[k]['y']], granger_maxlag, stationarity))
+                      for k in tested]
+        done = {}
+        for k, tests in _run_pairs(executor, _pair_tests, test_tasks, failed_tests):
+            done[k] = tests
+            if len(done) < len(test_tasks):
+                yield with_tests(ranked, done)
+    yield score_insights([{**candidates[k], **done[k]} for k in done], columns, mi_max).head(top_k)
+
+def extract_insights(df, energy_cols, climate_cols, freq='H',
+                     max_lag=24, corr_method='pearson', top_k=20, workers=None, prune=True,
+                     stationarity=False):
+    """Top_k pares energia x clima (versão final de iter_insights).
+
+    Só Pearson tem o kernel vetorizado; corr_method é mantido por compatibilidade.
+    """
+    if corr_method != 'pearson':
+        raise ValueError("extract_insights vetorizado suporta apenas corr_method='pearson'")
+    result = pd.DataFrame(columns=insight_columns(stationarity))
+    for result in iter_insights(df, energy_cols, climate_cols, max_lag=max_lag, top_k=top_k,
+                                workers=workers, prune=prune, stationarity=stationarity):
+        pass
+    return result
@@ -1,83 +1,93 @@
+import asyncio
+import hashlib
+import json
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import pandas as pd
 import numpy as np
-from langchain_community.llms import Ollama
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
 
 # -------------------------
 # 1️⃣ Preparar resumo agregado com estatísticas robustas e histórico por estação/ano
 # -------------------------
-def prepare_aggregated_anomaly_summary_v3(df_energy, df_clima, anomalies, time_col):
+SEASON_MAP = {1: 'Verão', 2: 'Outono', 3: 'Inverno', 4: 'Primavera'}
+
+# Colunas booleanas que marcam as anomalias de fato (anomaly_store / online_anomaly)
+ANOMALY_FLAG_COLUMNS = ('is_anomaly', 'alert')
+
+def _season(index):
+    return index.month % 12 // 3 + 1
+
+def prepare_aggregated_anomaly_summary_v3(df_energy, df_clima, anomalies, time_col, flag_col=None):
+    """Resumo por par (x, y): estatísticas globais, histórico por ano/estação e a lista de
+    anomalias com z-scores relativos à mesma estação/ano.
+
+    Só entram as linhas marcadas como anomalia (flag_col, ou a primeira de
+    ANOMALY_FLAG_COLUMNS presente); sem coluna de marcação, todas as linhas contam.
+    """
     summaries = []
 
     anomalies = anomalies.copy()
     anomalies['timestamp'] = anomalies[time_col]
+    flag_col = flag_col or next((c for c in ANOMALY_FLAG_COLUMNS if c in anomalies.columns), None)
+    if flag_col is not None:
+        anomalies = anomalies[anomalies[flag_col].astype(bool)]
 
     grouped = anomalies.groupby(['x', 'y'])
     for (x, y), group in grouped:
-        ts_energy = df_energy[[x]].copy()
-        ts_clima = df_clima[[y]].copy()
-
+        ts_energy = df_energy[x]
+        ts_clima = df_clima[y]
         ts_energy = ts_energy[~ts_energy.index.duplicated(keep='first')]
         ts_clima = ts_clima[~ts_clima.index.duplicated(keep='first')]
 
         common_index = ts_energy.index.intersection(ts_clima.index)
-        ts_energy = ts_energy.loc[common_index]
-        ts_clima = ts_clima.loc[common_index]
+        pair = pd.DataFrame({'energy': ts_energy.loc[common_index], 'clima': ts_clima.loc[common_index]})
 
         # Estatísticas globais
         energy_stats = {
-            'mean': ts_energy[x].mean(),
-            'std': ts_energy[x].std(),
-            'min': ts_energy[x].min(),
-            'max': ts_energy[x].max(),
+            'mean': pair['energy'].mean(),
+            'std': pair['energy'].std(),
+            'min': pair['energy'].min(),
+            'max': pair['energy'].max(),
         }
         clima_stats = {
-            'mean': ts_clima[y].mean(),
-            'std': ts_clima[y].std(),
-            'min': ts_clima[y].min(),
-            'max': ts_clima[y].max(),
+            'mean': pair['clima'].mean(),
+            'std': pair['clima'].std(),
+            'min': pair['clima'].min(),
+            'max': pair['clima'].max(),
         }
 
-        # Histórico por estação e ano
-        df_energy_hist = ts_energy.copy()
-        df_clima_hist = ts_clima.copy()
-        df_energy_hist['year'] = df_energy_hist.index.year
-        df_energy_hist['season'] = (df_energy_hist.index.month % 12 // 3 + 1)
-        df_clima_hist['year'] = df_clima_hist.index.year
-        df_clima_hist['season'] = (df_clima_hist.index.month % 12 // 3 + 1)
-        season_map = {1: 'Verão', 2: 'Outono', 3: 'Inverno', 4: 'Primavera'}
-
-        # Agrupa por estação/ano para comparar com anomalias
-        hist_stats = {}
-        for (year, season), _ in df_energy_hist.groupby(['year', 'season']):
-            key = f"{year}-{season_map[season]}"
-            hist_stats[key] = {
-                'energy_mean': df_energy_hist.loc[(df_energy_hist.year==year) & (df_energy_hist.season==season), x].mean(),
-                'energy_std': df_energy_hist.loc[(df_energy_hist.year==year) & (df_energy_hist.season==season), x].std(),
-                'clima_mean': df_clima_hist.loc[(df_clima_hist.year==year) & (df_clima_hist.season==season), y].mean(),
-                'clima_std': df_clima_hist.loc[(df_clima_hist.year==year) & (df_clima_hist.season==season), y].std(),
-            }
-
-        # Lista de anomalias com Z-scores
-        anomaly_list = []
-        for _, a in group.iterrows():
-            ts_year = a['timestamp'].year
-            ts_season = (a['timestamp'].month % 12 // 3 + 1)
-            key = f"{ts_year}-{season_map[ts_season]}"
-            e_mean = hist_stats[key]['energy_mean']
-            e_std = hist_stats[key]['energy_std']
-            c_mean = hist_stats[key]['clima_mean']
-            c_std = hist_stats[key]['clima_std']
-            anomaly_list.append({
-                'timestamp': a['timestamp'],
-                'value_energy': a['anomaly'],
-                'score': a['score'],
-                'z_energy': (a['anomaly'] - e_mean)/e_std if e_std else np.nan,
-                'z_clima': (ts_clima.loc[a['timestamp'], y] - c_mean)/c_std if c_std else np.nan,
-                'year': ts_year,
-                'season': season_map[ts_season]
-            })
+        # Histórico por estação e ano: uma única agregação agrupada
+        hist = pair.groupby([pair.index.year.rename('year'), _season(pair.index).rename('season')]).agg(
+            energy_mean=('energy', 'mean'), energy_std=('energy', 'std'),
+            clima_mean=('clima', 'mean'), clima_std=('clima', 'std'),
+        )
+        hist_stats = {
+            f"{year}-{SEASON_MAP[season]}": values
+            for (year, season), values in zip(hist.index, hist.to_dict('records'))
+        }
+
+        # Anomalias com Z-scores: merge com o histórico da mesma estação/ano
+        timestamps = pd.DatetimeIndex(group['timestamp'])
+        found = pd.DataFrame({
+            'timestamp': group['timestamp'].to_numpy(),
+            'value_energy': group['anomaly'].to_numpy(),
+            'score': group['score'].to_numpy(),
+            'year': timestamps.year,
+            'season': _season(timestamps),
+            'clima': pair['clima'].reindex(timestamps).to_numpy(),
+        }).merge(hist, left_on=['year', 'season'], right_index=True, how='left')
+
+        e_std = found['energy_std'].where(found['energy_std'] != 0)
+        c_std = found['clima_std'].where(found['clima_std'] != 0)
+        found['z_energy'] = (found['value_energy'] - found['energy_mean']) / e_std
+        found['z_clima'] = (found['clima'] - found['clima_mean']) / c_std
+        found['season'] = found['season'].map(SEASON_MAP)
+        anomaly_list = found[['timestamp', 'value_energy', 'score', 'z_energy', 'z_clima',
+                              'year', 'season']].to_dict('records')
 
         summaries.append({
             'x': x,
@@ -91,38 +101,125 @@ def prepare_aggregated_anomaly_summary_v3(df_energy, df_clima, anomalies, time_c
     return pd.DataFrame(summaries)
 
 # -------------------------
-# 2️⃣ Flatten para LLM
+# 2️⃣ Flatten para LLM (compacto, dentro de um orçamento de tokens)
 # -------------------------
-def flatten_aggregated_summary_v3(df_summary):
+# O modelo local é pequeno: cada token de prompt custa latência. As anomalias viram
+# episódios (dias consecutivos agrupados), ordenados por severidade (maior |z|), com
+# números arredondados; entram episódios até o orçamento acabar. O histórico por
+# estação vai numa tabela curta, só com as estações dos episódios incluídos.
+TOKEN_BUDGET = 1200
+EPISODE_GAP = pd.Timedelta(days=1)
+
+def count_tokens(text):
+    """Estimativa de tokens (palavras, números e pontuação); troque por um tokenizer real se houver."""
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+def _fmt(value, digits=4):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return "nd"
+    return f"{value:.{digits}g}"
+
+def _fmt_ts(ts, hourly):
+    return ts.strftime("%Y-%m-%d %H:%M" if hourly else "%Y-%m-%d")
+
+def anomaly_episodes(anomalies, gap=EPISODE_GAP):
+    """Agrupa anomalias (lista de dicts do resumo) em episódios de instantes consecutivos.
+
+    Duplicatas de instante são removidas; o pico de cada episódio é a anomalia de
+    maior severidade = max(|z_energy|, |z_clima|).
+    """
+    df = pd.DataFrame(anomalies)
+    if df.empty:
+        return df
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df['severity'] = df[['z_energy', 'z_clima']].abs().max(axis=1).fillna(0)
+    df = (df.sort_values(['timestamp', 'severity'], ascending=[True, False])
+            .drop_duplicates('timestamp')
+            .reset_index(drop=True))
+    df['episode'] = (df['timestamp'].diff() > gap).cumsum()
+    peaks = df.loc[df.groupby('episode')['severity'].idxmax()].set_index('episode')
+    bounds = df.groupby('episode')['timestamp'].agg(start='min', end='max', n='size')
+    return bounds.join(peaks).sort_values('severity', ascending=False)
+
+def compact_anomalies(row, token_budget=TOKEN_BUDGET, token_counter=count_tokens):
+    """(anomalies_text, seasonal_table, n_tokens) de um par do resumo, dentro de token_budget."""
+    episodes = anomaly_episodes(row['anomalies'])
+    if episodes.empty:
+        text = "Nenhuma anomalia."
+        return text, "", token_counter(text)
+    hourly = bool((episodes['timestamp'].dt.normalize() != episodes['timestamp']).any())
+    hist = row['historical_stats']
+
+    header = "estação | energia média±desvio | clima média±desvio"
+    used = token_counter(header)
+    kept, table = [], {}
+    for ep in episodes.itertuples():
+        values = (f"energia={_fmt(ep.value_energy)} z_energia={_fmt(ep.z_energy, 2)} "
+                  f"z_clima={_fmt(ep.z_clima, 2)} score={_fmt(ep.score, 3)}")
+        if ep.n == 1:
+            line = f"{_fmt_ts(ep.timestamp, hourly)} ({ep.season} {ep.year}): {values}"
+        else:
+            line = (f"{_fmt_ts(ep.start, hourly)}→{_fmt_ts(ep.end, hourly)} ({ep.n} anomalias, {ep.season} {ep.year}): "
+                    f"pico {_fmt_ts(ep.timestamp, hourly)} {values}")
+        cost = token_counter(line)
+        season_key = f"{ep.year}-{ep.season}"
+        season_line = None
+        if season_key not in table and season_key in hist:
+            h = hist[season_key]
+            season_line = (f"{ep.season} {ep.year} | {_fmt(h['energy_mean'])}±{_fmt(h['energy_std'], 3)} | "
+                           f"{_fmt(h['clima_mean'])}±{_fmt(h['clima_std'], 3)}")
+            cost += token_counter(season_line)
+        # O episódio mais severo sempre entra; os demais só enquanto couberem
+        if kept and used + cost > token_budget:
+            break
+        kept.append((ep.start, line))
+        if season_line is not None:
+            table[season_key] = (ep.start, season_line)
+        used += cost
+
+    omitted = len(episodes) - len(kept)
+    lines = [line for _, line in sorted(kept)]
+    if omitted:
+        note = f"(+{omitted} episódios menos severos omitidos)"
+        lines.append(note)
+        used += token_counter(note)
+    seasonal_table = "\n".join([header] + [line for _, line in sorted(table.values())])
+    return "\n".join(lines), seasonal_table, used
+
+def flatten_aggregated_summary_v3(df_summary, token_budget=TOKEN_BUDGET, token_counter=count_tokens):
+    """Uma linha por par com estatísticas arredondadas e anomalias compactadas.
+
+    n_tokens: tokens (token_counter) do trecho de anomalias + tabela sazonal gerado.
+    """
     rows = []
     for _, row in df_summary.iterrows():
-        anomalies_text = "\n".join([
-            f"{a['timestamp']} ({a['season']} {a['year']}): energy={a['value_energy']}, score={a['score']}, z_energy={a['z_energy']:.2f}, z_clima={a['z_clima']:.2f}"
-            for a in row['anomalies']
-        ])
+        anomalies_text, seasonal_table, n_tokens = compact_anomalies(row, token_budget, token_counter)
         flat_row = {
             'x': row['x'],
             'y': row['y'],
-            'energy_mean': row['energy_stats']['mean'],
-            'energy_std': row['energy_stats']['std'],
-            'energy_min': row['energy_stats']['min'],
-            'energy_max': row['energy_stats']['max'],
-            'clima_mean': row['clima_stats']['mean'],
-            'clima_std': row['clima_stats']['std'],
-            'clima_min': row['clima_stats']['min'],
-            'clima_max': row['clima_stats']['max'],
-            'anomalies_text': anomalies_text
+            'energy_mean': _fmt(row['energy_stats']['mean']),
+            'energy_std': _fmt(row['energy_stats']['std']),
+            'energy_min': _fmt(row['energy_stats']['min']),
+            'energy_max': _fmt(row['energy_stats']['max']),
+            'clima_mean': _fmt(row['clima_stats']['mean']),
+            'clima_std': _fmt(row['clima_stats']['std']),
+            'clima_min': _fmt(row['clima_stats']['min']),
+            'clima_max': _fmt(row['clima_stats']['max']),
+            'anomalies_text': anomalies_text,
+            'seasonal_table': seasonal_table,
+            'n_tokens': n_tokens,
         }
         rows.append(flat_row)
     return pd.DataFrame(rows)
 
 # -------------------------
-# 3️⃣ Interpretar agregado com Ollama + LangChain
+# 3️⃣ Interpretar agregado com Ollama (assíncrono, concorrente e com cache)
 # -------------------------
-def interpret_aggregated_anomaly_with_ollama_v3(df_summary):
-    df_flat = flatten_aggregated_summary_v3(df_summary)
+DEFAULT_MODEL = "qwen2:1.5b"
+MAX_CONCURRENCY = 2
+LLM_CACHE_DIR = Path("llm_cache")
 
-    prompt_text = """
+PROMPT_TEMPLATE = """
 Você é um analista de dados especializado em energia e clima. Interprete o resumo agregado:
 
 Variável de Energia: {x}
@@ -132,10 +229,13 @@ Estatísticas globais:
 - Energia: média={energy_mean}, std={energy_std}, min={energy_min}, max={energy_max}
 - Clima: média={clima_mean}, std={clima_std}, min={clima_min}, max={clima_max}
 
-Anomalias detectadas:
+Histórico da mesma estação/ano (média±desvio):
+{seasonal_table}
+
+Episódios de anomalia (mais severos; z = desvios da média da estação):
 {anomalies_text}
 
-Para cada anomalia, discuta:
+Para cada episódio, discuta:
 1. O impacto potencial na produção e consumo de energia.
 2. Possíveis causas relacionadas à estação do ano, padrões climáticos ou extremos de temperatura.
 3. Comparação com histórico similar (mesma estação e ano).
@@ -145,20 +245,165 @@ Para cada anomalia, discuta:
 Produza uma interpretação detalhada, estruturada e confiável.
     """
 
-    prompt = PromptTemplate(
-        template=prompt_text,
-        input_variables=list(df_flat.columns)
-    )
+def build_prompts(df_summary, token_budget=TOKEN_BUDGET, token_counter=count_tokens):
+    """Um prompt por par (x, y) do resumo agregado; df_flat['prompt_tokens'] traz o total de cada um."""
+    df_flat = flatten_aggregated_summary_v3(df_summary, token_budget, token_counter)
+    prompts = [PROMPT_TEMPLATE.format(**row) for row in df_flat.to_dict('records')]
+    df_flat['prompt_tokens'] = [token_counter(p) for p in prompts]
+    return df_flat, prompts
 
-    llm = Ollama(model="qwen2:1.5b")
-    chain = LLMChain(llm=llm, prompt=prompt)
+def default_llm(model=DEFAULT_MODEL):
+    # Import tardio: o módulo funciona sem langchain quando a LLM é injetada (ex.: stub local)
+    from langchain_community.llms import Ollama
+    return Ollama(model=model)
 
-    results = []
-    for _, row in df_flat.iterrows():
-        interpretation = chain.run(row.to_dict())
-        results.append({
-            'x': row['x'],
-            'y': row['y'],
-            'interpretation': interpretation
-        })
-    return pd.DataFrame(results)
+class LLMCache:
+    """Cache em disco endereçado por conteúdo: um JSON por sha256(modelo, prompt)."""
+
+    def __init__(self, root=LLM_CACHE_DIR):
+        self.root = Path(root)
+
+    @staticmethod
+    def key(model, prompt):
+        return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def _path(self, model, prompt):
+        return self.root / f"{self.key(model, prompt)}.json"
+
+    def get(self, model, prompt):
+        path = self._path(model, prompt)
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)["text"]
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+
+    def put(self, model, prompt, text):
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(model, prompt)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"model": model, "prompt_hash": self.key(model, prompt), "text": text}, f, ensure_ascii=False)
+        tmp.replace(path)
+
+class InterpretationService:
+    """Chamadas à LLM com concorrência limitada, cache persistente e callback por token.
+
+    llm: objeto com `astream(prompt)` (iterador assíncrono de trechos de texto) ou
+    `invoke(prompt)`; padrão é o Ollama do langchain. Para testes basta um stub local.
+    on_token(i, trecho): chamado a cada trecho gerado para o i-ésimo prompt (no cache,
+    uma única vez com o texto inteiro).
+    """
+
+    def __init__(self, llm=None, model=DEFAULT_MODEL, cache_dir=LLM_CACHE_DIR, max_concurrency=MAX_CONCURRENCY):
+        self.model = model
+        self.llm = llm if llm is not None else default_llm(model)
+        self.cache = LLMCache(cache_dir) if cache_dir is not None else None
+        self.max_concurrency = max_concurrency
+
+    async def _generate(self, prompt, on_token):
+        if hasattr(self.llm, "astream"):
+            chunks = []
+            async for chunk in self.llm.astream(prompt):
+                chunk = getattr(chunk, "content", chunk)
+                chunks.append(chunk)
+                on_token(chunk)
+            return "".join(chunks)
+        text = await asyncio.to_thread(self.llm.invoke, prompt)
+        text = getattr(text, "content", text)
+        on_token(text)
+        return text
+
+    async def ainterpret(self, prompt, on_token=None, semaphore=None):
+        on_token = on_token or (lambda chunk: None)
+        cached = self.cache.get(self.model, prompt) if self.cache else None
+        if cached is not None:
+            on_token(cached)
+            return cached
+        if semaphore is None:
+            text = await self._generate(prompt, on_token)
+        else:
+            async with semaphore:
+                text = await self._generate(prompt, on_token)
+        if self.cache:
+            self.cache.put(self.model, prompt, text)
+        return text
+
+    async def ainterpret_many(self, prompts, on_token=None):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = [
+            self.ainterpret(prompt, None if on_token is None else (lambda chunk, i=i: on_token(i, chunk)), semaphore)
+            for i, prompt in enumerate(prompts)
+        ]
+        return await asyncio.gather(*tasks)
+
+    def interpret_many(self, prompts, on_token=None):
+        """Versão síncrona de ainterpret_many (Streamlit, scripts ou notebook)."""
+        return run_sync(self.ainterpret_many(prompts, on_token))
+
+    def stream(self, prompt):
+        """Gerador síncrono dos trechos conforme a LLM gera (ex.: para st.write_stream).
+
+        A geração roda num loop asyncio em outra thread; os trechos chegam por uma fila,
+        então o primeiro aparece assim que o modelo o produz.
+        """
+        chunks = queue.Queue()
+        done = object()
+
+        def worker():
+            try:
+                asyncio.run(self.ainterpret(prompt, on_token=chunks.put))
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                chunks.put(done)
+
+        threading.Thread(target=worker, daemon=True).start()
+        while True:
+            item = chunks.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+def run_sync(coro):
+    """Executa a corrotina mesmo se já houver um loop rodando nesta thread (ex.: Jupyter)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+_default_service = None
+
+def get_default_service():
+    global _default_service
+    if _default_service is None:
+        _default_service = InterpretationService()
+    return _default_service
+
+def stream_aggregated_anomaly_interpretation(df_summary, service=None):
+    """Trechos da interpretação de cada par do resumo, na ordem, conforme são gerados."""
+    _, prompts = build_prompts(df_summary)
+    return stream_interpretations(prompts, service)
+
+def stream_interpretations(prompts, service=None):
+    """Trechos da interpretação de cada prompt (de build_prompts), em sequência."""
+    service = service or get_default_service()
+    for i, prompt in enumerate(prompts):
+        if i:
+            yield "\n\n"
+        yield from service.stream(prompt)
+
+def interpret_aggregated_anomaly_with_ollama_v3(df_summary, service=None, on_token=None):
+    """Interpreta cada par do resumo; pares repetidos saem do cache sem chamar a LLM."""
+    service = service or get_default_service()
+    df_flat, prompts = build_prompts(df_summary)
+    texts = service.interpret_many(prompts, on_token=on_token)
+    return pd.DataFrame({
+        'x': df_flat['x'] if len(df_flat) else [],
+        'y': df_flat['y'] if len(df_flat) else [],
+        'interpretation': texts,
+    })
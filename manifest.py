@@ -0,0 +1,72 @@
+import hashlib
+from datetime import datetime
+from pathlib import Path
+
+# =========================
+# Manifesto de ingestão
+# =========================
+# Registra path, tamanho, mtime e hash de cada arquivo já carregado no banco,
+# para que novas execuções só processem arquivos novos ou alterados.
+MANIFEST_TABLE = "ingest_manifest"
+
+NEW = "new"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+
+def ensure_manifest(con):
+    """Cria a tabela de manifesto no banco DuckDB, se ainda não existir."""
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+            path VARCHAR PRIMARY KEY,
+            size BIGINT,
+            mtime DOUBLE,
+            sha256 VARCHAR,
+            ingested_at TIMESTAMP
+        )
+    """)
+
+def file_hash(path: Path, chunk_size: int = 1 << 20) -> str:
+    """Calcula o SHA-256 do conteúdo do arquivo lendo em blocos."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def check_file(con, path: Path):
+    """Compara o arquivo com o manifesto. Retorna (status, fingerprint).
+
+    O hash só é calculado quando tamanho ou mtime mudaram, então reexecuções
+    sobre arquivos intocados custam apenas um stat.
+    """
+    path = Path(path).resolve()
+    st = path.stat()
+    fingerprint = {"path": str(path), "size": st.st_size, "mtime": st.st_mtime, "sha256": None}
+
+    row = con.execute(
+        f"SELECT size, mtime, sha256 FROM {MANIFEST_TABLE} WHERE path = ?", [str(path)]
+    ).fetchone()
+    if row is None:
+        return NEW, fingerprint
+
+    size, mtime, sha256 = row
+    if size == st.st_size and mtime == st.st_mtime:
+        fingerprint["sha256"] = sha256
+        return UNCHANGED, fingerprint
+
+    fingerprint["sha256"] = file_hash(path)
+    if fingerprint["sha256"] == sha256:
+        # Só o mtime mudou (ex.: cópia/touch): atualiza o manifesto sem recarregar
+        record_file(con, fingerprint)
+        return UNCHANGED, fingerprint
+    return CHANGED, fingerprint
+
+def record_file(con, fingerprint: dict):
+    """Grava (ou atualiza) a entrada do arquivo no manifesto."""
+    if fingerprint["sha256"] is None:
+        fingerprint["sha256"] = file_hash(Path(fingerprint["path"]))
+    con.execute(
+        f"INSERT OR REPLACE INTO {MANIFEST_TABLE} VALUES (?, ?, ?, ?, ?)",
+        [fingerprint["path"], fingerprint["size"], fingerprint["mtime"],
+         fingerprint["sha256"], datetime.now()],
+    )
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+# =========================
+# Normalização de metadados de usinas e subestações (ONS)
+# =========================
+# Roda uma vez na ingestão (feed_ons.load_metadata); o dashboard lê a tabela já limpa.
+
+# Caixa que contém o território brasileiro (mesma usada no mapa do dashboard)
+LAT_MIN, LAT_MAX = -35.0, 5.0
+LON_MIN, LON_MAX = -75.0, -34.0
+
+# "<valor>,<x>,<y>": colunas fundidas do export do ArcGIS (x = longitude, y = latitude)
+FUSED_XY_PATTERN = r"^(?P<valor>.*?),\s*(?P<x>[-+]?[\d.]+(?:[eE][-+]?\d+)?)\s*,\s*(?P<y>[-+]?[\d.]+(?:[eE][-+]?\d+)?)\s*$"
+
+# "NOME DA INSTALAÇÃO            UF       " -> nome + UF
+NOME_UF_PATTERN = r"^(?P<nome>.*?)\s{2,}(?P<uf>[A-Z]{2})$"
+
+def simplify_column_name(s):
+    s = s.lower().strip()
+    s = s.replace(" ", "_").replace("ç", "c").replace("ã","a").replace("í","i").replace("ó","o")
+    return s
+
+def read_meta_csv(file_path: Path) -> pd.DataFrame:
+    """Lê o CSV de metadados (UTF-8 com BOM; cai para latin1 em exports antigos)."""
+    try:
+        return pd.read_csv(file_path, sep=";", encoding="utf-8-sig", dtype=str)
+    except UnicodeDecodeError:
+        return pd.read_csv(file_path, sep=";", encoding="latin1", dtype=str)
+
+def strip_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """Remove o preenchimento com espaços de todas as colunas texto; vazios viram NA."""
+    df = df.copy()
+    for col in df.columns:
+        s = df[col]
+        # Colunas object com NaN não passam em is_string_dtype (pandas 2)
+        if pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s):
+            df[col] = s.str.strip().replace("", pd.NA)
+    return df
+
+def split_fused_xy(series: pd.Series) -> pd.DataFrame:
+    """Separa "<valor>,x,y" em valor, longitude e latitude."""
+    parts = series.str.extract(FUSED_XY_PATTERN)
+    return pd.DataFrame({
+        "valor": parts["valor"].str.strip().replace("", pd.NA),
+        "longitude": pd.to_numeric(parts["x"], errors="coerce"),
+        "latitude": pd.to_numeric(parts["y"], errors="coerce"),
+    }, index=series.index)
+
+def split_nome_uf(series: pd.Series) -> pd.DataFrame:
+    """Separa o nome da UF que vem colada ao final (após espaços de preenchimento)."""
+    parts = series.str.strip().str.extract(NOME_UF_PATTERN)
+    nome = parts["nome"].fillna(series.str.strip())
+    return pd.DataFrame({
+        "nome": nome.str.replace(r"\s+", " ", regex=True),
+        "uf": parts["uf"],
+    }, index=series.index)
+
+def in_brazil(lat, lon):
+    return (lat >= LAT_MIN) & (lat <= LAT_MAX) & (lon >= LON_MIN) & (lon <= LON_MAX)
+
+def fix_coordinates(df: pd.DataFrame) -> pd.DataFrame:
+    """Valida latitude/longitude contra a caixa do Brasil, desinverte pares trocados e
+    preenche os inválidos com o centroide dos válidos.
+
+    Adiciona coord_status: "ok", "invertida" (lat/lon trocados e corrigidos) ou
+    "imputada" (faltante ou fora do Brasil; recebeu o centroide).
+    """
+    df = df.copy()
+    lat = df["latitude"].to_numpy(dtype=float)
+    lon = df["longitude"].to_numpy(dtype=float)
+
+    ok = in_brazil(lat, lon)
+    swapped = ~ok & in_brazil(lon, lat)
+    lat, lon = np.where(swapped, lon, lat), np.where(swapped, lat, lon)
+    invalid = ~(ok | swapped)
+
+    if (~invalid).any():
+        central_lat, central_lon = lat[~invalid].mean(), lon[~invalid].mean()
+    else:
+        central_lat, central_lon = -14.235, -51.9253
+    df["latitude"] = np.where(invalid, central_lat, lat)
+    df["longitude"] = np.where(invalid, central_lon, lon)
+    df["coord_status"] = np.select([swapped, invalid], ["invertida", "imputada"], "ok")
+    return df
+
+def parse_dates(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte colunas data_* (dd/mm/aaaa) para datetime."""
+    df = df.copy()
+    for col in [c for c in df.columns if c.startswith("data_")]:
+        df[col] = pd.to_datetime(df[col], format="%d/%m/%Y", errors="coerce")
+    return df
+
+def normalize_meta(df: pd.DataFrame, fused_col: str, valor_col: str) -> pd.DataFrame:
+    """Pipeline comum: nomes de colunas, strings, coluna x/y fundida, nome/UF, datas e coordenadas."""
+    df = df.copy()
+    df.columns = [simplify_column_name(c) for c in df.columns]
+    df = strip_strings(df)
+
+    if fused_col in df.columns:
+        xy = split_fused_xy(df[fused_col])
+        df[valor_col] = xy["valor"]
+        df["latitude"] = xy["latitude"]
+        df["longitude"] = xy["longitude"]
+        df = df.drop(columns=[fused_col])
+
+    if "nome" in df.columns:
+        nome_uf = split_nome_uf(df["nome"].fillna(""))
+        df["nome"] = nome_uf["nome"].replace("", pd.NA)
+        df["uf"] = nome_uf["uf"]
+
+    if "objectid" in df.columns:
+        df["objectid"] = pd.to_numeric(df["objectid"], errors="coerce").astype("Int64")
+
+    df = parse_dates(df)
+    if "latitude" in df.columns:
+        df = fix_coordinates(df)
+    return df
+
+def normalize_usinameta(df: pd.DataFrame) -> pd.DataFrame:
+    """UsinaMeta.csv: "Tipo de Usina,x,y" vira tipo_usina_descr + latitude/longitude."""
+    return normalize_meta(df, "tipo_de_usina,x,y", "tipo_usina_descr")
+
+def normalize_subestacaometa(df: pd.DataFrame) -> pd.DataFrame:
+    """SubEstacaoMeta.csv: "Data Entrada,x,y" vira data_entrada.1 + latitude/longitude."""
+    return normalize_meta(df, "data_entrada,x,y", "data_entrada.1")
@@ -0,0 +1,144 @@
+import math
+import pickle
+from pathlib import Path
+
+import pandas as pd
+
+# =========================
+# Detector de anomalias online (séries horárias da ONS)
+# =========================
+# Para cada série (tabela, variável, subsistema) o estado é fixo: uma média EWMA e um
+# desvio absoluto médio EWMA por hora do dia (baseline sazonal) + contadores. Cada linha
+# nova atualiza o estado em O(1), sem reajustar nada sobre o ano inteiro.
+#
+# score = |valor - média da hora| / escala da hora, com escala = GAUSS_SCALE * desvio
+# absoluto médio (z-score robusto: o desvio absoluto cresce linearmente com um pico, não
+# ao quadrado como a variância, e o valor entra na atualização limitado a
+# média ± CLIP * escala, então um pico não contamina o baseline).
+
+ALPHA = 0.05          # peso da observação nova em cada hora do dia (~20 dias de memória)
+THRESHOLD = 5.0       # score a partir do qual a linha vira alerta
+CLIP = 3.0            # winsorização da atualização, em desvios
+WARMUP = 14           # observações por hora do dia antes de emitir alertas
+SEASON_LENGTH = 24    # slots do baseline sazonal (hora do dia)
+# Desvio absoluto médio -> desvio padrão numa normal: E|X - μ| = σ * sqrt(2 / π)
+GAUSS_SCALE = math.sqrt(math.pi / 2)
+
+ANOMALY_COLUMNS = ["x", "y", "anomaly", "score", "timestamp", "alert", "baseline"]
+
+class SeriesState:
+    """Estado O(1) de uma série: média e desvio absoluto médio EWMA por slot sazonal."""
+
+    __slots__ = ("mean", "dev", "count", "last_ts")
+
+    def __init__(self, season_length: int = SEASON_LENGTH):
+        self.mean = [0.0] * season_length
+        self.dev = [0.0] * season_length
+        self.count = [0] * season_length
+        self.last_ts = None
+
+    def update(self, slot: int, value: float, alpha: float = ALPHA, clip: float = CLIP):
+        """Pontua `value` contra o baseline do slot e atualiza o baseline. Retorna (score, baseline)."""
+        n = self.count[slot]
+        mean, dev = self.mean[slot], self.dev[slot]
+        if n == 0:
+            self.mean[slot], self.count[slot] = value, 1
+            return 0.0, value
+
+        scale = GAUSS_SCALE * dev
+        score = abs(value - mean) / scale if scale > 0 else 0.0
+        # Winsorização: picos entram no baseline limitados a mean ± clip * scale
+        if scale > 0:
+            value = min(max(value, mean - clip * scale), mean + clip * scale)
+        # Nas primeiras observações usa média simples (alpha efetivo 1/n) até estabilizar
+        a = max(alpha, 1.0 / (n + 1))
+        diff = value - mean
+        self.mean[slot] = mean + a * diff
+        self.dev[slot] = (1 - a) * dev + a * abs(diff)
+        self.count[slot] = n + 1
+        return score, mean
+
+class OnlineDetector:
+    """Detector online para várias séries; estado serializável (pickle) entre execuções."""
+
+    def __init__(self, alpha: float = ALPHA, threshold: float = THRESHOLD, clip: float = CLIP,
+                 warmup: int = WARMUP, season_length: int = SEASON_LENGTH):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.clip = clip
+        self.warmup = warmup
+        self.season_length = season_length
+        self.series = {}
+
+    def slot(self, ts) -> int:
+        return ts.hour % self.season_length
+
+    def update(self, key, ts, value):
+        """Consome uma linha da série `key`. Retorna (score, alerta, baseline) ou None se a
+        linha já foi vista (ts <= último instante) ou o valor falta."""
+        state = self.series.get(key)
+        if state is None:
+            state = self.series[key] = SeriesState(self.season_length)
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return None
+        if state.last_ts is not None and ts <= state.last_ts:
+            return None
+        slot = self.slot(ts)
+        warmed = state.count[slot] >= self.warmup
+        score, baseline = state.update(slot, float(value), self.alpha, self.clip)
+        state.last_ts = ts
+        return score, warmed and score >= self.threshold, baseline
+
+    def last_timestamp(self, key):
+        state = self.series.get(key)
+        return state.last_ts if state is not None else None
+
+    def consume(self, df: pd.DataFrame, time_col: str, value_cols, key_cols=(), prefix=(), pair=None):
+        """Consome um DataFrame (ordenado por tempo dentro de cada série) e devolve os registros
+        no formato de prepare_aggregated_anomaly_summary_v3: x, y, anomaly (valor), score,
+        timestamp, alert e baseline. Linhas já vistas são ignoradas.
+
+        key_cols: colunas que separam séries (ex.: id_subsistema); prefix: prefixo da chave
+        (ex.: nome da tabela); pair: {variável de energia: variável de clima} para a coluna y.
+        Sem par, y repete o nome da variável: prepare_aggregated_anomaly_summary_v3 agrupa
+        por (x, y) e descartaria linhas com y nulo.
+        """
+        pair = pair or {}
+        df = df.sort_values(time_col)
+        times = pd.to_datetime(df[time_col])
+        keys = list(zip(*(df[c] for c in key_cols))) if key_cols else [()] * len(df)
+        records = []
+        for col in value_cols:
+            for ts, key, value in zip(times, keys, df[col].tolist()):
+                result = self.update((*prefix, col, *key), ts, value)
+                if result is None:
+                    continue
+                score, alert, baseline = result
+                records.append((col, pair.get(col, col), value, score, ts, alert, baseline, *key))
+        return pd.DataFrame(records, columns=[*ANOMALY_COLUMNS, *key_cols])
+
+    def save(self, path):
+        path = Path(path)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(self, f)
+        tmp.replace(path)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+def state_path_for(db_path) -> Path:
+    """Estado do detector salvo ao lado do banco da ONS (ex.: ons.online_detector.pkl)."""
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.stem}.online_detector.pkl")
+
+def load_or_create_detector(path, **params) -> OnlineDetector:
+    path = Path(path)
+    if path.exists():
+        try:
+            return OnlineDetector.load(path)
+        except Exception as e:
+            print(f"Estado do detector online inválido em {path}: {e}")
+    return OnlineDetector(**params)
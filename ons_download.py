@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html.parser import HTMLParser
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+
+import duckdb
+import requests
+
+import feed_ons
+from manifest import ensure_manifest
+
+# =========================
+# Download dos dados abertos da ONS (dados.ons.org.br)
+# =========================
+# - Links de cada dataset lidos da página do dataset (mesmo seletor do dev.ipynb).
+# - Downloads em paralelo (pool de threads limitado), gravando em blocos direto no disco.
+# - Download interrompido continua de onde parou (Range + If-Range) a partir do .part.
+# - Arquivos já baixados só são baixados de novo se mudaram (If-None-Match /
+#   If-Modified-Since com o ETag/Last-Modified salvos em <arquivo>.meta.json).
+# - Os arquivos novos vão direto para a ingestão do feed_ons.
+# base_url é configurável para testar contra um servidor HTTP local.
+
+BASE_URL = "https://dados.ons.org.br"
+DEST_ROOT = feed_ons.BASE_ROOT
+
+# Datasets usados no projeto (ver README)
+DEFAULT_DATASETS = (
+    "balanco-energia-subsistema",
+    "restricao_coff_eolica_detail",
+    "curva-carga",
+    "geracao-usina-2",
+    "carga-energia-verificada",
+)
+
+WORKERS = 4
+# Blocos gravados no .part; um download interrompido retoma a partir do último bloco completo
+CHUNK_SIZE = 1 << 16
+TIMEOUT = 60
+
+DOWNLOADED = "downloaded"
+RESUMED = "resumed"
+UNCHANGED = "unchanged"
+FAILED = "failed"
+
+class LinkParser(HTMLParser):
+    """Coleta os href dos <a> (opcionalmente só os que têm a classe `css_class`)."""
+
+    def __init__(self, css_class=None):
+        super().__init__()
+        self.css_class = css_class
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a":
+            return
+        attrs = dict(attrs)
+        if attrs.get("href") and (self.css_class is None or self.css_class in (attrs.get("class") or "").split()):
+            self.links.append(attrs["href"])
+
+def page_links(session, url, css_class=None):
+    response = session.get(url, timeout=TIMEOUT)
+    response.raise_for_status()
+    parser = LinkParser(css_class)
+    parser.feed(response.text)
+    return [urljoin(url, href) for href in parser.links]
+
+def get_ons_dataset_list(session=None, base_url=BASE_URL):
+    """Slugs dos datasets listados no catálogo (links /dataset/<slug>)."""
+    session = session or requests.Session()
+    slugs = []
+    for link in page_links(session, f"{base_url}/dataset/"):
+        parts = urlsplit(link).path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "dataset" and parts[1] not in slugs:
+            slugs.append(parts[1])
+    return slugs
+
+def dataset_resources(dataset, session=None, base_url=BASE_URL, extension=".parquet", years=None):
+    """URLs dos arquivos de um dataset, filtradas pela extensão e, se dado, pelos anos."""
+    session = session or requests.Session()
+    links = page_links(session, f"{base_url}/dataset/{dataset}", css_class="resource-url-analytics")
+    links = [href for href in dict.fromkeys(links) if urlsplit(href).path.endswith(extension)]
+    if years:
+        links = [href for href in links if any(str(y) in Path(urlsplit(href).path).name for y in years)]
+    return links
+
+# =========================
+# Download de um arquivo
+# =========================
+def meta_path_for(dest: Path) -> Path:
+    return dest.with_name(dest.name + ".meta.json")
+
+def part_path_for(dest: Path) -> Path:
+    return dest.with_name(dest.name + ".part")
+
+def read_meta(dest: Path) -> dict:
+    try:
+        return json.loads(meta_path_for(dest).read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def write_meta(dest: Path, meta: dict):
+    path = meta_path_for(dest)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(meta, indent=1))
+    tmp.replace(path)
+
+def validators(response) -> dict:
+    return {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+
+def download_file(session, url, dest, chunk_size=CHUNK_SIZE):
+    """Baixa `url` para `dest`. Retorna DOWNLOADED, RESUMED ou UNCHANGED.
+
+    O conteúdo vai para <dest>.part e só substitui `dest` quando termina, então
+    uma falha no meio nunca deixa um parquet truncado no lugar do anterior.
+    """
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = part_path_for(dest)
+    meta = read_meta(dest)
+    if meta.get("url") != url:
+        meta = {}
+
+    headers = {}
+    offset = part.stat().st_size if part.exists() and meta.get("partial") else 0
+    if offset:
+        # Continua o .part só se o arquivo no servidor ainda for o mesmo (If-Range)
+        validator = meta.get("etag") or meta.get("last_modified")
+        if validator:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+        else:
+            offset = 0
+    elif dest.exists() and meta.get("complete"):
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        if response.status_code == 304:
+            return UNCHANGED
+        if response.status_code == 416:
+            # .part inválido para o servidor: recomeça do zero na próxima tentativa
+            part.unlink(missing_ok=True)
+            write_meta(dest, {"url": url})
+            response.raise_for_status()
+        response.raise_for_status()
+
+        resumed = offset and response.status_code == 206
+        new_meta = {"url": url, **(meta if resumed else validators(response)), "partial": True, "complete": False}
+        new_meta.pop("size", None)
+        write_meta(dest, new_meta)
+
+        with open(part, "ab" if resumed else "wb") as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+
+    os.replace(part, dest)
+    write_meta(dest, {**new_meta, "partial": False, "complete": True, "size": dest.stat().st_size})
+    return RESUMED if resumed else DOWNLOADED
+
+def download_all(urls, dest_dir=DEST_ROOT, workers=WORKERS, chunk_size=CHUNK_SIZE):
+    """Baixa as URLs em paralelo (no máximo `workers` ao mesmo tempo).
+
+    Retorna [(url, caminho, status)]; falhas aparecem com status FAILED e não
+    interrompem os outros downloads.
+    """
+    dest_dir = Path(dest_dir)
+    local = threading.local()
+
+    def fetch(url):
+        # requests.Session não é garantidamente thread-safe: uma por thread do pool
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        dest = dest_dir / Path(urlsplit(url).path).name
+        try:
+            return url, dest, download_file(local.session, url, dest, chunk_size)
+        except (requests.RequestException, OSError) as e:
+            print(f"Falha ao baixar {url}: {e}")
+            return url, dest, FAILED
+
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in as_completed([executor.submit(fetch, url) for url in dict.fromkeys(urls)]):
+            url, dest, status = future.result()
+            if status != FAILED:
+                print(f"{dest.name}: {status}")
+            results.append((url, dest, status))
+    return results
+
+def ingest_downloads(results):
+    """Passa os arquivos baixados (novos ou alterados) para a ingestão do feed_ons."""
+    paths = [dest for _, dest, status in results if status in (DOWNLOADED, RESUMED)]
+    if not paths:
+        print("Nenhum arquivo novo para ingerir.")
+        return [], []
+    conn = duckdb.connect(str(feed_ons.DB_PATH))
+    try:
+        ensure_manifest(conn)
+        return feed_ons.ingest_parquet_files(conn, paths)
+    finally:
+        conn.close()
+
+def sync_datasets(datasets=DEFAULT_DATASETS, years=None, dest_dir=DEST_ROOT, base_url=BASE_URL,
+                  workers=WORKERS, ingest=True):
+    """Descobre os arquivos dos datasets, baixa o que mudou e (opcionalmente) ingere."""
+    session = requests.Session()
+    urls = []
+    for dataset in datasets:
+        try:
+            found = dataset_resources(dataset, session, base_url, years=years)
+        except requests.RequestException as e:
+            print(f"Falha ao listar o dataset {dataset}: {e}")
+            continue
+        print(f"{dataset}: {len(found)} arquivos")
+        urls.extend(found)
+    results = download_all(urls, dest_dir, workers)
+    if ingest:
+        ingest_downloads(results)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Baixa os parquets dos dados abertos da ONS e carrega no DuckDB.")
+    parser.add_argument("datasets", nargs="*", default=list(DEFAULT_DATASETS),
+                        help="Slugs dos datasets (ex.: curva-carga)")
+    parser.add_argument("--years", nargs="*", type=int, default=None, help="Só arquivos destes anos")
+    parser.add_argument("--dest", type=Path, default=DEST_ROOT, help="Pasta dos parquets")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Downloads simultâneos")
+    parser.add_argument("--no-ingest", action="store_true", help="Só baixa, sem carregar no banco")
+    parser.add_argument("--list", action="store_true", help="Lista os datasets do catálogo e sai")
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(get_ons_dataset_list(base_url=args.base_url)))
+    else:
+        sync_datasets(args.datasets, args.years, args.dest, args.base_url, args.workers, ingest=not args.no_ingest)
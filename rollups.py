@@ -0,0 +1,151 @@
+from util import (
+    quote_ident,
+    table_columns,
+    time_column,
+    measure_columns,
+    rollup_table_name,
+    stat_column,
+    AGG_FREQS,
+    PARTITION_COLUMNS,
+)
+
+# =========================
+# Rollups pré-calculados (hora/dia/semana/mês)
+# =========================
+# Construídos na ingestão (feed_ons / feed_db3) a partir das tabelas brutas:
+#   <tabela>__<freq>: <tempo> truncado, chaves (colunas texto, ex.: subsistema ou
+#   arquivo da estação) e, por coluna numérica c: c (média), c__min, c__max, c__count.
+# Com a contagem guardada, reagregar um rollup (ex.: todas as estações juntas) dá
+# exatamente a média das linhas brutas: sum(c * c__count) / sum(c__count).
+
+ROLLUP_STATS = ("min", "max", "count")
+
+def rollup_layout(schema, time_col=None, keys=None):
+    """(time_col, keys, values) de uma tabela: chaves são as colunas texto, valores as numéricas.
+
+    Colunas de partição (ex.: `ano` das views por dataset) ficam de fora: o bucket de
+    tempo já as determina e, como chave, partiriam a semana da virada do ano em duas.
+    """
+    time_col = time_col or time_column(schema)
+    if time_col is None:
+        return None, [], []
+    values = [c for c in measure_columns(schema) if c != time_col]
+    if keys is None:
+        keys = [c for c in schema if c != time_col and c not in values and c not in PARTITION_COLUMNS]
+    return time_col, list(keys), values
+
+def rollup_select(table_name, freq, time_col, keys, values, where=""):
+    """SELECT que agrega `table_name` em buckets de `freq` por (tempo, chaves)."""
+    if freq not in AGG_FREQS:
+        raise ValueError(f"Frequência inválida: {freq}. Use uma de {AGG_FREQS}")
+    select = [f"date_trunc('{freq}', {quote_ident(time_col)}) AS {quote_ident(time_col)}"]
+    select += [quote_ident(k) for k in keys]
+    for c in values:
+        select.append(f"avg({quote_ident(c)}) AS {quote_ident(c)}")
+        select += [f"{stat}({quote_ident(c)}) AS {quote_ident(stat_column(c, stat))}"
+                   for stat in ROLLUP_STATS]
+    group_by = ", ".join(str(i) for i in range(1, len(keys) + 2))
+    return (f"SELECT {', '.join(select)} FROM {quote_ident(table_name)} "
+            f"WHERE {quote_ident(time_col)} IS NOT NULL{where} "
+            f"GROUP BY {group_by} ORDER BY {group_by}")
+
+def build_rollups(con, table_name, time_col=None, keys=None, freqs=AGG_FREQS):
+    """(Re)cria os rollups de `table_name` nas frequências pedidas. Retorna as tabelas criadas.
+
+    keys: colunas que identificam a série (padrão: todas as colunas texto).
+    """
+    schema = table_columns(con, table_name)
+    time_col, keys, values = rollup_layout(schema, time_col, keys)
+    if time_col is None or not values:
+        return []
+
+    # date_trunc em TIMESTAMPTZ usa o fuso da sessão: buckets sempre em UTC
+    con.execute("SET TimeZone = 'UTC'")
+    created = []
+    for freq in freqs:
+        rollup = rollup_table_name(table_name, freq)
+        con.execute(f"CREATE OR REPLACE TABLE {quote_ident(rollup)} AS "
+                    f"{rollup_select(table_name, freq, time_col, keys, values)}")
+        created.append(rollup)
+    return created
+
+def update_rollups(con, table_name, key, changed, freqs=AGG_FREQS):
+    """Reagrega só as séries cujo `key` está em `changed` (ex.: estações regravadas).
+
+    Como `key` é chave do GROUP BY, apagar e reinserir essas séries dá o mesmo
+    resultado que refazer o rollup inteiro. Sem rollup prévio, cria do zero.
+    """
+    existing = {row[0] for row in con.execute("SELECT table_name FROM information_schema.tables").fetchall()}
+    if any(rollup_table_name(table_name, f) not in existing for f in freqs):
+        return build_rollups(con, table_name, keys=[key], freqs=freqs)
+    changed = list(changed)
+    if not changed:
+        return []
+
+    schema = table_columns(con, table_name)
+    time_col, keys, values = rollup_layout(schema, keys=[key])
+    con.execute("SET TimeZone = 'UTC'")
+    where = f" AND list_contains(?, {quote_ident(key)})"
+    con.execute("BEGIN TRANSACTION")
+    try:
+        for freq in freqs:
+            rollup = quote_ident(rollup_table_name(table_name, freq))
+            con.execute(f"DELETE FROM {rollup} WHERE list_contains(?, {quote_ident(key)})", [changed])
+            con.execute(f"INSERT INTO {rollup} {rollup_select(table_name, freq, time_col, keys, values, where)}",
+                        [changed])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    print(f"Rollups de '{table_name}' atualizados para {len(changed)} séries.")
+    return [rollup_table_name(table_name, f) for f in freqs]
+
+def refresh_rollups(con, tables, changed=(), keys=None, freqs=AGG_FREQS):
+    """Refaz os rollups das tabelas em `changed` e cria os que ainda faltam em `tables`.
+
+    Tabelas sem alteração e com rollups completos são puladas, então rodar a
+    ingestão sem arquivos novos não reagrega nada.
+    """
+    existing = {row[0] for row in con.execute("SELECT table_name FROM information_schema.tables").fetchall()}
+    changed = set(changed)
+    refreshed = []
+    for table_name in tables:
+        missing = any(rollup_table_name(table_name, f) not in existing for f in freqs)
+        if table_name in changed or missing:
+            if build_rollups(con, table_name, keys=keys, freqs=freqs):
+                refreshed.append(table_name)
+    if refreshed:
+        print(f"Rollups {list(freqs)} atualizados para {len(refreshed)} tabelas.")
+    return refreshed
+
+def regroup_rollups(con, table_name, target_name, mapping, on, keys, freqs=AGG_FREQS):
+    """Deriva <target_name>__<freq> dos rollups de `table_name`, reagrupando as séries.
+
+    Cada série do rollup de origem (identificada por `on`, ex.: arquivo da estação) é
+    levada ao grupo de `mapping` (tabela com `on` + `keys`, ex.: subsistema). Lê só os
+    rollups, nunca as linhas brutas; médias ponderadas pela contagem continuam exatas.
+    """
+    con.execute("SET TimeZone = 'UTC'")
+    created = []
+    for freq in freqs:
+        source = rollup_table_name(table_name, freq)
+        schema = table_columns(con, source)
+        time_col = time_column(schema)
+        values = [c for c in schema if stat_column(c, "count") in schema]
+        select = [f"r.{quote_ident(time_col)}"] + [f"m.{quote_ident(k)}" for k in keys]
+        for c in values:
+            count = f"r.{quote_ident(stat_column(c, 'count'))}"
+            select.append(f"sum(r.{quote_ident(c)} * {count}) / nullif(sum({count}), 0) AS {quote_ident(c)}")
+            select.append(f"min(r.{quote_ident(stat_column(c, 'min'))}) AS {quote_ident(stat_column(c, 'min'))}")
+            select.append(f"max(r.{quote_ident(stat_column(c, 'max'))}) AS {quote_ident(stat_column(c, 'max'))}")
+            select.append(f"sum({count}) AS {quote_ident(stat_column(c, 'count'))}")
+        group_by = ", ".join(str(i) for i in range(1, len(keys) + 2))
+        target = rollup_table_name(target_name, freq)
+        con.execute(
+            f"CREATE OR REPLACE TABLE {quote_ident(target)} AS "
+            f"SELECT {', '.join(select)} FROM {quote_ident(source)} r "
+            f"JOIN {quote_ident(mapping)} m ON r.{quote_ident(on)} = m.{quote_ident(on)} "
+            f"GROUP BY {group_by} ORDER BY {group_by}"
+        )
+        created.append(target)
+    return created
@@ -0,0 +1,92 @@
+import hashlib
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+EARTH_RADIUS_KM = 6371.0088
+
+# =========================
+# Índice espacial de estações (BallTree haversine)
+# =========================
+def coords_fingerprint(ids, coords) -> str:
+    """Hash dos ids + coordenadas: identifica se o índice salvo ainda vale."""
+    h = hashlib.sha256()
+    h.update("\n".join(map(str, ids)).encode())
+    h.update(np.ascontiguousarray(coords, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+class StationIndex:
+    """Busca de estações mais próximas por distância de grande círculo (km)."""
+
+    def __init__(self, estacoes: pd.DataFrame):
+        valid = estacoes.dropna(subset=['latitude', 'longitude'])
+        self.ids = valid['id_estacao'].to_numpy()
+        coords = valid[['latitude', 'longitude']].to_numpy(dtype=np.float64)
+        self.fingerprint = coords_fingerprint(self.ids, coords)
+        self.tree = BallTree(np.radians(coords), metric='haversine')
+
+    def _query_points(self, usinas: pd.DataFrame):
+        valid = usinas.dropna(subset=['latitude', 'longitude'])
+        return valid['id_da_usina'].to_numpy(), np.radians(valid[['latitude', 'longitude']].to_numpy(dtype=np.float64))
+
+    def nearest(self, usinas: pd.DataFrame, k: int = 3) -> pd.DataFrame:
+        """k estações mais próximas de cada usina (formato longo: usina, estação, km, rank)."""
+        usina_ids, points = self._query_points(usinas)
+        k = min(k, len(self.ids))
+        if len(usina_ids) == 0 or k == 0:
+            return pd.DataFrame(columns=['id_da_usina', 'id_estacao', 'distancia_km', 'rank'])
+        dist, idx = self.tree.query(points, k=k)
+        return pd.DataFrame({
+            'id_da_usina': np.repeat(usina_ids, k),
+            'id_estacao': self.ids[idx.ravel()],
+            'distancia_km': dist.ravel() * EARTH_RADIUS_KM,
+            'rank': np.tile(np.arange(1, k + 1), len(usina_ids)),
+        })
+
+    def within(self, usinas: pd.DataFrame, radius_km: float) -> pd.DataFrame:
+        """Todas as estações a até radius_km de cada usina (formato longo, ordenado por distância)."""
+        usina_ids, points = self._query_points(usinas)
+        if len(usina_ids) == 0:
+            return pd.DataFrame(columns=['id_da_usina', 'id_estacao', 'distancia_km'])
+        idx, dist = self.tree.query_radius(points, r=radius_km / EARTH_RADIUS_KM,
+                                           return_distance=True, sort_results=True)
+        counts = np.array([len(i) for i in idx])
+        return pd.DataFrame({
+            'id_da_usina': np.repeat(usina_ids, counts),
+            'id_estacao': self.ids[np.concatenate(idx)] if counts.sum() else np.array([], dtype=object),
+            'distancia_km': (np.concatenate(dist) if counts.sum() else np.array([])) * EARTH_RADIUS_KM,
+        })
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+def index_path_for(db_path) -> Path:
+    """Arquivo do índice salvo ao lado do banco de clima (ex.: climate.estacoes_index.pkl)."""
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.stem}.estacoes_index.pkl")
+
+def load_or_build_index(estacoes: pd.DataFrame, path) -> StationIndex:
+    """Reaproveita o índice salvo se as estações não mudaram; senão reconstrói e salva."""
+    path = Path(path)
+    valid = estacoes.dropna(subset=['latitude', 'longitude'])
+    fingerprint = coords_fingerprint(valid['id_estacao'].to_numpy(),
+                                     valid[['latitude', 'longitude']].to_numpy(dtype=np.float64))
+    if path.exists():
+        try:
+            index = StationIndex.load(path)
+            if index.fingerprint == fingerprint:
+                return index
+        except Exception as e:
+            print(f"Índice de estações inválido em {path}: {e}")
+    index = StationIndex(estacoes)
+    index.save(path)
+    return index
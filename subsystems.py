@@ -0,0 +1,38 @@
+import pandas as pd
+
+# =========================
+# Subsistemas do SIN (ONS) por UF
+# =========================
+# id_subsistema é o código usado em todos os datasets da ONS; nom_subsistema varia
+# entre datasets (ex.: "SUDESTE" x "Sudeste/Centro-Oeste"), por isso o join é pelo id.
+SUBSISTEMAS = {
+    "SE": "Sudeste/Centro-Oeste",
+    "S": "Sul",
+    "NE": "Nordeste",
+    "N": "Norte",
+}
+
+UF_SUBSISTEMA = {
+    **dict.fromkeys(["PR", "SC", "RS"], "S"),
+    **dict.fromkeys(["SP", "RJ", "MG", "ES", "GO", "DF", "MT", "MS", "AC", "RO"], "SE"),
+    **dict.fromkeys(["BA", "SE", "AL", "PE", "PB", "RN", "CE", "PI"], "NE"),
+    **dict.fromkeys(["PA", "TO", "MA", "AP", "AM", "RR"], "N"),
+}
+
+STATION_SUBSYSTEM_TABLE = "estacao_subsistema"
+CLIMATE_SUBSYSTEM_VIEW = "clima_subsistema"
+
+def map_stations_to_subsystems(estacoes: pd.DataFrame) -> pd.DataFrame:
+    """(arquivo, uf, id_subsistema, nom_subsistema) de cada estação, pela UF do cabeçalho INMET.
+
+    Estações sem UF reconhecida ficam de fora.
+    """
+    uf = estacoes["uf"].astype("string").str.strip().str.upper()
+    df = pd.DataFrame({
+        "arquivo": estacoes["arquivo"],
+        "uf": uf,
+        "id_subsistema": uf.map(UF_SUBSISTEMA),
+    })
+    df = df.dropna(subset=["id_subsistema"]).drop_duplicates("arquivo")
+    df["nom_subsistema"] = df["id_subsistema"].map(SUBSISTEMAS)
+    return df.reset_index(drop=True)
@@ -0,0 +1,211 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from meta_normalize import LAT_MIN, LAT_MAX, LON_MIN, LON_MAX
+from subsystems import SUBSISTEMAS, UF_SUBSISTEMA
+
+# =========================
+# Dados sintéticos no formato da ONS e do INMET
+# =========================
+# Geradores determinísticos (mesma seed -> mesmos dados) usados pelo benchmark.py:
+#   - parquet da ONS com o schema dos arquivos abertos (din_instante em texto, val_* numérico);
+#   - CSV do INMET: cabeçalho de 8 linhas "CHAVE:;valor" em latin1, separador ";",
+#     decimal "," e as colunas métricas com os nomes originais.
+# As séries têm ciclo diário e anual, ruído e alguns picos, para que correlação,
+# detecção de anomalias e resumos trabalhem com algo parecido com os dados reais.
+
+START = "2023-01-01"
+
+# Carga média (MWmed) aproximada de cada subsistema
+CARGA_MEDIA = {"SE": 40_000.0, "S": 12_000.0, "NE": 11_000.0, "N": 6_500.0}
+
+# Região geográfica de cada UF (campo REGIAO do cabeçalho INMET)
+UF_REGIAO = {
+    **dict.fromkeys(["PR", "SC", "RS"], "S"),
+    **dict.fromkeys(["SP", "RJ", "MG", "ES"], "SE"),
+    **dict.fromkeys(["GO", "DF", "MT", "MS"], "CO"),
+    **dict.fromkeys(["BA", "SE", "AL", "PE", "PB", "RN", "CE", "PI", "MA"], "NE"),
+    **dict.fromkeys(["PA", "TO", "AP", "AM", "RR", "AC", "RO"], "N"),
+}
+
+# Cabeçalho das colunas métricas do INMET (layout a partir de 2019)
+INMET_COLUMNS = [
+    "Data",
+    "Hora UTC",
+    "PRECIPITAÇÃO TOTAL, HORÁRIO (mm)",
+    "PRESSAO ATMOSFERICA AO NIVEL DA ESTACAO, HORARIA (mB)",
+    "PRESSÃO ATMOSFERICA MAX.NA HORA ANT. (AUT) (mB)",
+    "PRESSÃO ATMOSFERICA MIN. NA HORA ANT. (AUT) (mB)",
+    "RADIACAO GLOBAL (Kj/m²)",
+    "TEMPERATURA DO AR - BULBO SECO, HORARIA (°C)",
+    "TEMPERATURA MÁXIMA NA HORA ANT. (AUT) (°C)",
+    "TEMPERATURA MÍNIMA NA HORA ANT. (AUT) (°C)",
+    "UMIDADE RELATIVA DO AR, HORARIA (%)",
+    "VENTO, DIREÇÃO HORARIA (gr) (° (gr))",
+    "VENTO, VELOCIDADE HORARIA (m/s)",
+]
+
+# Fração de leituras faltantes (células vazias, como nos CSVs reais)
+MISSING_RATE = 0.01
+
+def hourly_index(hours: int, start=START) -> pd.DatetimeIndex:
+    return pd.date_range(start, periods=hours, freq="h")
+
+def _cycles(index: pd.DatetimeIndex):
+    """(ciclo diário, ciclo anual) em [-1, 1]; o diário tem pico no fim da tarde."""
+    hour = index.hour.to_numpy()
+    doy = index.dayofyear.to_numpy()
+    daily = np.sin(2 * np.pi * (hour - 12) / 24)
+    yearly = np.cos(2 * np.pi * (doy - 15) / 365.25)
+    return daily, yearly
+
+def energy_series(index: pd.DatetimeIndex, subsystem: str = "SE", seed: int = 0,
+                  spike_rate: float = 0.001) -> np.ndarray:
+    """Carga horária (MWmed) de um subsistema: ciclos diário/anual, ruído e picos raros."""
+    rng = np.random.default_rng([seed, list(SUBSISTEMAS).index(subsystem)])
+    base = CARGA_MEDIA[subsystem]
+    daily, yearly = _cycles(index)
+    weekend = np.isin(index.dayofweek, (5, 6))
+    values = base * (1 + 0.12 * daily + 0.06 * yearly - 0.08 * weekend)
+    values += rng.normal(0, 0.015 * base, len(index))
+    spikes = rng.random(len(index)) < spike_rate
+    values[spikes] *= rng.choice([0.7, 1.3], spikes.sum())
+    return values
+
+def ons_curva_carga(hours: int, subsystems=tuple(SUBSISTEMAS), seed: int = 0, start=START) -> pd.DataFrame:
+    """Curva de carga horária no schema da ONS (CURVA_CARGA_<ano>.parquet)."""
+    index = hourly_index(hours, start)
+    frames = []
+    for code in subsystems:
+        frames.append(pd.DataFrame({
+            "id_subsistema": code,
+            "nom_subsistema": SUBSISTEMAS[code],
+            # Nos arquivos da ONS o instante vem como texto; feed_ons converte na carga
+            "din_instante": index.strftime("%Y-%m-%d %H:%M:%S"),
+            "val_cargaenergiahomwmed": energy_series(index, code, seed),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+def ons_carga_energia(hours: int, subsystems=tuple(SUBSISTEMAS), seed: int = 0, start=START) -> pd.DataFrame:
+    """Carga de energia diária no schema da ONS (CARGA_ENERGIA_<ano>.parquet)."""
+    curva = ons_curva_carga(hours, subsystems, seed, start)
+    day = curva["din_instante"].str.slice(0, 10)
+    df = (curva.groupby(["id_subsistema", "nom_subsistema", day], sort=False)["val_cargaenergiahomwmed"]
+          .mean().rename("val_cargaenergiamwmed").reset_index())
+    df["din_instante"] = df["din_instante"] + " 00:00:00"
+    return df
+
+ONS_DATASETS = {
+    "curva_carga": ons_curva_carga,
+    "carga_energia": ons_carga_energia,
+}
+
+def write_ons_parquet(root, hours: int, subsystems=tuple(SUBSISTEMAS), seed: int = 0, start=START,
+                      datasets=tuple(ONS_DATASETS)):
+    """Grava <dataset>_<ano>.parquet em `root`, particionado por ano como nos dados abertos."""
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for dataset in datasets:
+        df = ONS_DATASETS[dataset](hours, subsystems, seed, start)
+        years = df["din_instante"].str.slice(0, 4)
+        for year, part in df.groupby(years):
+            path = root / f"{dataset.upper()}_{year}.parquet"
+            part.reset_index(drop=True).to_parquet(path, index=False)
+            paths.append(path)
+    return paths
+
+def stations(n: int, seed: int = 0) -> pd.DataFrame:
+    """Metadados de `n` estações do INMET: código, UF (com subsistema da ONS) e coordenadas."""
+    rng = np.random.default_rng([seed, 1])
+    ufs = rng.choice(sorted(UF_SUBSISTEMA), n)
+    return pd.DataFrame({
+        "codigo_wmo": [f"A{i + 1:03d}" for i in range(n)],
+        "estacao": [f"ESTACAO {i + 1:03d}" for i in range(n)],
+        "uf": ufs,
+        "regiao": [UF_REGIAO[uf] for uf in ufs],
+        "latitude": rng.uniform(LAT_MIN + 2, LAT_MAX - 2, n).round(8),
+        "longitude": rng.uniform(LON_MIN + 5, LON_MAX - 2, n).round(8),
+        "altitude": rng.uniform(0, 1200, n).round(2),
+        "data_fundacao": "2000-01-01",
+    })
+
+def usinas(n: int, seed: int = 0) -> pd.DataFrame:
+    """Usinas já normalizadas (id_da_usina, latitude, longitude), como em usina_meta."""
+    rng = np.random.default_rng([seed, 2])
+    return pd.DataFrame({
+        "id_da_usina": [f"USINA {i + 1:05d}" for i in range(n)],
+        "latitude": rng.uniform(LAT_MIN + 2, LAT_MAX - 2, n),
+        "longitude": rng.uniform(LON_MIN + 5, LON_MAX - 2, n),
+    })
+
+def climate_frame(index: pd.DatetimeIndex, latitude: float = -15.0, seed=0) -> pd.DataFrame:
+    """Leituras horárias de uma estação (nomes simples do feed_db3), com faltantes."""
+    rng = np.random.default_rng(seed)
+    n = len(index)
+    daily, yearly = _cycles(index)
+    # Mais frio e com mais amplitude anual quanto mais ao sul
+    temp = 27 + 0.3 * latitude + 4 * daily + (2 - 0.15 * latitude) * yearly + rng.normal(0, 1.2, n)
+    umidade = np.clip(70 - 15 * daily + rng.normal(0, 6, n), 5, 100)
+    chuva = np.where(rng.random(n) < 0.08, rng.gamma(0.8, 4.0, n), 0.0)
+    pressao = 950 + rng.normal(0, 3, n)
+    # Mesma ordem das colunas métricas de INMET_COLUMNS
+    df = pd.DataFrame({
+        "precipitacao": chuva,
+        "pressao": pressao,
+        "pressao_max": pressao + rng.uniform(0, 1, n),
+        "pressao_min": pressao - rng.uniform(0, 1, n),
+        "radiacao": np.clip(3000 * daily, 0, None) + rng.normal(0, 50, n).clip(0),
+        "temperatura": temp,
+        "temperatura_max": temp + rng.uniform(0, 1.5, n),
+        "temperatura_min": temp - rng.uniform(0, 1.5, n),
+        "umidade": umidade,
+        "vento_direcao": rng.uniform(0, 360, n),
+        "vento": rng.gamma(2.0, 1.0, n),
+    }, index=index)
+    return df.mask(rng.random(df.shape) < MISSING_RATE)
+
+def inmet_file_name(meta, year: int) -> str:
+    return (f"INMET_{meta['regiao']}_{meta['uf']}_{meta['codigo_wmo']}_{meta['estacao'].replace(' ', '_')}"
+            f"_01-01-{year}_A_31-12-{year}.CSV")
+
+def write_inmet_csv(path, meta, index: pd.DatetimeIndex, seed=0):
+    """Grava um CSV do INMET: 8 linhas de cabeçalho + dados métricos, em latin1."""
+    df = climate_frame(index, float(meta["latitude"]), seed)
+    header = [
+        f"REGIAO:;{meta['regiao']}",
+        f"UF:;{meta['uf']}",
+        f"ESTACAO:;{meta['estacao']}",
+        f"CODIGO (WMO):;{meta['codigo_wmo']}",
+        f"LATITUDE:;{str(meta['latitude']).replace('.', ',')}",
+        f"LONGITUDE:;{str(meta['longitude']).replace('.', ',')}",
+        f"ALTITUDE:;{str(meta['altitude']).replace('.', ',')}",
+        f"DATA DE FUNDACAO:;{meta['data_fundacao']}",
+    ]
+    body = pd.DataFrame(df.to_numpy(), columns=INMET_COLUMNS[2:])
+    body.insert(0, "Data", index.strftime("%Y/%m/%d"))
+    body.insert(1, "Hora UTC", index.strftime("%H%M UTC"))
+    # Os CSVs originais terminam cada linha com ";"
+    body[""] = ""
+    with open(path, "w", encoding="latin1", newline="") as f:
+        f.write("\n".join(header) + "\n")
+        body.to_csv(f, sep=";", decimal=",", float_format="%.1f", na_rep="", index=False,
+                    lineterminator="\n")
+
+def write_inmet_csvs(root, n_stations: int, hours: int, seed: int = 0, start=START):
+    """Gera `n_stations` estações em <root>/<ano>/*.CSV (um arquivo por estação e ano).
+
+    Retorna (metadados das estações, lista de anos gerados).
+    """
+    root = Path(root)
+    meta = stations(n_stations, seed)
+    index = hourly_index(hours, start)
+    years = sorted(set(index.year))
+    for year in years:
+        folder = root / str(year)
+        folder.mkdir(parents=True, exist_ok=True)
+        year_index = index[index.year == year]
+        for i, row in enumerate(meta.to_dict("records")):
+            write_inmet_csv(folder / inmet_file_name(row, year), row, year_index, seed=[seed, 3, i, year])
+    return meta, years
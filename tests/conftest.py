@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# Módulos do projeto ficam soltos na raiz do repositório (sem pacote instalável)
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
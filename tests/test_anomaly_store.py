@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import IsolationForest
+
+from anomaly_store import STRONG_PERCENTILE, AnomalyStore, store_path_for
+
+KEY = ("carga_energia", "val_cargaenergiamwmed", "temperatura", "day", None)
+
+
+def daily_pair(days=200, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2024-01-01", periods=days, freq="D")
+    climate = pd.Series(25 + rng.normal(scale=3.0, size=days), index=index)
+    energy = pd.Series(1000 + 20 * climate.to_numpy() + rng.normal(scale=15.0, size=days), index=index)
+    return energy, climate
+
+
+@pytest.fixture
+def fits(monkeypatch):
+    calls = []
+    fit = IsolationForest.fit
+
+    def counting_fit(self, *args, **kwargs):
+        calls.append(self)
+        return fit(self, *args, **kwargs)
+
+    monkeypatch.setattr(IsolationForest, "fit", counting_fit)
+    return calls
+
+
+def test_store_lives_next_to_database(tmp_path):
+    assert store_path_for(tmp_path / "ons.duckdb") == tmp_path / "ons.anomaly_models"
+
+
+def test_model_is_trained_once_per_key(tmp_path, fits):
+    store = AnomalyStore(tmp_path)
+    energy, climate = daily_pair()
+
+    first = store.scores(KEY, energy, climate)
+    second = store.scores(KEY, energy, climate)
+    assert len(fits) == 1
+    pd.testing.assert_frame_equal(first, second)
+
+    store.scores((*KEY[:-1], "SE"), energy, climate)
+    assert len(fits) == 2
+
+
+def test_second_store_loads_model_from_disk(tmp_path, fits):
+    energy, climate = daily_pair()
+    first = AnomalyStore(tmp_path).scores(KEY, energy, climate)
+    assert len(list(tmp_path.glob("*.pkl"))) == 1
+
+    # Nova instância (ex.: outro processo do Streamlit): lê o pickle, sem refit
+    second = AnomalyStore(tmp_path).scores(KEY, energy, climate)
+    assert len(fits) == 1
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_new_rows_are_scored_without_refit(tmp_path, fits):
+    energy, climate = daily_pair(days=230)
+    store = AnomalyStore(tmp_path)
+    store.scores(KEY, energy.iloc[:200], climate.iloc[:200])
+
+    # Nova versão do banco só com linhas a mais: o treino continua válido
+    scores = AnomalyStore(tmp_path).scores(KEY, energy, climate)
+    assert len(fits) == 1
+    assert scores.index.equals(energy.index)
+
+
+def test_model_is_retrained_when_training_window_changes(tmp_path, fits):
+    energy, climate = daily_pair()
+    store = AnomalyStore(tmp_path)
+    before = store.scores(KEY, energy, climate)
+
+    # Nova versão do banco com dados reprocessados dentro da janela de treino
+    energy = energy.copy()
+    energy.iloc[10] += 500
+    after = AnomalyStore(tmp_path).scores(KEY, energy, climate)
+    assert len(fits) == 2
+    assert after.loc[energy.index[10], "energy"] != before.loc[energy.index[10], "energy"]
+
+    # Início diferente (janela recortada) também invalida
+    AnomalyStore(tmp_path).scores(KEY, energy.iloc[5:], climate.iloc[5:])
+    assert len(fits) == 3
+
+
+def test_strong_flag_uses_training_p95(tmp_path):
+    energy, climate = daily_pair(days=260)
+    store = AnomalyStore(tmp_path)
+    train = store.scores(KEY, energy.iloc[:200], climate.iloc[:200])
+    threshold = np.percentile(train["score"], STRONG_PERCENTILE)
+    assert train["strong"].equals(train["score"] >= threshold)
+
+    # Linhas novas usam o limiar do treino, não o p95 recalculado com elas
+    scores = store.scores(KEY, energy, climate)
+    assert scores["strong"].equals(scores["score"] >= threshold)
+    assert store._models[KEY].threshold == threshold
@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("docling")
+
+from docling.datamodel.base_models import InputFormat
+
+import app.main as main
+
+
+class FakeConverter:
+    instances = []
+
+    def __init__(self):
+        self.initialized = []
+        FakeConverter.instances.append(self)
+
+    def initialize_pipeline(self, format):
+        self.initialized.append(format)
+
+
+def test_warm_initializes_pipeline_of_every_pooled_converter(monkeypatch):
+    FakeConverter.instances = []
+    monkeypatch.setattr(main, "DocumentConverter", FakeConverter)
+    pool = main.ConverterPool(3)
+    try:
+        pool.warm()
+        pooled = [pool._free.get_nowait() for _ in range(pool.size)]
+    finally:
+        pool.shutdown()
+
+    assert len(pooled) == 3
+    assert pooled == FakeConverter.instances
+    assert all(c.initialized == [InputFormat.PDF] for c in pooled)
@@ -0,0 +1,69 @@
+import duckdb
+import numpy as np
+import pandas as pd
+
+from compact_schema import MEASUREMENT_DTYPE, compact_dtype, compact_frame, frame_memory_mb
+from util import load_table_duckdb
+
+
+def raw_frame(n=100):
+    return pd.DataFrame({
+        "din_instante": pd.date_range("2024-01-01", periods=n, freq="h").astype(str),
+        "id_subsistema": ["SE", "S", "NE", "N"] * (n // 4),
+        "nom_usina": [f"Usina {i}" for i in range(n)],
+        "observacao": ["ok"] * n,
+        "comentario": [f"livre {i}" for i in range(n)],
+        "val_cargaenergiamwmed": np.linspace(0, 1e5, n),
+        "latitude": np.linspace(-30, -5, n),
+        "num_patamar": np.arange(n, dtype=np.int64),
+    })
+
+
+def test_compact_dtype_per_column():
+    df = raw_frame()
+    assert {c: compact_dtype(df[c]) for c in df.columns} == {
+        "din_instante": "datetime64",
+        "id_subsistema": "category",
+        # Chave conhecida vira category mesmo sem repetição
+        "nom_usina": "category",
+        # Texto livre: só com repetição suficiente
+        "observacao": "category",
+        "comentario": None,
+        "val_cargaenergiamwmed": MEASUREMENT_DTYPE,
+        # Coordenadas mantêm a precisão toda
+        "latitude": None,
+        "num_patamar": None,
+    }
+
+
+def test_compact_frame_is_idempotent_and_smaller():
+    df = raw_frame(4000)
+    before = frame_memory_mb(df)
+    out = compact_frame(df)
+    assert out is df
+    assert frame_memory_mb(out) < before
+    assert pd.api.types.is_datetime64_any_dtype(out["din_instante"])
+    assert out["val_cargaenergiamwmed"].dtype == MEASUREMENT_DTYPE
+    assert out["latitude"].dtype == np.float64
+    assert all(compact_dtype(out[c]) is None for c in out.columns)
+
+
+def test_invalid_timestamps_become_nat():
+    df = compact_frame(pd.DataFrame({"data_hora": ["2024-01-01 00:00", "sem data"]}))
+    assert df["data_hora"].isna().tolist() == [False, True]
+
+
+def test_load_table_duckdb_returns_compact_schema(tmp_path):
+    db_path = tmp_path / "ons.duckdb"
+    con = duckdb.connect(str(db_path))
+    con.register("_df", raw_frame())
+    con.execute("CREATE TABLE carga AS SELECT * REPLACE (CAST(din_instante AS TIMESTAMP) AS din_instante) FROM _df")
+    con.close()
+
+    df = load_table_duckdb(db_path, "carga")
+    assert df["val_cargaenergiamwmed"].dtype == MEASUREMENT_DTYPE
+    assert isinstance(df["id_subsistema"].dtype, pd.CategoricalDtype)
+    assert df["latitude"].dtype == np.float64
+
+    raw = load_table_duckdb(db_path, "carga", compact=False)
+    assert raw["val_cargaenergiamwmed"].dtype == np.float64
@@ -0,0 +1,114 @@
+import os
+
+import duckdb
+import pandas as pd
+import pytest
+
+import data_dictionary
+from data_dictionary import (METADATA_COLUMNS, METADATA_TABLE, DictionaryIndex, DictionaryService,
+                             dataset_from_dict_file, dict_records, load_dictionary_index,
+                             normalize_dataset_name, read_dict_csv)
+
+
+@pytest.fixture
+def metadata():
+    return pd.DataFrame({
+        "dataset": ["carga_energia", "carga_energia", "carga_energia_diaria", "geracao_usina"],
+        "variavel": ["val_cargaenergiamwmed", "din_instante", "val_cargaenergiamwmed", "din_instante"],
+        "descricao": ["Carga média", "Instante", "Carga diária", "Instante da geração"],
+    })
+
+
+@pytest.mark.parametrize("name", [
+    "DicionarioDados_Carga_Energia", "CARGA_ENERGIA_2024", "carga-energia", "carga_energia_2024_01",
+])
+def test_normalize_dataset_name(name):
+    assert normalize_dataset_name(name) == "carga_energia"
+
+
+def test_read_dict_csv_detects_encoding_and_separator(tmp_path):
+    path = tmp_path / "DicionarioDados_Carga_Energia.csv"
+    path.write_bytes("Código,Descrição\nval_carga, Carga média \n".encode("latin1"))
+    df = read_dict_csv(path)
+    assert list(df.columns) == ["Código", "Descrição"]
+
+    records = dict_records(df, dataset_from_dict_file(path))
+    assert records.to_dict("records") == [
+        {"dataset": "carga_energia", "variavel": "val_carga", "descricao": "Carga média"}]
+
+
+def test_dict_records_drops_repeated_headers_and_missing_columns():
+    df = pd.DataFrame({"Código": ["a", "Código", "", None, "a"], "Descrição": ["A", "Descrição", "x", "y", "A2"]})
+    assert dict_records(df, "ds")["variavel"].tolist() == ["a"]
+    assert list(dict_records(pd.DataFrame({"x": [1]}), "ds").columns) == METADATA_COLUMNS
+
+
+def test_index_prefers_dataset_description(metadata):
+    index = DictionaryIndex(metadata)
+    assert len(index) == 2
+    assert index.describe("val_cargaenergiamwmed", "CARGA_ENERGIA_2024") == "Carga média"
+    assert index.describe("val_cargaenergiamwmed", "carga_energia_diaria") == "Carga diária"
+    # Dataset sem dicionário: cai na descrição geral (primeiro dataset que define)
+    assert index.describe("din_instante", "intercambio") == "Instante"
+    assert index.describe("desconhecida") is None
+
+
+def test_resolve_dataset_falls_back_to_shortest_prefix(metadata):
+    index = DictionaryIndex(metadata)
+    assert index.resolve_dataset("carga_energia_2023") == "carga_energia"
+    assert index.resolve_dataset("carga") == "carga_energia"
+    assert index.resolve_dataset("geracao_usina_2_2024") == "geracao_usina"
+    assert index.resolve_dataset("intercambio") is None
+    assert index.resolve_dataset("") is None
+    assert index.dataset("intercambio") == {}
+
+
+def test_index_accepts_legacy_metadata_without_dataset(metadata):
+    index = DictionaryIndex(metadata.drop(columns="dataset").head(2))
+    assert index.describe("din_instante", "carga_energia") == "Instante"
+    assert index.resolve_dataset("carga_energia") is None
+
+
+def test_load_dictionary_index_without_table():
+    con = duckdb.connect()
+    assert len(load_dictionary_index(con)) == 0
+    con.close()
+
+
+def test_service_reloads_only_when_database_changes(tmp_path, metadata, monkeypatch):
+    db_path = tmp_path / "ons.duckdb"
+    service = DictionaryService(db_path)
+    assert len(service.refresh()) == 0
+
+    con = duckdb.connect(str(db_path))
+    con.register("_df", metadata)
+    con.execute(f"CREATE TABLE {METADATA_TABLE} AS SELECT * FROM _df")
+    con.close()
+    assert not service.is_current()
+    index = service.refresh()
+    assert index.describe("din_instante", "geracao_usina") == "Instante da geração"
+
+    # Banco intocado: nem abre a conexão
+    monkeypatch.setattr(data_dictionary, "connect_duckdb", lambda *a: pytest.fail("banco reaberto"))
+    assert service.is_current()
+    assert service.refresh() is index
+
+
+def test_service_keeps_previous_index_when_database_is_locked(tmp_path, metadata, monkeypatch):
+    db_path = tmp_path / "ons.duckdb"
+    con = duckdb.connect(str(db_path))
+    con.register("_df", metadata)
+    con.execute(f"CREATE TABLE {METADATA_TABLE} AS SELECT * FROM _df")
+    con.close()
+    service = DictionaryService(db_path)
+    index = service.refresh()
+
+    def locked(*args):
+        raise duckdb.IOException("Could not set lock on file")
+
+    monkeypatch.setattr(data_dictionary, "connect_duckdb", locked)
+    st = db_path.stat()
+    os.utime(db_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert service.refresh() is index
+    # A versão não avança: a próxima chamada tenta de novo
+    assert not service.is_current()
@@ -0,0 +1,37 @@
+import duckdb
+import numpy as np
+import pandas as pd
+
+from feed_db3 import (insert_typed, ensure_tables, parse_hour_minutes, parse_inmet_timestamp,
+                      CLIMA_SCHEMA, META_SCHEMA)
+
+
+def test_insert_typed_casts_numeric_and_comma_decimal_columns():
+    con = duckdb.connect()
+    ensure_tables(con)
+    clima = pd.DataFrame({
+        "data_hora": pd.to_datetime(["2024-01-01T00:00Z", "2024-01-01T01:00Z"]),
+        "precipitacao": np.array([0.1, 2.5], dtype=np.float32),
+        "vento": [1.25, np.nan],
+        "arquivo": ["A001.CSV", "A001.CSV"],
+    })
+    insert_typed(con, "clima", CLIMA_SCHEMA, clima)
+    meta = pd.DataFrame({"latitude": ["-15,78944444"], "longitude": [-47.92583332], "arquivo": ["A001.CSV"]})
+    insert_typed(con, "metadados_estacoes", META_SCHEMA, meta)
+
+    rows = con.execute("SELECT precipitacao, vento, pressao FROM clima ORDER BY data_hora").fetchall()
+    assert rows == [(np.float32(0.1), 1.25, None), (2.5, None, None)]
+    lat, lon = con.execute("SELECT latitude, longitude FROM metadados_estacoes").fetchone()
+    assert lat == -15.78944444
+    assert lon == -47.92583332
+    con.close()
+
+
+def test_float_hours_are_parsed_as_hhmm():
+    data = pd.Series(["2024/01/01"] * 5)
+    hora = pd.Series([0.0, 100.0, "100.0", "1200 UTC", 2300.5], dtype=object)
+    stamps, dropped = parse_inmet_timestamp(data, hora)
+    assert stamps[:4].dt.hour.tolist() == [0, 1, 1, 12]
+    # Hora com fração não é HHMM válido: linha descartada
+    assert dropped == 1 and stamps.isna().tolist() == [False] * 4 + [True]
+    assert parse_hour_minutes(np.int64(930)) == 9 * 60 + 30
@@ -0,0 +1,35 @@
+import duckdb
+
+import feed_ons
+from data_dictionary import METADATA_TABLE
+from manifest import MANIFEST_TABLE, ensure_manifest
+
+
+def test_dictionary_that_fails_to_parse_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(feed_ons, "DICT_ROOT", tmp_path)
+    (tmp_path / "DicionarioDados_Carga_Energia.csv").write_text(
+        "Código;Descrição\nval_cargaenergiamwmed;Carga média\n", encoding="utf-8")
+    broken = tmp_path / "DicionarioDados_Geracao_Usina.csv"
+    broken.write_text("Código;Descrição\ndin_instante;Instante\n", encoding="utf-8")
+
+    read_dict_csv = feed_ons.read_dict_csv
+
+    def flaky_read(path):
+        if path.name == broken.name:
+            raise ValueError("arquivo truncado")
+        return read_dict_csv(path)
+
+    con = duckdb.connect()
+    ensure_manifest(con)
+    monkeypatch.setattr(feed_ons, "read_dict_csv", flaky_read)
+    feed_ons.load_dicts(con)
+    recorded = {row[0] for row in con.execute(f"SELECT path FROM {MANIFEST_TABLE}").fetchall()}
+    assert recorded == {str((tmp_path / "DicionarioDados_Carga_Energia.csv").resolve())}
+
+    # Próxima execução: o dicionário que falhou não está no manifesto e entra na tabela
+    monkeypatch.setattr(feed_ons, "read_dict_csv", read_dict_csv)
+    feed_ons.load_dicts(con)
+    datasets = con.execute(f"SELECT DISTINCT dataset FROM {METADATA_TABLE} ORDER BY 1").fetchall()
+    assert datasets == [("carga_energia",), ("geracao_usina",)]
+    assert con.execute(f"SELECT count(*) FROM {MANIFEST_TABLE}").fetchone()[0] == 2
+    con.close()
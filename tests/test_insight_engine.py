@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("statsmodels")
+
+import insight_engine
+from insight_engine import (extract_insights, iter_insights, insight_columns, mi_candidates, screen_pairs,
+                            STATIONARITY_COLUMNS, MI_CANDIDATE_FACTOR)
+
+
+@pytest.fixture
+def merged():
+    rng = np.random.default_rng(0)
+    n = 24 * 7 * 6
+    t = np.arange(n)
+    climate = {f"c{i}": np.sin(2 * np.pi * t / (24 + 7 * i)) + rng.normal(scale=0.2 + 0.3 * i, size=n)
+               for i in range(5)}
+    energy = {
+        "e0": np.roll(climate["c0"], 3) + rng.normal(scale=0.3, size=n),
+        "e1": climate["c2"] * 0.5 + rng.normal(scale=1.0, size=n),
+    }
+    return pd.DataFrame({**energy, **climate})
+
+
+def test_pruned_ranking_matches_unpruned(merged):
+    energy_cols, climate_cols = ["e0", "e1"], [f"c{i}" for i in range(5)]
+    full = extract_insights(merged, energy_cols, climate_cols, top_k=10, workers=1, prune=False)
+    pruned = extract_insights(merged, energy_cols, climate_cols, top_k=3, workers=1, prune=True)
+
+    expected = full.head(3).reset_index(drop=True)
+    pd.testing.assert_frame_equal(pruned.reset_index(drop=True), expected)
+
+
+def test_screened_top_k_is_yielded_before_heavy_stages(merged, monkeypatch):
+    calls = []
+    mutual_info = insight_engine._pair_mutual_info
+    monkeypatch.setattr(insight_engine, "_pair_mutual_info", lambda *args: calls.append(args) or mutual_info(*args))
+
+    steps = iter_insights(merged, ["e0", "e1"], [f"c{i}" for i in range(5)], top_k=2, workers=1)
+    first = next(steps)
+    assert calls == []
+    assert len(first) == 2
+    assert first["mi"].eq(0).all()
+    assert first[["granger_p", "granger_lag"]].isna().all().all()
+    screened = screen_pairs(merged, ["e0", "e1"], [f"c{i}" for i in range(5)])
+    assert np.allclose(first["score"], screened["partial_score"].nlargest(2))
+
+    rest = list(steps)
+    assert len(calls) == len(mi_candidates(screened, 2)) <= MI_CANDIDATE_FACTOR * 2
+    assert len(calls) < len(screened)
+    # Antes dos testes o ranking já é o final; só as colunas de Granger são preenchidas depois
+    final = rest[-1].set_index(["x", "y"])["score"]
+    before_tests = [step for step in rest if step["granger_p"].isna().all()][-1]
+    assert before_tests.set_index(["x", "y"])["score"].round(12).equals(final.round(12))
+
+
+def test_stationarity_is_opt_in(merged):
+    default = extract_insights(merged, ["e0"], ["c0", "c1"], top_k=2, workers=1)
+    assert list(default.columns) == insight_columns()
+    assert not set(STATIONARITY_COLUMNS) & set(default.columns)
+
+    with_adf = extract_insights(merged, ["e0"], ["c0", "c1"], top_k=2, workers=1, stationarity=True)
+    assert list(with_adf.columns) == insight_columns(stationarity=True)
+    assert with_adf[STATIONARITY_COLUMNS].notna().all().all()
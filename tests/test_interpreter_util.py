@@ -0,0 +1,116 @@
+import asyncio
+import threading
+
+import pytest
+
+from interpreter_util import InterpretationService, stream_interpretations
+
+
+class FakeStreamingLLM:
+    """LLM local com astream: devolve o prompt invertido em trechos e mede a concorrência."""
+
+    def __init__(self, chunk_size=3, delay=0.01):
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+
+    async def astream(self, prompt):
+        self.calls.append(prompt)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            text = prompt[::-1]
+            for i in range(0, len(text), self.chunk_size):
+                await asyncio.sleep(self.delay)
+                yield text[i:i + self.chunk_size]
+        finally:
+            self.active -= 1
+
+
+class FakeInvokeLLM:
+    def __init__(self):
+        self.calls = []
+
+    def invoke(self, prompt):
+        self.calls.append(prompt)
+        return prompt.upper()
+
+
+def test_concurrency_is_limited_by_semaphore(tmp_path):
+    llm = FakeStreamingLLM()
+    service = InterpretationService(llm=llm, cache_dir=tmp_path, max_concurrency=2)
+    prompts = [f"prompt {i}" for i in range(6)]
+
+    texts = service.interpret_many(prompts)
+
+    assert texts == [p[::-1] for p in prompts]
+    assert sorted(llm.calls) == sorted(prompts)
+    assert llm.max_active == 2
+
+
+def test_disk_cache_miss_then_hit(tmp_path):
+    llm = FakeStreamingLLM()
+    first = InterpretationService(llm=llm, cache_dir=tmp_path)
+    tokens = []
+    assert first.interpret_many(["abcdef"], on_token=lambda i, c: tokens.append((i, c))) == ["fedcba"]
+    assert llm.calls == ["abcdef"]
+    assert tokens == [(0, "fed"), (0, "cba")]
+
+    # Novo serviço (outra sessão) com o mesmo diretório: sai do cache sem chamar a LLM
+    other = FakeStreamingLLM()
+    second = InterpretationService(llm=other, cache_dir=tmp_path)
+    tokens = []
+    assert second.interpret_many(["abcdef"], on_token=lambda i, c: tokens.append((i, c))) == ["fedcba"]
+    assert other.calls == []
+    assert tokens == [(0, "fedcba")]
+
+    # Outro modelo não reaproveita a resposta
+    third = InterpretationService(llm=other, model="outro", cache_dir=tmp_path)
+    third.interpret_many(["abcdef"])
+    assert other.calls == ["abcdef"]
+
+
+def test_invoke_only_client(tmp_path):
+    llm = FakeInvokeLLM()
+    service = InterpretationService(llm=llm, cache_dir=None)
+    assert service.interpret_many(["a", "b"]) == ["A", "B"]
+    assert service.interpret_many(["a"]) == ["A"]
+    assert llm.calls.count("a") == 2
+
+
+def test_stream_yields_chunks_before_generation_finishes(tmp_path):
+    release = threading.Event()
+
+    class GatedLLM:
+        async def astream(self, prompt):
+            yield "primeiro "
+            await asyncio.to_thread(release.wait, 5)
+            yield "segundo"
+
+    service = InterpretationService(llm=GatedLLM(), cache_dir=tmp_path)
+    chunks = service.stream("p")
+    assert next(chunks) == "primeiro "
+    release.set()
+    assert list(chunks) == ["segundo"]
+    assert service.cache.get(service.model, "p") == "primeiro segundo"
+
+
+def test_stream_interpretations_joins_prompts(tmp_path):
+    service = InterpretationService(llm=FakeStreamingLLM(chunk_size=2), cache_dir=tmp_path)
+    assert "".join(stream_interpretations(["abc", "xyz"], service)) == "cba\n\nzyx"
+
+
+def test_stream_propagates_llm_errors(tmp_path):
+    class FailingLLM:
+        async def astream(self, prompt):
+            yield "parcial"
+            raise RuntimeError("modelo indisponível")
+
+    service = InterpretationService(llm=FailingLLM(), cache_dir=tmp_path)
+    chunks = service.stream("p")
+    assert next(chunks) == "parcial"
+    with pytest.raises(RuntimeError, match="indisponível"):
+        next(chunks)
+    assert service.cache.get(service.model, "p") is None
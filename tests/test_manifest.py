@@ -0,0 +1,74 @@
+import hashlib
+import os
+
+import duckdb
+import pytest
+
+from manifest import (CHANGED, MANIFEST_TABLE, NEW, UNCHANGED, check_file, ensure_manifest, file_hash,
+                      record_file)
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    ensure_manifest(con)
+    # Idempotente: chamado a cada execução da ingestão
+    ensure_manifest(con)
+    yield con
+    con.close()
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "carga_energia_2024.parquet"
+    path.write_bytes(b"conteudo original")
+    return path
+
+
+def test_file_hash_matches_sha256(tmp_path):
+    path = tmp_path / "grande.bin"
+    payload = os.urandom(3 * 1024 + 7)
+    path.write_bytes(payload)
+    assert file_hash(path, chunk_size=1024) == hashlib.sha256(payload).hexdigest()
+
+
+def test_recorded_file_is_unchanged_without_hashing(con, data_file, monkeypatch):
+    status, fingerprint = check_file(con, data_file)
+    assert status == NEW and fingerprint["sha256"] is None
+    record_file(con, fingerprint)
+    sha256 = file_hash(data_file)
+    assert fingerprint["sha256"] == sha256
+
+    # Mesmo tamanho e mtime: só um stat, o conteúdo não é relido
+    monkeypatch.setattr("manifest.file_hash", lambda *a, **k: pytest.fail("hash recalculado"))
+    status, fingerprint = check_file(con, data_file)
+    assert status == UNCHANGED
+    assert fingerprint["sha256"] == sha256
+
+
+def test_touched_file_is_unchanged_and_manifest_is_updated(con, data_file):
+    _, fingerprint = check_file(con, data_file)
+    record_file(con, fingerprint)
+
+    st = data_file.stat()
+    os.utime(data_file, (st.st_atime, st.st_mtime + 60))
+    status, _ = check_file(con, data_file)
+    assert status == UNCHANGED
+    mtime = con.execute(f"SELECT mtime FROM {MANIFEST_TABLE}").fetchone()[0]
+    assert mtime == data_file.stat().st_mtime
+
+
+def test_modified_file_is_changed_until_recorded(con, data_file):
+    _, fingerprint = check_file(con, data_file)
+    record_file(con, fingerprint)
+
+    data_file.write_bytes(b"conteudo reprocessado pela ONS")
+    status, fingerprint = check_file(con, data_file)
+    assert status == CHANGED
+    assert fingerprint["sha256"] == file_hash(data_file)
+    # Sem record_file (ex.: carga falhou), continua pendente na próxima execução
+    assert check_file(con, data_file)[0] == CHANGED
+
+    record_file(con, fingerprint)
+    assert check_file(con, data_file)[0] == UNCHANGED
+    assert con.execute(f"SELECT count(*) FROM {MANIFEST_TABLE}").fetchone()[0] == 1
@@ -0,0 +1,31 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from meta_normalize import read_meta_csv, strip_strings, normalize_usinameta
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_strip_strings_handles_object_columns_with_nan():
+    df = pd.DataFrame({
+        "id_da_instalacao": pd.Series(["PBUCG ", np.nan, "  RSCAM"], dtype=object),
+        "nome": pd.Series(["  ", "USINA X  ", None], dtype=object),
+        "objectid": [1, 2, 3],
+    })
+    out = strip_strings(df)
+
+    assert out["id_da_instalacao"].tolist()[0] == "PBUCG"
+    assert out["id_da_instalacao"].tolist()[2] == "RSCAM"
+    assert out["id_da_instalacao"].isna().tolist() == [False, True, False]
+    assert out["nome"].isna().tolist() == [True, False, True]
+    assert out["nome"].iloc[1] == "USINA X"
+    assert out["objectid"].tolist() == [1, 2, 3]
+
+
+def test_usinameta_ids_have_no_padding():
+    df = normalize_usinameta(read_meta_csv(ROOT / "UsinaMeta.csv"))
+    ids = df["id_da_instalacao"].dropna()
+    assert not ids.empty
+    assert (ids == ids.str.strip()).all()
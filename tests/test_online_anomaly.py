@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from interpreter_util import prepare_aggregated_anomaly_summary_v3
+from online_anomaly import OnlineDetector
+
+
+def hourly_series(days=60, spike_at=None, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2024-01-01", periods=24 * days, freq="h")
+    values = 100 + 10 * np.sin(2 * np.pi * np.asarray(index.hour) / 24) + rng.normal(scale=2.0, size=len(index))
+    if spike_at is not None:
+        values[spike_at] += 60
+    return pd.DataFrame({"din_instante": index, "val_carga": values})
+
+
+def test_scale_matches_std_on_gaussian_noise():
+    detector = OnlineDetector()
+    detector.consume(hourly_series(days=120), "din_instante", ["val_carga"])
+    state = detector.series[("val_carga",)]
+    scales = np.array(state.dev) * np.sqrt(np.pi / 2)
+    # Ruído N(0, 2) em cada hora do dia: a escala robusta estima o desvio padrão
+    assert np.all((scales > 1.4) & (scales < 2.6))
+
+
+def test_spike_alerts_without_inflating_baseline():
+    spike_at = 24 * 50 + 5
+    detector = OnlineDetector()
+    records = detector.consume(hourly_series(spike_at=spike_at), "din_instante", ["val_carga"])
+    alerts = records[records["alert"]]
+    assert alerts["timestamp"].tolist() == [pd.Timestamp("2024-01-01") + pd.Timedelta(hours=spike_at)]
+    # Depois do pico, a hora 5 continua com escala da ordem do ruído
+    assert np.sqrt(np.pi / 2) * detector.series[("val_carga",)].dev[5] < 4.0
+
+
+def test_records_without_pair_feed_the_anomaly_summary():
+    df = hourly_series(spike_at=24 * 50 + 5)
+    records = OnlineDetector().consume(df, "din_instante", ["val_carga"])
+    assert records["y"].notna().all()
+    assert set(records["y"]) == {"val_carga"}
+
+    frame = df.set_index("din_instante")
+    summary = prepare_aggregated_anomaly_summary_v3(frame, frame, records, time_col="timestamp")
+    assert len(summary) == 1
+    assert len(summary.iloc[0]["anomalies"]) == 1
@@ -0,0 +1,165 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from ons_download import (download_file, meta_path_for, part_path_for, read_meta, write_meta, sync_datasets,
+                          DOWNLOADED, RESUMED, UNCHANGED)
+
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+class FakeONS:
+    """Arquivos servidos pelo servidor local: {caminho: (conteúdo, etag ou None)}."""
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+
+    def put(self, path, content, etag=None):
+        self.files[path] = (content, etag)
+
+
+def make_handler(ons):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def send_body(self, status, body, headers=()):
+            self.send_response(status)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            ons.requests.append((self.path, dict(self.headers)))
+            if self.path.startswith("/dataset/"):
+                links = "".join(f'<a class="resource-url-analytics" href="{p}">{p}</a>' for p in ons.files)
+                return self.send_body(200, f"<html><body>{links}</body></html>".encode())
+            if self.path not in ons.files:
+                return self.send_body(404, b"")
+            content, etag = ons.files[self.path]
+            validators = [("ETag", etag)] if etag else [("Last-Modified", LAST_MODIFIED)]
+            current = etag or LAST_MODIFIED
+
+            if etag and self.headers.get("If-None-Match") == etag:
+                return self.send_body(304, b"", validators)
+            if not etag and self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+                return self.send_body(304, b"", validators)
+            byte_range = self.headers.get("Range")
+            if byte_range and self.headers.get("If-Range") == current:
+                start = int(byte_range.removeprefix("bytes=").rstrip("-"))
+                if start >= len(content):
+                    return self.send_body(416, b"")
+                headers = [*validators, ("Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}")]
+                return self.send_body(206, content[start:], headers)
+            return self.send_body(200, content, validators)
+
+    return Handler
+
+
+@pytest.fixture
+def server():
+    ons = FakeONS()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(ons))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    ons.base_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield ons
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def last_headers(ons):
+    return ons.requests[-1][1]
+
+
+def test_conditional_request_with_etag(server, tmp_path):
+    server.put("/CURVA_CARGA_2024.parquet", b"v1" * 1000, etag='"v1"')
+    url = f"{server.base_url}/CURVA_CARGA_2024.parquet"
+    dest = tmp_path / "CURVA_CARGA_2024.parquet"
+    session = requests.Session()
+
+    assert download_file(session, url, dest) == DOWNLOADED
+    assert dest.read_bytes() == b"v1" * 1000
+    assert read_meta(dest)["etag"] == '"v1"'
+    assert not part_path_for(dest).exists()
+
+    assert download_file(session, url, dest) == UNCHANGED
+    assert last_headers(server)["If-None-Match"] == '"v1"'
+    assert dest.read_bytes() == b"v1" * 1000
+
+    server.put("/CURVA_CARGA_2024.parquet", b"v2" * 500, etag='"v2"')
+    assert download_file(session, url, dest) == DOWNLOADED
+    assert dest.read_bytes() == b"v2" * 500
+    assert read_meta(dest)["etag"] == '"v2"'
+
+
+def test_conditional_request_with_last_modified(server, tmp_path):
+    server.put("/CARGA_ENERGIA_2024.parquet", b"abc" * 100)
+    url = f"{server.base_url}/CARGA_ENERGIA_2024.parquet"
+    dest = tmp_path / "CARGA_ENERGIA_2024.parquet"
+    session = requests.Session()
+
+    assert download_file(session, url, dest) == DOWNLOADED
+    assert download_file(session, url, dest) == UNCHANGED
+    headers = last_headers(server)
+    assert headers["If-Modified-Since"] == LAST_MODIFIED
+    assert "If-None-Match" not in headers
+
+
+def interrupted_download(dest, url, content, etag):
+    """Estado deixado por um download interrompido: .part com o começo e meta parcial."""
+    part_path_for(dest).write_bytes(content[:len(content) // 3])
+    write_meta(dest, {"url": url, "etag": etag, "last_modified": None, "partial": True, "complete": False})
+
+
+def test_resume_with_range(server, tmp_path):
+    content = bytes(range(256)) * 40
+    server.put("/GERACAO_USINA-2_2024_01.parquet", content, etag='"g1"')
+    url = f"{server.base_url}/GERACAO_USINA-2_2024_01.parquet"
+    dest = tmp_path / "GERACAO_USINA-2_2024_01.parquet"
+    interrupted_download(dest, url, content, '"g1"')
+
+    assert download_file(requests.Session(), url, dest, chunk_size=1000) == RESUMED
+    headers = last_headers(server)
+    assert headers["Range"] == f"bytes={len(content) // 3}-"
+    assert headers["If-Range"] == '"g1"'
+    assert dest.read_bytes() == content
+    meta = read_meta(dest)
+    assert meta["complete"] and not meta["partial"]
+    assert meta["size"] == len(content)
+
+
+def test_resume_restarts_when_file_changed(server, tmp_path):
+    old = b"old" * 1000
+    new = b"new!" * 900
+    server.put("/GERACAO_USINA-2_2024_02.parquet", new, etag='"g2"')
+    url = f"{server.base_url}/GERACAO_USINA-2_2024_02.parquet"
+    dest = tmp_path / "GERACAO_USINA-2_2024_02.parquet"
+    interrupted_download(dest, url, old, '"g1"')
+
+    # If-Range não confere: o servidor manda o arquivo inteiro e o .part é descartado
+    assert download_file(requests.Session(), url, dest) == DOWNLOADED
+    assert dest.read_bytes() == new
+    assert read_meta(dest)["etag"] == '"g2"'
+
+
+def test_sync_datasets_from_local_server(server, tmp_path):
+    server.put("/files/CURVA_CARGA_2023.parquet", b"a" * 10, etag='"a"')
+    server.put("/files/CURVA_CARGA_2024.parquet", b"b" * 10, etag='"b"')
+    server.put("/files/CURVA_CARGA_2024.csv", b"c", etag='"c"')
+
+    results = sync_datasets(["curva-carga"], years=[2024], dest_dir=tmp_path, base_url=server.base_url,
+                            workers=2, ingest=False)
+    assert [(dest.name, status) for _, dest, status in results] == [("CURVA_CARGA_2024.parquet", DOWNLOADED)]
+
+    results = sync_datasets(["curva-carga"], dest_dir=tmp_path, base_url=server.base_url, workers=2, ingest=False)
+    assert sorted((dest.name, status) for _, dest, status in results) == [
+        ("CURVA_CARGA_2023.parquet", DOWNLOADED),
+        ("CURVA_CARGA_2024.parquet", UNCHANGED),
+    ]
+    assert meta_path_for(tmp_path / "CURVA_CARGA_2023.parquet").exists()
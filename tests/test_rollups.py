@@ -0,0 +1,94 @@
+import duckdb
+import pytest
+
+import feed_ons
+from feed_ons import create_dataset_views, ingest_parquet_files, refresh_energy_rollups
+from manifest import ensure_manifest
+from util import AGG_FREQS, build_table_query, rollup_table_name, table_columns
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    # Partições anuais que caem na mesma semana (segunda 2024-12-30 a domingo 2025-01-05)
+    for year, start in ((2024, "2024-12-30"), (2025, "2025-01-01")):
+        con.execute(
+            f"CREATE TABLE curva_carga_{year} AS SELECT "
+            f"TIMESTAMP '{start}' + INTERVAL (i) HOUR AS din_instante, "
+            "CASE WHEN i % 2 = 0 THEN 'N' ELSE 'S' END AS id_subsistema, "
+            "CAST(i AS FLOAT) AS val_cargaenergiahomwmed "
+            "FROM range(48) t(i)"
+        )
+    yield con
+    con.close()
+
+
+def test_dataset_view_rollups_have_no_partition_columns(con):
+    tables = ["curva_carga_2024", "curva_carga_2025"]
+    refresh_energy_rollups(con, tables, changed=tables)
+
+    assert "ano" in table_columns(con, "curva_carga")
+    for table_name in [*tables, "curva_carga"]:
+        for freq in AGG_FREQS:
+            rollup = table_columns(con, rollup_table_name(table_name, freq))
+            assert not [c for c in rollup if c == "ano" or c.startswith("ano__")]
+
+
+def test_weekly_rollup_does_not_split_on_year_boundary(con):
+    refresh_energy_rollups(con, ["curva_carga_2024", "curva_carga_2025"], changed=["curva_carga_2024"])
+    rows = con.execute(
+        "SELECT id_subsistema, val_cargaenergiahomwmed__count FROM curva_carga__week ORDER BY 1"
+    ).fetchall()
+    assert rows == [("N", 48), ("S", 48)]
+
+
+def test_default_aggregated_columns_skip_partition_columns(con):
+    refresh_energy_rollups(con, ["curva_carga_2024", "curva_carga_2025"], changed=["curva_carga_2025"])
+    sql, _ = build_table_query(con, "curva_carga", freq="day")
+    df = con.execute(sql).fetchdf()
+    assert "ano" not in df.columns
+    assert "val_cargaenergiahomwmed" in df.columns
+
+
+def test_only_views_with_changed_partitions_are_recreated(con, capsys):
+    con.execute("CREATE TABLE geracao_usina_2024 AS SELECT 1.0 AS val_geracao")
+    create_dataset_views(con)
+    capsys.readouterr()
+
+    views = create_dataset_views(con, changed=["curva_carga_2025"])
+    out = capsys.readouterr().out
+    assert set(views) == {"curva_carga", "geracao_usina"}
+    assert "View 'curva_carga'" in out
+    assert "geracao_usina" not in out
+
+
+def test_unchanged_ingest_does_not_touch_database(tmp_path, monkeypatch):
+    db_path = tmp_path / "ons.duckdb"
+    monkeypatch.setattr(feed_ons, "DB_PATH", db_path)
+    src = duckdb.connect()
+    parquet_files = []
+    for year in (2024, 2025):
+        path = tmp_path / f"curva_carga_{year}.parquet"
+        src.execute(
+            f"COPY (SELECT TIMESTAMP '{year}-01-01' + INTERVAL (i) HOUR AS din_instante, "
+            "'N' AS id_subsistema, CAST(i AS DOUBLE) AS val_cargaenergiahomwmed "
+            f"FROM range(24) t(i)) TO '{path}' (FORMAT PARQUET)"
+        )
+        parquet_files.append(path)
+    src.close()
+
+    def ingest():
+        con = duckdb.connect(str(db_path))
+        ensure_manifest(con)
+        try:
+            return ingest_parquet_files(con, parquet_files)
+        finally:
+            con.close()
+
+    _, changed = ingest()
+    assert changed == ["curva_carga_2024", "curva_carga_2025"]
+    mtime = db_path.stat().st_mtime_ns
+
+    tables, changed = ingest()
+    assert tables == ["curva_carga_2024", "curva_carga_2025"] and changed == []
+    assert db_path.stat().st_mtime_ns == mtime
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import spatial_index
+from spatial_index import EARTH_RADIUS_KM, StationIndex, index_path_for, load_or_build_index
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+@pytest.fixture
+def estacoes():
+    rng = np.random.default_rng(0)
+    n = 40
+    df = pd.DataFrame({
+        "id_estacao": [f"A{i:03d}" for i in range(n)],
+        "latitude": rng.uniform(-30, -5, n),
+        "longitude": rng.uniform(-60, -35, n),
+    })
+    df.loc[3, "latitude"] = np.nan
+    return df
+
+
+@pytest.fixture
+def usinas():
+    return pd.DataFrame({
+        "id_da_usina": ["U1", "U2", "U3"],
+        "latitude": [-23.5, -15.8, np.nan],
+        "longitude": [-46.6, -47.9, -40.0],
+    })
+
+
+def brute_force(estacoes, usina):
+    valid = estacoes.dropna(subset=["latitude", "longitude"])
+    dist = haversine_km(usina["latitude"], usina["longitude"], valid["latitude"], valid["longitude"])
+    return valid.assign(distancia_km=dist).sort_values("distancia_km")
+
+
+def test_nearest_matches_brute_force(estacoes, usinas):
+    out = StationIndex(estacoes).nearest(usinas, k=3)
+
+    # Usina sem coordenada fica de fora; estação sem coordenada nunca aparece
+    assert out["id_da_usina"].tolist() == ["U1"] * 3 + ["U2"] * 3
+    assert "A003" not in set(out["id_estacao"])
+    for _, usina in usinas.dropna().iterrows():
+        expected = brute_force(estacoes, usina).head(3)
+        got = out[out["id_da_usina"] == usina["id_da_usina"]]
+        assert got["id_estacao"].tolist() == expected["id_estacao"].tolist()
+        np.testing.assert_allclose(got["distancia_km"], expected["distancia_km"], rtol=1e-9)
+        assert got["rank"].tolist() == [1, 2, 3]
+
+
+def test_nearest_caps_k_at_station_count(estacoes, usinas):
+    out = StationIndex(estacoes.head(2)).nearest(usinas, k=5)
+    assert len(out) == 2 * 2
+
+
+def test_within_matches_brute_force(estacoes, usinas):
+    out = StationIndex(estacoes).within(usinas, radius_km=600)
+    for _, usina in usinas.dropna().iterrows():
+        expected = brute_force(estacoes, usina)
+        expected = expected[expected["distancia_km"] <= 600]
+        got = out[out["id_da_usina"] == usina["id_da_usina"]]
+        assert got["id_estacao"].tolist() == expected["id_estacao"].tolist()
+
+
+def test_index_path_lives_next_to_database(tmp_path):
+    assert index_path_for(tmp_path / "climate.duckdb") == tmp_path / "climate.estacoes_index.pkl"
+
+
+def test_saved_index_is_reused_until_stations_change(tmp_path, estacoes, monkeypatch):
+    path = index_path_for(tmp_path / "climate.duckdb")
+    built = []
+    init = StationIndex.__init__
+
+    def counting_init(self, *args, **kwargs):
+        built.append(self)
+        init(self, *args, **kwargs)
+
+    monkeypatch.setattr(spatial_index.StationIndex, "__init__", counting_init)
+
+    first = load_or_build_index(estacoes, path)
+    assert path.exists() and len(built) == 1
+
+    again = load_or_build_index(estacoes, path)
+    assert len(built) == 1
+    assert again.fingerprint == first.fingerprint
+
+    moved = estacoes.copy()
+    moved.loc[0, "latitude"] += 0.5
+    rebuilt = load_or_build_index(moved, path)
+    assert len(built) == 2
+    assert rebuilt.fingerprint != first.fingerprint
+
+
+def test_corrupt_index_file_is_rebuilt(tmp_path, estacoes):
+    path = index_path_for(tmp_path / "climate.duckdb")
+    path.write_bytes(b"not a pickle")
+    index = load_or_build_index(estacoes, path)
+    assert StationIndex.load(path).fingerprint == index.fingerprint
@@ -0,0 +1,64 @@
+import duckdb
+import numpy as np
+import pandas as pd
+
+from feed_db3 import CLIMA_SCHEMA, META_SCHEMA, ensure_tables, insert_typed, refresh_station_subsystems
+from rollups import build_rollups, regroup_rollups
+from subsystems import (CLIMATE_SUBSYSTEM_VIEW, STATION_SUBSYSTEM_TABLE, SUBSISTEMAS, UF_SUBSISTEMA,
+                        map_stations_to_subsystems)
+
+UFS = ["AC", "AL", "AP", "AM", "BA", "CE", "DF", "ES", "GO", "MA", "MT", "MS", "MG", "PA",
+       "PB", "PR", "PE", "PI", "RJ", "RN", "RS", "RO", "RR", "SC", "SP", "SE", "TO"]
+
+
+def test_every_uf_maps_to_a_known_subsystem():
+    assert sorted(UF_SUBSISTEMA) == sorted(UFS)
+    assert set(UF_SUBSISTEMA.values()) == set(SUBSISTEMAS)
+
+
+def test_map_stations_normalizes_uf_and_drops_unknown():
+    estacoes = pd.DataFrame({
+        "arquivo": ["A.CSV", "B.CSV", "C.CSV", "D.CSV", "A.CSV"],
+        "uf": [" sp", "SE", "XX", None, "SP"],
+    })
+    out = map_stations_to_subsystems(estacoes)
+    assert out.to_dict("records") == [
+        {"arquivo": "A.CSV", "uf": "SP", "id_subsistema": "SE", "nom_subsistema": "Sudeste/Centro-Oeste"},
+        # Sergipe (UF "SE") é do subsistema Nordeste, não Sudeste
+        {"arquivo": "B.CSV", "uf": "SE", "id_subsistema": "NE", "nom_subsistema": "Nordeste"},
+    ]
+
+
+def test_climate_subsystem_rollups_match_raw_rows():
+    con = duckdb.connect()
+    ensure_tables(con)
+    index = pd.date_range("2024-01-01", periods=48, freq="h", tz="UTC")
+    rng = np.random.default_rng(0)
+    clima = pd.concat([
+        pd.DataFrame({"data_hora": index, "vento": rng.normal(5, 1, len(index)), "arquivo": arquivo})
+        for arquivo in ("SP.CSV", "RJ.CSV", "RS.CSV", "XX.CSV")
+    ], ignore_index=True)
+    clima.loc[clima["arquivo"] == "RJ.CSV", "vento"] = clima["vento"].where(clima["data_hora"].dt.hour != 3)
+    insert_typed(con, "clima", CLIMA_SCHEMA, clima)
+    meta = pd.DataFrame({"uf": ["SP", "RJ", "RS", "XX"], "arquivo": ["SP.CSV", "RJ.CSV", "RS.CSV", "XX.CSV"]})
+    insert_typed(con, "metadados_estacoes", META_SCHEMA, meta)
+
+    refresh_station_subsystems(con)
+    assert con.execute(f"SELECT count(*) FROM {STATION_SUBSYSTEM_TABLE}").fetchone()[0] == 3
+    assert con.execute(
+        f"SELECT DISTINCT id_subsistema FROM {CLIMATE_SUBSYSTEM_VIEW} ORDER BY 1").fetchall() == [("S",), ("SE",)]
+
+    build_rollups(con, "clima", keys=["arquivo"], freqs=("day",))
+    regroup_rollups(con, "clima", CLIMATE_SUBSYSTEM_VIEW, STATION_SUBSYSTEM_TABLE,
+                    on="arquivo", keys=["id_subsistema", "nom_subsistema"], freqs=("day",))
+
+    # Média ponderada pela contagem dos rollups por estação == média das linhas brutas
+    expected = con.execute(
+        f"SELECT id_subsistema, date_trunc('day', data_hora) AS d, avg(vento), count(vento) "
+        f"FROM {CLIMATE_SUBSYSTEM_VIEW} GROUP BY 1, 2 ORDER BY 1, 2").fetchall()
+    got = con.execute(
+        f"SELECT id_subsistema, data_hora, vento, vento__count "
+        f"FROM {CLIMATE_SUBSYSTEM_VIEW}__day ORDER BY 1, 2").fetchall()
+    assert [(s, n) for s, _, _, n in got] == [(s, n) for s, _, _, n in expected]
+    np.testing.assert_allclose([v for _, _, v, _ in got], [v for _, _, v, _ in expected], rtol=1e-6)
+    con.close()
@@ -1,13 +1,188 @@
 import duckdb
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from sklearn.preprocessing import MinMaxScaler
 import numpy as np
 
-def load_table_duckdb(db_path, table_name):
-    con = duckdb.connect(database=db_path, read_only=True)
-    df = con.execute(f"SELECT * FROM {table_name}").fetchdf()
-    con.close()
-    return df
+from compact_schema import compact_frame
+
+def connect_duckdb(db_path):
+    """Abre o banco DuckDB em modo somente leitura, com timestamps em UTC."""
+    con = duckdb.connect(database=str(db_path), read_only=True)
+    # Timestamps com fuso (data_hora do clima) chegam ao pandas em UTC
+    con.execute("SET GLOBAL TimeZone = 'UTC'")
+    return con
+
+SUBSYSTEM_COLS = ("nom_subsistema", "id_subsistema")
+AGG_FREQS = ("hour", "day", "week", "month")
+NUMERIC_TYPES = ("DOUBLE", "FLOAT", "REAL", "DECIMAL", "INTEGER", "BIGINT", "SMALLINT", "TINYINT", "HUGEINT")
+# Colunas de partição das views por dataset (feed_ons.create_dataset_views): numéricas, mas não medições
+PARTITION_COLUMNS = ("ano",)
+
+# Rollups pré-calculados na ingestão (rollups.py): <tabela>__<freq>, com c, c__min, c__max, c__count
+ROLLUP_SEPARATOR = "__"
+
+def quote_ident(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+def table_columns(con, table_name):
+    """{coluna: tipo} da tabela ou view. Levanta ValueError se ela não existir."""
+    rows = con.execute(
+        "SELECT column_name, data_type FROM information_schema.columns "
+        "WHERE table_name = ? ORDER BY ordinal_position",
+        [table_name],
+    ).fetchall()
+    if not rows:
+        raise ValueError(f"Tabela '{table_name}' não encontrada")
+    return dict(rows)
+
+def time_column(schema):
+    """Primeira coluna de data/hora de um schema {coluna: tipo} (ou None)."""
+    return next((c for c, t in schema.items() if t.startswith(("TIMESTAMP", "DATE"))), None)
+
+def measure_columns(schema):
+    """Colunas numéricas de um schema {coluna: tipo} que são medições (sem as de partição)."""
+    return [c for c, t in schema.items() if t.startswith(NUMERIC_TYPES) and c not in PARTITION_COLUMNS]
+
+def rollup_table_name(table_name, freq):
+    return f"{table_name}{ROLLUP_SEPARATOR}{freq}"
+
+def stat_column(col, stat):
+    return f"{col}{ROLLUP_SEPARATOR}{stat}"
+
+def rollup_columns(con, table_name, freq):
+    """Schema do rollup de `table_name` na frequência `freq`, ou None se ele não existir."""
+    try:
+        return table_columns(con, rollup_table_name(table_name, freq))
+    except ValueError:
+        return None
+
+def build_table_query(con, table_name, columns=None, time_col=None, start=None, end=None,
+                      subsystem=None, freq=None, stats=False, by=None):
+    """Monta o SELECT parametrizado de load_table_duckdb. Retorna (sql, params).
+
+    Nomes de tabela/colunas são validados contra o information_schema antes de
+    entrar no SQL; valores (datas, subsistema, frequência) vão como parâmetros.
+    """
+    schema = table_columns(con, table_name)
+
+    if time_col is None and (start is not None or end is not None or freq is not None):
+        time_col = time_column(schema)
+        if time_col is None:
+            raise ValueError(f"Tabela '{table_name}' não tem coluna de tempo para filtrar/agregar")
+
+    if columns is None:
+        if freq is None:
+            columns = list(schema)
+        else:
+            # Agregando sem colunas explícitas: média de todas as colunas numéricas
+            columns = measure_columns(schema)
+    if by:
+        columns = [*columns, *(c for c in by if c not in columns)]
+    columns = [c for c in columns if c != time_col]
+    missing = [c for c in [*columns, time_col] if c is not None and c not in schema]
+    if missing:
+        raise ValueError(f"Colunas inexistentes em '{table_name}': {missing}")
+
+    if freq is not None and freq not in AGG_FREQS:
+        raise ValueError(f"Frequência inválida: {freq}. Use uma de {AGG_FREQS}")
+
+    subsystem_cols = [c for c in SUBSYSTEM_COLS if c in schema]
+    if subsystem is not None and not subsystem_cols:
+        raise ValueError(f"Tabela '{table_name}' não tem coluna de subsistema")
+
+    # Colunas numéricas são agregadas; as demais viram chaves do GROUP BY
+    values = [c for c in columns if schema[c].startswith(NUMERIC_TYPES)]
+    keys = [c for c in columns if c not in values]
+
+    # Com rollup pré-calculado na frequência pedida, lê dele em vez das linhas brutas
+    source = table_name
+    if freq is not None:
+        rollup = rollup_columns(con, table_name, freq)
+        needed = [time_col, *keys, *(subsystem_cols if subsystem is not None else []),
+                  *values, *(stat_column(c, "count") for c in values)]
+        # Subsistema só filtra o rollup se for chave (texto), não uma média
+        filter_ok = subsystem is None or not any(schema[c].startswith(NUMERIC_TYPES) for c in subsystem_cols)
+        if (rollup is not None and filter_ok and time_column(schema) == time_col
+                and all(c in rollup for c in needed)):
+            source = rollup_table_name(table_name, freq)
+
+    where, params = [], []
+    if start is not None:
+        where.append(f"{quote_ident(time_col)} >= ?")
+        params.append(start)
+    if end is not None:
+        where.append(f"{quote_ident(time_col)} < ?")
+        params.append(end)
+    if subsystem is not None:
+        where.append("(" + " OR ".join(f"{quote_ident(c)} = ?" for c in subsystem_cols) + ")")
+        params.extend([subsystem] * len(subsystem_cols))
+    where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+
+    if freq is None:
+        select = [*([time_col] if time_col else []), *columns]
+        sql = f"SELECT {', '.join(quote_ident(c) for c in select)} FROM {quote_ident(table_name)}{where_sql}"
+        return sql, params
+
+    select = [quote_ident(c) for c in keys]
+    if source == table_name:
+        select.insert(0, f"date_trunc('{freq}', {quote_ident(time_col)}) AS {quote_ident(time_col)}")
+        for c in values:
+            select.append(f"avg({quote_ident(c)}) AS {quote_ident(c)}")
+            if stats:
+                select += [f"{stat}({quote_ident(c)}) AS {quote_ident(stat_column(c, stat))}"
+                           for stat in ("min", "max", "count")]
+    else:
+        # Reagrega o rollup (ex.: todas as estações): média ponderada pela contagem
+        # reproduz a média das linhas brutas. A janela start/end vale sobre o início do bucket.
+        select.insert(0, quote_ident(time_col))
+        for c in values:
+            count = quote_ident(stat_column(c, "count"))
+            select.append(f"sum({quote_ident(c)} * {count}) / nullif(sum({count}), 0) AS {quote_ident(c)}")
+            if stats:
+                select += [f"{agg}({quote_ident(stat_column(c, stat))}) AS {quote_ident(stat_column(c, stat))}"
+                           for agg, stat in (("min", "min"), ("max", "max"), ("sum", "count"))]
+    group_by = ", ".join(str(i) for i in range(1, len(keys) + 2))
+    sql = (f"SELECT {', '.join(select)} FROM {quote_ident(source)}{where_sql} "
+           f"GROUP BY {group_by} ORDER BY {group_by}")
+    return sql, params
+
+def load_table_duckdb(db_path, table_name, con=None, columns=None, time_col=None, start=None, end=None,
+                      subsystem=None, freq=None, stats=False, by=None, compact=True):
+    """Lê uma tabela empurrando seleção de colunas, filtros e agregação para o DuckDB.
+
+    columns: lista de colunas (padrão: todas; com `freq`, todas as medições numéricas).
+    start/end: janela [start, end) sobre `time_col` (padrão: primeira coluna de data/hora).
+    subsystem: valor comparado com nom_subsistema/id_subsistema.
+    freq: "hour", "day", "week" ou "month" para média via date_trunc no banco; usa o
+        rollup pré-calculado (<tabela>__<freq>) quando ele existe.
+    stats: com `freq`, inclui também c__min, c__max e c__count de cada coluna numérica.
+    by: colunas-chave acrescentadas a `columns` (ex.: ["id_subsistema"] para uma série por subsistema).
+    compact: aplica o schema compacto (float32, chaves category, datetime64; ver compact_schema).
+    Se `con` for passado, usa um cursor dele em vez de abrir o banco.
+    """
+    own = con is None
+    con = connect_duckdb(db_path) if own else con.cursor()
+    try:
+        sql, params = build_table_query(con, table_name, columns, time_col, start, end, subsystem, freq, stats, by)
+        df = con.execute(sql, params).fetchdf()
+        return compact_frame(df) if compact else df
+    finally:
+        con.close()
+
+def load_distinct_duckdb(db_path, table_name, columns, con=None):
+    """Combinações distintas de `columns` (ex.: subsistema x usina), calculadas no banco."""
+    own = con is None
+    con = connect_duckdb(db_path) if own else con.cursor()
+    try:
+        schema = table_columns(con, table_name)
+        missing = [c for c in columns if c not in schema]
+        if missing:
+            raise ValueError(f"Colunas inexistentes em '{table_name}': {missing}")
+        cols = ", ".join(quote_ident(c) for c in columns)
+        return con.execute(f"SELECT DISTINCT {cols} FROM {quote_ident(table_name)}").fetchdf()
+    finally:
+        con.close()
 
 def normalize_usina_meta(df):
     df = df.copy()
@@ -23,9 +198,8 @@ def normalize_estacoes_meta(df):
     if 'arquivo' not in df.columns:
         raise ValueError("Não foi possível encontrar coluna 'arquivo' para ID da estação")
     df['id_estacao'] = df['arquivo']
-    lat_col, lon_col = df.columns[0], df.columns[1]
-    df['latitude'] = pd.to_numeric(df[lat_col], errors='coerce')
-    df['longitude'] = pd.to_numeric(df[lon_col], errors='coerce')
+    df['latitude'] = pd.to_numeric(df['latitude'], errors='coerce')
+    df['longitude'] = pd.to_numeric(df['longitude'], errors='coerce')
     return df[['id_estacao', 'latitude', 'longitude']]
 
 def compute_distance_matrix(usinas, estacoes):
@@ -34,17 +208,43 @@ def compute_distance_matrix(usinas, estacoes):
     dist_matrix = np.sqrt(((u_coords[:, None, :] - e_coords[None, :, :])**2).sum(axis=2)) * 111
     return pd.DataFrame(dist_matrix, index=usinas['id_da_usina'], columns=estacoes['id_estacao'])
 
-def compute_scores(df_energy, df_climate, time_col_energy="din_instante", time_col_climate="data_hora"):
-    df_energy = df_energy.copy()
-    df_climate = df_climate.copy()
-    df_energy[time_col_energy] = pd.to_datetime(df_energy[time_col_energy])
-    df_climate[time_col_climate] = pd.to_datetime(df_climate[time_col_climate])
-    
-    df_energy_daily = df_energy.groupby(df_energy[time_col_energy].dt.date).mean(numeric_only=True)
-    df_climate_daily = df_climate.groupby(df_climate[time_col_climate].dt.date).mean(numeric_only=True)
-    
-    df_energy_daily.index = pd.to_datetime(df_energy_daily.index)
-    df_climate_daily.index = pd.to_datetime(df_climate_daily.index)
+def ensure_datetime(series):
+    """Converte para datetime apenas se a coluna ainda não estiver tipada."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    return pd.to_datetime(series)
+
+def truncate_time(series, freq="day"):
+    """Início do bucket de cada instante, como o date_trunc do DuckDB (semana começa na segunda).
+
+    Instantes com fuso são levados para UTC sem fuso, para casar energia (local) e clima (UTC)
+    no mesmo índice, como fazia o agrupamento por .dt.date.
+    """
+    series = ensure_datetime(series)
+    if series.dt.tz is not None:
+        series = series.dt.tz_convert("UTC").dt.tz_localize(None)
+    if freq == "hour":
+        return series.dt.floor("h")
+    if freq == "day":
+        return series.dt.floor("D")
+    if freq == "week":
+        return series.dt.to_period("W-SUN").dt.start_time
+    if freq == "month":
+        return series.dt.to_period("M").dt.start_time
+    raise ValueError(f"Frequência inválida: {freq}. Use uma de {AGG_FREQS}")
+
+def compute_scores(df_energy, df_climate, time_col_energy="din_instante", time_col_climate="data_hora",
+                   freq="day"):
+    """Pearson energia x clima na granularidade `freq`.
+
+    Com entradas já agregadas nessa frequência (load_table_duckdb(freq=...), que lê os
+    rollups da ingestão) o agrupamento aqui só junta as séries de cada bucket.
+    """
+    df_energy = df_energy.drop(columns=list(PARTITION_COLUMNS), errors="ignore")
+    df_climate = df_climate.drop(columns=list(PARTITION_COLUMNS), errors="ignore")
+
+    df_energy_daily = df_energy.groupby(truncate_time(df_energy[time_col_energy], freq)).mean(numeric_only=True)
+    df_climate_daily = df_climate.groupby(truncate_time(df_climate[time_col_climate], freq)).mean(numeric_only=True)
     
     df_merged = df_energy_daily.join(df_climate_daily, how="inner", lsuffix="_energy", rsuffix="_climate")
     
@@ -58,6 +258,28 @@ def compute_scores(df_energy, df_climate, time_col_energy="din_instante", time_c
     
     return pearson_matrix, energy_cols, climate_cols, df_merged
 
+def compute_scores_by_subsystem(df_energy, df_climate, time_col_energy="din_instante",
+                                time_col_climate="data_hora", freq="day", subsystem_col="id_subsistema",
+                                workers=None):
+    """compute_scores separado por subsistema: a energia de cada subsistema só é
+    correlacionada com o clima das estações dele (clima_subsistema).
+
+    Os subsistemas rodam em paralelo (threads; o trabalho pesado é numpy/pandas).
+    Retorna {subsistema: (pearson_matrix, energy_cols, climate_cols, df_merged)}.
+    """
+    subsystems = sorted(set(df_energy[subsystem_col].dropna()) & set(df_climate[subsystem_col].dropna()))
+    energy_groups = dict(list(df_energy.groupby(subsystem_col, observed=True)))
+    climate_groups = dict(list(df_climate.groupby(subsystem_col, observed=True)))
+
+    def score(subsystem):
+        return compute_scores(energy_groups[subsystem], climate_groups[subsystem],
+                              time_col_energy=time_col_energy, time_col_climate=time_col_climate, freq=freq)
+
+    if not subsystems:
+        return {}
+    with ThreadPoolExecutor(max_workers=workers or len(subsystems)) as executor:
+        return dict(zip(subsystems, executor.map(score, subsystems)))
+
 def normalize_series(series):
     scaler = MinMaxScaler()
     values = series.values.reshape(-1, 1)